@@ -0,0 +1,1015 @@
+import os
+import sys
+import sqlite3
+import json
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+import numpy as np
+import pandas as pd
+from existencias import movimientos_netos, aplicar_stock, vista_stock
+from instrumentacion import contar, etapa
+from cerrojos import cerrojo, escribir_csv_atomico, reemplazar
+from pedidos_despachados import clave_pedido, indice_pedidos
+import bodegas
+import esquemas
+import historico
+
+# ================================================
+# ESQUEMAS DE LOS ARCHIVOS DE DATOS
+# ================================================
+
+COLUMNAS_PRODUCTOS = ['Producto', 'Unidad de Medida', 'Tipo de Producto', 'Stock Inicial', 'Stock Minimo']
+COLUMNAS_ENTRADAS = ['Producto', 'Cantidad', 'Fecha', 'Motivo']
+COLUMNAS_DESPACHOS = ['Fecha', 'Cliente', 'Número de Pedido', 'Producto', 'Cantidad']
+COLUMNAS_PEDIDOS = ['Cliente', 'Número de Pedido', 'Fecha del Pedido', 'Producto', 'Cantidad']
+COLUMNAS_DIARIO = ['Tipo', 'Fecha', 'Producto', 'Cantidad', 'Cliente', 'Número de Pedido', 'Motivo']
+
+# Tamaño del diario a partir del cual se consolida en los archivos base
+LIMITE_COMPACTACION = 256 * 1024
+
+ARCHIVOS_DATOS = ['productos.csv', 'entradas.csv', 'despachos.csv', 'diario.csv']
+
+# Backend de almacenamiento: 'csv' (por defecto) o 'sqlite'
+ALMACEN = os.environ.get('BODEGA_ALMACEN', 'csv').lower()
+ARCHIVO_SQLITE = 'bodega.db'
+
+# ================================================
+# RUTAS COMPATIBLES CON PYINSTALLER
+# ================================================
+
+def get_file_path(filename):
+    # Directorio de la bodega activa (bodegas.py)
+    base_path = bodegas.directorio(bodegas.activa())
+
+    # Crear directorio si no existe
+    if not os.path.exists(base_path):
+        os.makedirs(base_path)
+
+    return os.path.join(base_path, filename)
+
+def inicializar_archivos():
+    for nombre, columnas in [
+        ('productos.csv', COLUMNAS_PRODUCTOS),
+        ('entradas.csv', COLUMNAS_ENTRADAS),
+        ('despachos.csv', COLUMNAS_DESPACHOS),
+    ]:
+        if not os.path.exists(get_file_path(nombre)):
+            pd.DataFrame(columns=columnas).to_csv(get_file_path(nombre), index=False)
+
+def normalizar_pedido(numeros):
+    return numeros.astype(str).str.strip()
+
+class ConflictoVersion(Exception):
+    """Los datos cambiaron desde que la sesión los cargó."""
+
+class SoloLectura(Exception):
+    """Se intentó escribir en la vista consolidada de todas las bodegas."""
+
+def bloquear(recurso):
+    """Cerrojo de escritura de un recurso ('productos', 'movimientos', 'pedidos')."""
+    return cerrojo(get_file_path(f'.{recurso}.lock'))
+
+@contextmanager
+def bloquear_catalogo():
+    """Cerrojos para leer y reescribir el catálogo: movimientos antes que productos.
+
+    Es el orden de todo el módulo (archivar y la recuperación de leer() los
+    toman igual); tomar solo productos y luego leer podría esperar a
+    movimientos mientras un archivado espera a productos.
+    """
+    with bloquear('movimientos'), bloquear('productos'):
+        yield
+
+def _firma_archivo(path):
+    try:
+        info = os.stat(path)
+        return (info.st_ino, info.st_mtime_ns, info.st_size)
+    except FileNotFoundError:
+        return None
+
+def _escribir_json_atomico(path, datos):
+    temporal = f'{path}.{os.getpid()}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(datos, f)
+        f.flush()
+        os.fsync(f.fileno())
+    reemplazar(temporal, path)
+
+# ================================================
+# DIARIO DE MOVIMIENTOS (SOLO ANEXADO)
+# ================================================
+#
+# Cada entrada o despacho se anexa a 'diario.csv' con sus propias filas,
+# sin reescribir el historial. Al superar LIMITE_COMPACTACION el diario se
+# consolida en entradas.csv / despachos.csv y se vacía.
+
+def _columnas_archivo(path, por_defecto):
+    """Devuelve el orden de columnas de la cabecera de un CSV existente."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return list(por_defecto)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+def _asegurar_columnas(path, columnas_nuevas, por_defecto):
+    columnas = _columnas_archivo(path, por_defecto)
+    faltantes = [c for c in columnas_nuevas if c not in columnas]
+    if faltantes:
+        # Un archivo antiguo sin alguna columna se reescribe una única vez
+        existente = pd.read_csv(path)
+        columnas = columnas + faltantes
+        escribir_csv_atomico(path, existente.reindex(columns=columnas))
+    return columnas
+
+def _anexar_filas(path, df, por_defecto):
+    columnas = _asegurar_columnas(path, df.columns, por_defecto)
+    nuevo_archivo = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, 'a', newline='', encoding='utf-8') as f:
+        inicio = f.tell()
+        df.reindex(columns=columnas).to_csv(f, header=nuevo_archivo, index=False)
+        contar('bytes_escritos', f.tell() - inicio)
+        f.flush()
+        os.fsync(f.fileno())
+
+def leer_diario():
+    path = get_file_path('diario.csv')
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return pd.DataFrame(columns=COLUMNAS_DIARIO)
+    with etapa('leer_csv', archivo='diario.csv', motor=esquemas.MOTOR_CSV):
+        diario = esquemas.leer_csv(path, 'diario')
+    contar('filas_leidas', len(diario))
+    return diario
+
+def _separar_diario(diario):
+    entradas = diario[diario['Tipo'] == 'Entrada'].reindex(columns=COLUMNAS_ENTRADAS)
+    despachos = diario[diario['Tipo'] == 'Despacho'].reindex(columns=COLUMNAS_DESPACHOS)
+    return entradas.reset_index(drop=True), despachos.reset_index(drop=True)
+
+def _apertura_desde_stock(productos_df, entradas_df, despachos_df):
+    """Convierte un stock ya actualizado por movimientos en saldo de apertura."""
+    productos_df = productos_df.copy()
+    netos = movimientos_netos(entradas_df, despachos_df)
+    apertura = productos_df['Stock Inicial'] - productos_df['Producto'].map(netos).fillna(0)
+    if pd.api.types.is_integer_dtype(productos_df['Stock Inicial'].dtype):
+        apertura = apertura.astype('int64')
+    productos_df['Stock Inicial'] = apertura
+    return productos_df
+
+def _sin_columnas_calculadas(productos_df):
+    return productos_df.drop(columns=['Stock Actual'], errors='ignore')
+
+def _anteriores(df, corte):
+    """Máscara de las filas con fecha anterior a ``corte`` (las fechas inválidas no cuentan)."""
+    return (pd.to_datetime(df['Fecha'], errors='coerce') < corte).to_numpy()
+
+def _sumar_apertura(productos_df, netos):
+    """Suma a 'Stock Inicial' el neto de movimientos que dejan de estar en el almacén."""
+    apertura = productos_df['Stock Inicial'] + productos_df['Producto'].map(netos).fillna(0)
+    if pd.api.types.is_integer_dtype(productos_df['Stock Inicial'].dtype) and (apertura % 1 == 0).all():
+        apertura = apertura.astype('int64')
+    return productos_df.assign(**{'Stock Inicial': apertura})
+
+def _columnas_actualizables(nuevos, actualizar_stock):
+    return [c for c in COLUMNAS_PRODUCTOS
+            if c != 'Producto' and c in nuevos.columns and (actualizar_stock or c != 'Stock Inicial')]
+
+def _combinar_productos(actual, nuevos, actualizar_stock):
+    """Actualiza por 'Producto' las filas existentes y devuelve además las altas."""
+    nuevos = nuevos.drop_duplicates('Producto', keep='last').set_index('Producto')
+    existentes = actual['Producto'].isin(nuevos.index)
+    actual = actual.copy()
+    for col in _columnas_actualizables(nuevos, actualizar_stock):
+        if col not in actual.columns:
+            actual[col] = None
+        valores = actual.loc[existentes, 'Producto'].map(nuevos[col])
+        # Las celdas vacías del archivo no pisan lo que ya había
+        actual.loc[existentes, col] = valores.where(valores.notna(), actual.loc[existentes, col])
+    altas = nuevos[~nuevos.index.isin(actual['Producto'])].reset_index()
+    altas = altas.reindex(columns=COLUMNAS_PRODUCTOS)
+    altas[['Stock Inicial', 'Stock Minimo']] = altas[['Stock Inicial', 'Stock Minimo']].fillna(0)
+    for df in [actual, altas]:
+        for col in ['Stock Inicial', 'Stock Minimo']:
+            valores = pd.to_numeric(df[col], errors='coerce')
+            if valores.notna().all() and (valores % 1 == 0).all():
+                df[col] = valores.astype('int64')
+    return actual, altas, bool(existentes.any())
+
+# ================================================
+# BACKENDS DE ALMACENAMIENTO
+# ================================================
+#
+# Ambos backends exponen la misma interfaz: firma(), leer(),
+# registrar_movimientos(), guardar_productos(), upsert_productos(),
+# compactar() y despachos_de_pedido(). leer() devuelve las tablas con los
+# tipos de esquemas.py (categorías y fechas datetime64).
+#
+# 'Stock Inicial' es el saldo de apertura de cada producto y no se modifica
+# al registrar movimientos; el stock actual lo calcula existencias.py. Las
+# bases anteriores guardaban ahí el stock ya descontado, así que la primera
+# lectura lo convierte una única vez en saldo de apertura.
+
+class AlmacenCSV:
+    nombre = 'csv'
+
+    def __init__(self):
+        # Archivos base ya parseados, por firma: si solo cambió el diario no se releen
+        self._leidos = {}
+        self._stock_migrado = False
+
+    def _estado(self):
+        path_estado = get_file_path('estado.json')
+        if not os.path.exists(path_estado):
+            return {}
+        with open(path_estado, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _migrar_stock(self):
+        if self._stock_migrado:
+            return
+        with bloquear('productos'):
+            estado = self._estado()
+            if not estado.get('stock_derivado'):
+                # El diario nunca se sumó a productos.csv: solo cuentan los archivos base
+                productos_df = pd.read_csv(get_file_path('productos.csv'))
+                productos_df = _apertura_desde_stock(
+                    productos_df,
+                    pd.read_csv(get_file_path('entradas.csv')),
+                    pd.read_csv(get_file_path('despachos.csv'))
+                )
+                escribir_csv_atomico(get_file_path('productos.csv'), productos_df)
+
+                estado['stock_derivado'] = True
+                _escribir_json_atomico(get_file_path('estado.json'), estado)
+        self._stock_migrado = True
+
+    def _leer_csv(self, nombre):
+        path = get_file_path(nombre)
+        firma = _firma_archivo(path)
+        guardado = self._leidos.get(nombre)
+        if guardado and guardado[0] == firma:
+            return guardado[1]
+        with etapa('leer_csv', archivo=nombre, motor=esquemas.MOTOR_CSV):
+            df = esquemas.leer_csv(path, nombre.removesuffix('.csv'))
+        contar('filas_leidas', len(df))
+        self._leidos[nombre] = (firma, df)
+        return df
+
+    def version_productos(self):
+        return _firma_archivo(get_file_path('productos.csv'))
+
+    def firma(self):
+        firma = []
+        for nombre in ARCHIVOS_DATOS:
+            try:
+                info = os.stat(get_file_path(nombre))
+                firma.append((nombre, info.st_ino, info.st_mtime_ns, info.st_size))
+            except FileNotFoundError:
+                firma.append((nombre, None, None, None))
+        return tuple(firma)
+
+    def leer(self):
+        inicializar_archivos()
+        self._migrar_stock()
+        if os.path.exists(get_file_path('compactacion.json')):
+            with bloquear('movimientos'):
+                self._recuperar_compactacion()
+
+        if os.path.exists(get_file_path('archivando.json')):
+            with bloquear('movimientos'), bloquear('productos'):
+                _recuperar_archivado()
+
+        productos_df = self._leer_csv('productos.csv')
+        entradas_df = self._leer_csv('entradas.csv')
+        despachos_df = self._leer_csv('despachos.csv')
+
+        # Reproducir el diario pendiente sobre los archivos base
+        diario = leer_diario()
+        if not diario.empty:
+            entradas, despachos = _separar_diario(diario)
+            entradas_df = esquemas.concatenar(entradas_df, entradas)
+            despachos_df = esquemas.concatenar(despachos_df, despachos)
+
+        return productos_df, entradas_df, despachos_df
+
+    def registrar_movimientos(self, entradas=None, despachos=None):
+        partes = []
+        if entradas is not None and not entradas.empty:
+            partes.append(entradas.assign(Tipo='Entrada'))
+        if despachos is not None and not despachos.empty:
+            partes.append(despachos.assign(Tipo='Despacho'))
+        if not partes:
+            return
+
+        path = get_file_path('diario.csv')
+        _anexar_filas(path, pd.concat(partes, ignore_index=True), COLUMNAS_DIARIO)
+
+        if os.path.getsize(path) > LIMITE_COMPACTACION:
+            self.compactar()
+
+    def _recuperar_compactacion(self):
+        """Deshace una compactación interrumpida (se llama con el cerrojo de movimientos)."""
+        path_marca = get_file_path('compactacion.json')
+        if not os.path.exists(path_marca):
+            return
+        with open(path_marca, encoding='utf-8') as f:
+            tamanos = json.load(f)
+        if not leer_diario().empty:
+            # El diario sigue completo: se recortan las filas que alcanzaron a anexarse
+            for nombre, tamano in tamanos.items():
+                with open(get_file_path(nombre), 'r+b') as f:
+                    f.truncate(tamano)
+                    f.flush()
+                    os.fsync(f.fileno())
+        os.remove(path_marca)
+
+    def compactar(self):
+        """Consolida el diario en entradas.csv / despachos.csv y lo vacía.
+
+        Antes de anexar se anota el tamaño de los archivos base; si el proceso
+        se interrumpe, la siguiente lectura recorta lo anexado y el diario se
+        vuelve a consolidar más tarde, sin duplicar filas.
+        """
+        inicializar_archivos()
+        self._recuperar_compactacion()
+        diario = leer_diario()
+
+        if not diario.empty:
+            entradas, despachos = _separar_diario(diario)
+            destinos = [('entradas.csv', entradas, COLUMNAS_ENTRADAS), ('despachos.csv', despachos, COLUMNAS_DESPACHOS)]
+            for nombre, df, columnas in destinos:
+                _asegurar_columnas(get_file_path(nombre), df.columns, columnas)
+            _escribir_json_atomico(
+                get_file_path('compactacion.json'),
+                {nombre: os.path.getsize(get_file_path(nombre)) for nombre, _, _ in destinos}
+            )
+            for nombre, df, columnas in destinos:
+                if not df.empty:
+                    _anexar_filas(get_file_path(nombre), df, columnas)
+
+        # Vaciar el diario una vez consolidado
+        escribir_csv_atomico(get_file_path('diario.csv'), pd.DataFrame(columns=COLUMNAS_DIARIO))
+        if os.path.exists(get_file_path('compactacion.json')):
+            os.remove(get_file_path('compactacion.json'))
+
+    def guardar_productos(self, productos_df):
+        escribir_csv_atomico(get_file_path('productos.csv'), _sin_columnas_calculadas(productos_df))
+
+    def upsert_productos(self, nuevos, actualizar_stock=False):
+        inicializar_archivos()
+        path = get_file_path('productos.csv')
+        actual, altas, hay_cambios = _combinar_productos(pd.read_csv(path), nuevos, actualizar_stock)
+        if hay_cambios:
+            escribir_csv_atomico(path, pd.concat([actual, altas], ignore_index=True))
+        elif not altas.empty:
+            # Solo productos nuevos: basta con anexarlos
+            _anexar_filas(path, altas, COLUMNAS_PRODUCTOS)
+
+    def despachos_de_pedido(self, numero_pedido):
+        despachos_df = cargar_tablas()[2]
+        return despachos_df[clave_pedido(despachos_df['Número de Pedido']) == clave_pedido(pd.Series([numero_pedido]))[0]]
+
+    def retirar_movimientos(self, corte, netos, marca):
+        """Quita las filas anteriores a ``corte`` y suma su neto al saldo de apertura.
+
+        Las tres tablas nuevas se escriben primero como temporales; anotar
+        los reemplazos en la marca de archivado es el punto de confirmación,
+        y desde ahí recuperar_archivado() puede terminar el trabajo.
+        """
+        tablas = {'productos.csv': _sumar_apertura(pd.read_csv(get_file_path('productos.csv')), netos)}
+        for nombre in ['entradas.csv', 'despachos.csv']:
+            df = pd.read_csv(get_file_path(nombre), dtype={'Número de Pedido': str})
+            tablas[nombre] = df[~_anteriores(df, corte)]
+
+        reemplazos = {}
+        for nombre, df in tablas.items():
+            temporal = get_file_path(f'{nombre}.archivado.tmp')
+            escribir_csv_atomico(temporal, df)
+            reemplazos[temporal] = get_file_path(nombre)
+        marca = {**marca, 'reemplazos': reemplazos}
+        _escribir_json_atomico(get_file_path('archivando.json'), marca)
+        self.recuperar_archivado(marca)
+
+    def recuperar_archivado(self, marca):
+        """Completa un archivado confirmado (True) o descarta uno sin confirmar (False)."""
+        if 'reemplazos' not in marca:
+            for nombre in ['productos.csv', 'entradas.csv', 'despachos.csv']:
+                temporal = get_file_path(f'{nombre}.archivado.tmp')
+                if os.path.exists(temporal):
+                    os.remove(temporal)
+            return False
+        for temporal, destino in marca['reemplazos'].items():
+            if os.path.exists(temporal):
+                reemplazar(temporal, destino)
+        return True
+
+
+_ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS productos (
+    "Producto" TEXT NOT NULL,
+    "Unidad de Medida" TEXT,
+    "Tipo de Producto" TEXT,
+    "Stock Inicial" REAL NOT NULL DEFAULT 0,
+    "Stock Minimo" REAL NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_productos_producto ON productos ("Producto");
+
+CREATE TABLE IF NOT EXISTS entradas (
+    "Producto" TEXT NOT NULL,
+    "Cantidad" REAL NOT NULL,
+    "Fecha" TEXT,
+    "Motivo" TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_entradas_producto ON entradas ("Producto");
+CREATE INDEX IF NOT EXISTS idx_entradas_fecha ON entradas ("Fecha");
+
+CREATE TABLE IF NOT EXISTS despachos (
+    "Fecha" TEXT,
+    "Cliente" TEXT,
+    "Número de Pedido" TEXT,
+    "Producto" TEXT NOT NULL,
+    "Cantidad" REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_despachos_producto ON despachos ("Producto");
+CREATE INDEX IF NOT EXISTS idx_despachos_pedido ON despachos ("Número de Pedido");
+CREATE INDEX IF NOT EXISTS idx_despachos_clave_pedido ON despachos (ltrim(trim("Número de Pedido"), '0'));
+CREATE INDEX IF NOT EXISTS idx_despachos_cliente ON despachos ("Cliente");
+CREATE INDEX IF NOT EXISTS idx_despachos_fecha ON despachos ("Fecha");
+
+CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (clave, valor) VALUES ('version', 0);
+INSERT OR IGNORE INTO meta (clave, valor) VALUES ('version_productos', 0);
+"""
+
+def _preparar_para_sql(df, columnas):
+    df = df.reindex(columns=columnas)
+    if 'Fecha' in df.columns:
+        df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce').dt.strftime('%Y-%m-%d')
+    if 'Número de Pedido' in df.columns:
+        # Los vacíos quedan NULL, no el texto 'nan'
+        df['Número de Pedido'] = normalizar_pedido(df['Número de Pedido']).where(df['Número de Pedido'].notna())
+    return df.astype(object).where(df.notna(), None)
+
+class AlmacenSQLite:
+    nombre = 'sqlite'
+
+    def __init__(self, path=None):
+        self.path = path or get_file_path(ARCHIVO_SQLITE)
+        with self._conectar() as con:
+            con.executescript(_ESQUEMA_SQLITE)
+        self._migrar_stock()
+
+    def _conectar(self):
+        con = sqlite3.connect(self.path, timeout=30)
+        con.execute('PRAGMA journal_mode=WAL')
+        return con
+
+    def _insertar(self, con, tabla, df, columnas):
+        df = _preparar_para_sql(df, columnas)
+        campos = ', '.join(f'"{c}"' for c in columnas)
+        marcas = ', '.join('?' for _ in columnas)
+        con.executemany(f'INSERT INTO {tabla} ({campos}) VALUES ({marcas})', df.itertuples(index=False, name=None))
+
+    def _incrementar_version(self, con, productos=False):
+        con.execute("UPDATE meta SET valor = valor + 1 WHERE clave = 'version'")
+        if productos:
+            con.execute("UPDATE meta SET valor = valor + 1 WHERE clave = 'version_productos'")
+
+    def version_productos(self):
+        con = self._conectar()
+        try:
+            return con.execute("SELECT valor FROM meta WHERE clave = 'version_productos'").fetchone()[0]
+        finally:
+            con.close()
+
+    def _migrar_stock(self):
+        con = self._conectar()
+        try:
+            with con:
+                if con.execute("SELECT valor FROM meta WHERE clave = 'stock_derivado'").fetchone():
+                    return
+                con.execute(
+                    'UPDATE productos SET "Stock Inicial" = "Stock Inicial"'
+                    ' - COALESCE((SELECT SUM("Cantidad") FROM entradas e WHERE e."Producto" = productos."Producto"), 0)'
+                    ' + COALESCE((SELECT SUM("Cantidad") FROM despachos d WHERE d."Producto" = productos."Producto"), 0)'
+                )
+                con.execute("INSERT INTO meta (clave, valor) VALUES ('stock_derivado', 1)")
+                self._incrementar_version(con, productos=True)
+        finally:
+            con.close()
+
+    def firma(self):
+        con = self._conectar()
+        try:
+            return (self.path, con.execute("SELECT valor FROM meta WHERE clave = 'version'").fetchone()[0])
+        finally:
+            con.close()
+
+    def leer(self):
+        con = self._conectar()
+        try:
+            with etapa('leer_sqlite'):
+                productos_df = pd.read_sql_query('SELECT * FROM productos ORDER BY rowid', con)
+                entradas_df = pd.read_sql_query('SELECT * FROM entradas ORDER BY rowid', con)
+                despachos_df = pd.read_sql_query('SELECT * FROM despachos ORDER BY rowid', con)
+        finally:
+            con.close()
+        contar('filas_leidas', len(productos_df) + len(entradas_df) + len(despachos_df))
+
+        # SQLite guarda las cantidades como REAL y las fechas como texto
+        return (esquemas.tipar(productos_df, 'productos'), esquemas.tipar(entradas_df, 'entradas'),
+                esquemas.tipar(despachos_df, 'despachos'))
+
+    def registrar_movimientos(self, entradas=None, despachos=None):
+        con = self._conectar()
+        try:
+            # Una sola transacción para entradas y despachos
+            with con:
+                for tabla, df, columnas in [('entradas', entradas, COLUMNAS_ENTRADAS),
+                                            ('despachos', despachos, COLUMNAS_DESPACHOS)]:
+                    if df is not None and not df.empty:
+                        self._insertar(con, tabla, df, columnas)
+                self._incrementar_version(con)
+        finally:
+            con.close()
+
+    def compactar(self):
+        pass
+
+    def guardar_productos(self, productos_df):
+        con = self._conectar()
+        try:
+            with con:
+                con.execute('DELETE FROM productos')
+                self._insertar(con, 'productos', productos_df.drop_duplicates('Producto', keep='last'), COLUMNAS_PRODUCTOS)
+                self._incrementar_version(con, productos=True)
+        finally:
+            con.close()
+
+    def upsert_productos(self, nuevos, actualizar_stock=False):
+        nuevos = nuevos.drop_duplicates('Producto', keep='last')
+        columnas = ['Producto'] + _columnas_actualizables(nuevos, actualizar_stock)
+        altas = nuevos.reindex(columns=COLUMNAS_PRODUCTOS)
+        altas[['Stock Inicial', 'Stock Minimo']] = altas[['Stock Inicial', 'Stock Minimo']].fillna(0)
+        campos = ', '.join(f'"{c}"' for c in COLUMNAS_PRODUCTOS)
+        marcas = ', '.join('?' for _ in COLUMNAS_PRODUCTOS)
+        asignaciones = ', '.join(f'"{c}" = COALESCE(excluded."{c}", productos."{c}")' for c in columnas[1:])
+        conflicto = f'DO UPDATE SET {asignaciones}' if asignaciones else 'DO NOTHING'
+        # En altas se usan los valores por defecto; en existentes solo las columnas del archivo
+        filas = _preparar_para_sql(altas, COLUMNAS_PRODUCTOS)
+        con = self._conectar()
+        try:
+            with con:
+                con.executemany(
+                    f'INSERT INTO productos ({campos}) VALUES ({marcas}) ON CONFLICT("Producto") {conflicto}',
+                    filas.itertuples(index=False, name=None)
+                )
+                self._incrementar_version(con, productos=True)
+        finally:
+            con.close()
+
+    def despachos_de_pedido(self, numero_pedido):
+        con = self._conectar()
+        try:
+            # El índice por expresión reúne '001' y '1'; la clave exacta se filtra después
+            candidatos = pd.read_sql_query(
+                'SELECT * FROM despachos WHERE ltrim(trim("Número de Pedido"), \'0\') = ltrim(?, \'0\')',
+                con, params=(str(numero_pedido).strip(),)
+            )
+            return candidatos[clave_pedido(candidatos['Número de Pedido']) == clave_pedido(pd.Series([numero_pedido]))[0]]
+        finally:
+            con.close()
+
+    def retirar_movimientos(self, corte, netos, marca):
+        """Quita las filas anteriores a ``corte`` y suma su neto al saldo de apertura, en una transacción."""
+        con = self._conectar()
+        try:
+            with con:
+                for tabla in ['entradas', 'despachos']:
+                    filas = pd.read_sql_query(f'SELECT rowid, "Fecha" FROM {tabla}', con)
+                    con.executemany(
+                        f'DELETE FROM {tabla} WHERE rowid = ?',
+                        ((int(r),) for r in filas.loc[_anteriores(filas, corte), 'rowid'])
+                    )
+                con.executemany(
+                    'UPDATE productos SET "Stock Inicial" = "Stock Inicial" + ? WHERE "Producto" = ?',
+                    ((float(v), p) for p, v in netos.items())
+                )
+                # Queda constancia del lote en la misma transacción
+                con.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('archivado', ?)", (marca['lote'],))
+                self._incrementar_version(con, productos=True)
+        finally:
+            con.close()
+
+    def recuperar_archivado(self, marca):
+        con = self._conectar()
+        try:
+            fila = con.execute("SELECT valor FROM meta WHERE clave = 'archivado'").fetchone()
+        finally:
+            con.close()
+        return fila is not None and fila[0] == marca['lote']
+
+    def importar_tablas(self, productos_df, entradas_df, despachos_df):
+        """Reemplaza todo el contenido de la base en una única transacción."""
+        con = self._conectar()
+        try:
+            with con:
+                for tabla in ['productos', 'entradas', 'despachos']:
+                    con.execute(f'DELETE FROM {tabla}')
+                self._insertar(con, 'productos', productos_df.drop_duplicates('Producto', keep='last'), COLUMNAS_PRODUCTOS)
+                self._insertar(con, 'entradas', entradas_df, COLUMNAS_ENTRADAS)
+                self._insertar(con, 'despachos', despachos_df, COLUMNAS_DESPACHOS)
+                self._incrementar_version(con, productos=True)
+        finally:
+            con.close()
+
+
+_almacenes = {}
+
+def almacen_activo():
+    """Backend de la bodega activa (la vista consolidada no tiene uno propio)."""
+    nombre = bodegas.activa()
+    if nombre == bodegas.CONSOLIDADO:
+        raise SoloLectura("La vista de todas las bodegas es de solo lectura: elija una bodega.")
+    if nombre not in _almacenes:
+        _almacenes[nombre] = AlmacenSQLite() if ALMACEN == 'sqlite' else AlmacenCSV()
+    return _almacenes[nombre]
+
+def migrar_csv_a_sqlite(path=None):
+    """Copia productos, entradas y despachos (incluido el diario) a una base SQLite."""
+    destino = AlmacenSQLite(path)
+    destino.importar_tablas(*AlmacenCSV().leer())
+    return destino.path
+
+# ================================================
+# OPERACIONES DE ESCRITURA
+# ================================================
+#
+# Cada escritura toma el cerrojo de su recurso solo mientras escribe. Los
+# movimientos se anexan, así que dos despachos simultáneos nunca se pisan;
+# la tabla de productos se reescribe completa y por eso guardar_productos
+# rechaza un DataFrame cargado antes de la última modificación. Quien
+# necesite los dos cerrojos toma siempre movimientos antes que productos
+# (bloquear_catalogo), incluso si solo lee: con archivos de recuperación
+# pendientes leer() toma el de movimientos.
+
+def registrar_movimientos(entradas=None, despachos=None):
+    """Registra entradas y/o despachos en una sola escritura."""
+    with bloquear('movimientos'), etapa('registrar_movimientos'):
+        almacen_activo().registrar_movimientos(entradas=entradas, despachos=despachos)
+        contar('filas_escritas', sum(len(df) for df in [entradas, despachos] if df is not None))
+        if despachos is not None and not despachos.empty:
+            _indice_pedidos_activo().anexar(despachos['Número de Pedido'])
+    invalidar_cache()
+
+def compactar():
+    with bloquear('movimientos'):
+        almacen_activo().compactar()
+    invalidar_cache()
+
+def guardar_productos(productos_df):
+    """Reescribe la tabla de productos (saldos de apertura, sin 'Stock Actual').
+
+    Si productos_df viene de cargar_tablas se comprueba que nadie haya
+    modificado la tabla desde entonces; en ese caso se lanza ConflictoVersion.
+    """
+    with bloquear('productos'):
+        version = productos_df.attrs.get('version_productos')
+        if version is not None and version != almacen_activo().version_productos():
+            raise ConflictoVersion("Otro usuario modificó los productos. Recargue la página e intente de nuevo.")
+        with etapa('guardar_productos'):
+            almacen_activo().guardar_productos(_sin_columnas_calculadas(productos_df))
+    invalidar_cache()
+
+def _apertura_de_altas(nuevos):
+    """'Stock Inicial' de los productos nuevos como saldo de apertura.
+
+    Puede haber movimientos con el nombre de un producto que ya no existe
+    (eliminado): el alta empieza con el stock pedido, no con ese neto.
+    """
+    altas = ~nuevos['Producto'].isin(set(indice_productos().posiciones))
+    if not altas.any():
+        return nuevos
+    netos = _vista_activa().netos
+    # Sin la columna, los existentes quedan vacíos (no se pisa su apertura)
+    pedido = pd.to_numeric(nuevos.get('Stock Inicial', pd.Series(np.nan, index=nuevos.index)), errors='coerce')
+    apertura = pedido.astype('float64')
+    apertura[altas] = pedido[altas].fillna(0) - nuevos.loc[altas, 'Producto'].map(netos).fillna(0)
+    if apertura.notna().all() and (apertura % 1 == 0).all():
+        apertura = apertura.astype('int64')
+    return nuevos.assign(**{'Stock Inicial': apertura})
+
+def upsert_productos(nuevos, actualizar_stock=False):
+    """Inserta o actualiza productos por nombre sin reemplazar el catálogo.
+
+    Salvo que se pida ``actualizar_stock``, los productos existentes conservan su
+    saldo de apertura. Los nuevos guardan como apertura el stock indicado menos
+    los movimientos que ya tenga su nombre.
+    """
+    with bloquear('productos'), etapa('upsert_productos'):
+        nuevos = _apertura_de_altas(_sin_columnas_calculadas(nuevos))
+        almacen_activo().upsert_productos(nuevos, actualizar_stock=actualizar_stock)
+    invalidar_cache()
+
+def anexar_pedidos(pedidos_df):
+    """Agrega filas a pedidos.csv conservando los ceros a la izquierda del número."""
+    pedidos_df = pedidos_df.assign(**{'Número de Pedido': pedidos_df['Número de Pedido'].astype(str)})
+    with bloquear('pedidos'):
+        _anexar_filas(get_file_path('pedidos.csv'), pedidos_df.reindex(columns=COLUMNAS_PEDIDOS), COLUMNAS_PEDIDOS)
+
+def pedidos_despachados():
+    """Índice de los números de pedido ya despachados, al día con los datos."""
+    cargar_tablas()
+    return _indice_pedidos_activo()
+
+def pedido_existe(numero_pedido):
+    """Indica si el pedido ya fue despachado ('001' y '1' son el mismo pedido)."""
+    return numero_pedido in pedidos_despachados()
+
+def despachos_de_pedido(numero_pedido):
+    return almacen_activo().despachos_de_pedido(numero_pedido)
+
+# ================================================
+# ARCHIVADO DE MESES CERRADOS
+# ================================================
+#
+# Solo el mes en curso queda en el almacén de trabajo que lee cargar_tablas.
+# Los movimientos anteriores pasan al histórico Parquet (historico.py) y su
+# neto se suma al saldo de apertura, de modo que el stock actual no cambia.
+# Antes de escribir se deja una marca con los archivos del lote: si el
+# proceso se interrumpe, la siguiente lectura o archivado termina el trabajo
+# ya confirmado por el backend o borra los archivos del lote incompleto.
+
+_meses_revisados = {}
+
+def historico_activo():
+    if bodegas.activa() == bodegas.CONSOLIDADO:
+        return historico.HistoricoConsolidado({
+            nombre: historico.Historico(os.path.join(bodegas.directorio(nombre), 'historico'))
+            for nombre in bodegas.disponibles()
+        })
+    return historico.Historico(get_file_path('historico'))
+
+def _recuperar_archivado():
+    """Se llama con los cerrojos de movimientos y productos tomados."""
+    path_marca = get_file_path('archivando.json')
+    if not os.path.exists(path_marca):
+        return
+    with open(path_marca, encoding='utf-8') as f:
+        marca = json.load(f)
+    if almacen_activo().recuperar_archivado(marca):
+        _indice_pedidos_activo().descartar()
+        _vista_activa().descartar()
+    else:
+        historico_activo().eliminar(marca['archivos'])
+    os.remove(path_marca)
+
+def _incorporar_movimientos_csv(corte):
+    """Copia al histórico los meses cerrados de movimientos.csv (reescribe esos meses, sin duplicar)."""
+    path = get_file_path('movimientos.csv')
+    if not os.path.exists(path):
+        return
+    movimientos = historico.normalizar(movimientos_df=pd.read_csv(path))
+    movimientos = movimientos[movimientos['Fecha'] < corte]
+    historico_activo().escribir(historico_activo().preparar(movimientos, nombre='movimientos'))
+
+def archivar(corte=None):
+    """Archiva los movimientos anteriores a ``corte`` (por defecto, el primer día del mes en curso).
+
+    Devuelve el número de filas que salieron del almacén de trabajo.
+    """
+    corte = pd.Timestamp(corte if corte is not None else pd.Timestamp.today().replace(day=1)).normalize()
+    archivo = historico_activo()
+    archivadas = 0
+    with bloquear('movimientos'), bloquear('productos'):
+        _recuperar_archivado()
+        almacen = almacen_activo()
+        almacen.compactar()
+        _, entradas_df, despachos_df = almacen.leer()
+        entradas_df = entradas_df[_anteriores(entradas_df, corte)]
+        despachos_df = despachos_df[_anteriores(despachos_df, corte)]
+        archivadas = len(entradas_df) + len(despachos_df)
+
+        if archivadas:
+            lotes = archivo.preparar(historico.normalizar(entradas_df=entradas_df, despachos_df=despachos_df))
+            marca = {'lote': time.time_ns(), 'corte': corte.strftime('%Y-%m-%d'), 'archivos': list(lotes)}
+            _escribir_json_atomico(get_file_path('archivando.json'), marca)
+            archivo.escribir(lotes)
+            almacen.retirar_movimientos(corte, movimientos_netos(entradas_df, despachos_df), marca)
+            os.remove(get_file_path('archivando.json'))
+            _indice_pedidos_activo().descartar()
+            _vista_activa().descartar()
+
+        _incorporar_movimientos_csv(corte)
+        if archivo.corte() is None or archivo.corte() < corte:
+            archivo.marcar_corte(corte)
+    invalidar_cache()
+    return archivadas
+
+def archivar_si_corresponde():
+    """Archiva los meses cerrados la primera vez que se cargan datos en un mes nuevo."""
+    if bodegas.activa() == bodegas.CONSOLIDADO:
+        for nombre in bodegas.disponibles():
+            with bodegas.en(nombre):
+                archivar_si_corresponde()
+        return
+    mes = pd.Timestamp.today().normalize().replace(day=1)
+    if _meses_revisados.get(bodegas.activa()) == mes or not historico.disponible():
+        return
+    corte = historico_activo().corte()
+    if corte is None or corte < mes or os.path.exists(get_file_path('archivando.json')):
+        archivar(mes)
+    _meses_revisados[bodegas.activa()] = mes
+
+def inicio_almacen():
+    """Primer día guardado en el almacén de trabajo (None si nunca se archivó)."""
+    return historico_activo().corte()
+
+# ================================================
+# CACHÉ EN PROCESO ENTRE RERUNS
+# ================================================
+#
+# Streamlit reejecuta app.py en cada interacción, pero este módulo se importa
+# una sola vez por proceso, así que la caché se comparte entre reruns y
+# sesiones. La clave combina un contador que incrementa cada escritura de
+# este proceso con la firma del backend (identidad, mtime y tamaño de los
+# CSV, o el contador de versión de SQLite) para detectar cambios hechos por
+# otros procesos. Cada bodega tiene su propia caché; la de la vista
+# consolidada usa como clave las versiones de todas las bodegas. Las tablas
+# devueltas son compartidas: quien necesite modificarlas debe trabajar
+# sobre una copia.
+
+_cerrojo_cache = threading.Lock()
+_caches = {}
+
+def _cache_activa():
+    return _caches.setdefault(bodegas.activa(), {'version': 0, 'clave': None, 'tablas': None, 'derivados': {}})
+
+def version_datos():
+    if bodegas.activa() == bodegas.CONSOLIDADO:
+        versiones = []
+        for nombre in bodegas.disponibles():
+            with bodegas.en(nombre):
+                versiones.append((nombre, version_datos()))
+        return tuple(versiones)
+    return (_cache_activa()['version'], almacen_activo().firma())
+
+def invalidar_cache():
+    with _cerrojo_cache:
+        cache = _cache_activa()
+        cache.update(version=cache['version'] + 1, clave=None, tablas=None, derivados={})
+
+def _vista_activa():
+    return vista_stock(get_file_path(f'stock_checkpoint_{almacen_activo().nombre}.json'))
+
+def _indice_pedidos_activo():
+    return indice_pedidos(get_file_path(f'pedidos_despachados_{almacen_activo().nombre}.idx'))
+
+def movimiento_neto(producto):
+    """Entradas menos despachos registrados con ese nombre de producto."""
+    cargar_tablas()
+    return _vista_activa().netos.get(producto, 0)
+
+def _leer_tablas():
+    if bodegas.activa() == bodegas.CONSOLIDADO:
+        return _leer_consolidado()
+    # La versión se toma antes de leer: si cambia entretanto, la sesión queda
+    # con una versión anterior y su próxima escritura completa se rechaza
+    version_productos = almacen_activo().version_productos()
+    with etapa('leer_almacen'):
+        productos_df, entradas_df, despachos_df = almacen_activo().leer()
+
+    # Stock actual = apertura + entradas - despachos (solo se aplica la cola nueva)
+    with etapa('calcular_stock'):
+        # Con el corte del archivado, un checkpoint anterior al último archivado no se reutiliza
+        corte = historico_activo().corte()
+        corte = None if corte is None else corte.strftime('%Y-%m-%d')
+        netos = _vista_activa().actualizar(entradas_df, despachos_df, corte=corte)
+        productos_df = aplicar_stock(productos_df, netos)
+    with etapa('indice_pedidos'):
+        _indice_pedidos_activo().sincronizar(despachos_df, base=lambda: historico_activo().claves_pedidos())
+    productos_df.attrs['version_productos'] = version_productos
+
+    return productos_df, entradas_df, despachos_df
+
+def cargar_tablas():
+    """Devuelve (productos, entradas, despachos) reutilizando la caché si los datos no cambiaron."""
+    with _cerrojo_cache:
+        cache = _cache_activa()
+        clave = version_datos()
+        if cache['clave'] == clave:
+            return cache['tablas']
+
+    tablas = _leer_tablas()
+
+    with _cerrojo_cache:
+        # Solo se guarda si ninguna escritura ocurrió mientras se leía
+        if version_datos() == clave:
+            cache.update(clave=clave, tablas=tablas, derivados={})
+    return tablas
+
+def cache_derivado(nombre, construir):
+    """Calcula una estructura derivada de las tablas una vez por versión de datos."""
+    tablas = cargar_tablas()
+    with _cerrojo_cache:
+        cache = _cache_activa()
+        if cache['tablas'] is tablas and nombre in cache['derivados']:
+            return cache['derivados'][nombre]
+
+    valor = construir(*tablas)
+
+    with _cerrojo_cache:
+        if cache['tablas'] is tablas:
+            cache['derivados'][nombre] = valor
+    return valor
+
+# ================================================
+# VISTA CONSOLIDADA DE LAS BODEGAS
+# ================================================
+#
+# Cada bodega se carga con su propio cargar_tablas (y su caché, así que
+# solo se releen las que cambiaron) en un pool de hilos: el parser C de
+# pandas y pyarrow sueltan el GIL mientras leen, de modo que los archivos de
+# varias bodegas se leen a la vez. El catálogo se suma por producto y los
+# movimientos se unen con una columna 'Bodega'. Los traspasos se quitan de
+# ambos lados: en el total no mueven stock y no son consumo de clientes.
+
+def _tablas_de(nombre):
+    with bodegas.en(nombre):
+        return cargar_tablas()
+
+def _con_bodega(df, nombre):
+    return df.assign(Bodega=pd.Categorical.from_codes(np.zeros(len(df), dtype='int8'), [nombre]))
+
+def _unir_bodegas(partes):
+    """Une las tablas de cada bodega ({nombre: (productos, entradas, despachos)})."""
+    productos_df = reduce(esquemas.concatenar, [p for p, _, _ in partes.values()])
+    sumas = ['Stock Inicial', 'Stock Minimo', 'Stock Actual']
+    productos_df = productos_df.groupby('Producto', sort=False, as_index=False).agg(
+        {c: 'sum' if c in sumas else 'first' for c in productos_df.columns if c != 'Producto'}
+    )
+    entradas_df = reduce(esquemas.concatenar, [_con_bodega(e, nombre) for nombre, (_, e, _) in partes.items()])
+    despachos_df = reduce(esquemas.concatenar, [_con_bodega(d, nombre) for nombre, (_, _, d) in partes.items()])
+    entradas_df = entradas_df[~bodegas.es_traspaso(entradas_df['Motivo']).to_numpy()].reset_index(drop=True)
+    despachos_df = despachos_df[~bodegas.es_traspaso(despachos_df['Número de Pedido']).to_numpy()].reset_index(drop=True)
+    return productos_df, entradas_df, despachos_df
+
+def _leer_consolidado():
+    nombres = bodegas.disponibles()
+    with etapa('leer_bodegas', bodegas=len(nombres)):
+        with ThreadPoolExecutor(max_workers=min(len(nombres), os.cpu_count() or 1)) as pool:
+            partes = dict(zip(nombres, pool.map(_tablas_de, nombres)))
+    with etapa('unir_bodegas'):
+        return _unir_bodegas(partes)
+
+# ================================================
+# ÍNDICE DE PRODUCTOS
+# ================================================
+
+class IndiceProductos:
+    """Acceso por nombre de producto a su fila en productos_df sin recorrer la columna."""
+
+    def __init__(self, productos_df):
+        self.productos_df = productos_df
+        # Ante nombres repetidos se usa la primera fila, como hacía el filtro original
+        nombres = productos_df['Producto'].tolist()
+        self.posiciones = {}
+        for pos, nombre in enumerate(nombres):
+            self.posiciones.setdefault(nombre, pos)
+        self.stock = productos_df['Stock Actual'].to_numpy()
+
+    def __contains__(self, producto):
+        return producto in self.posiciones
+
+    def posicion(self, producto):
+        return self.posiciones.get(producto)
+
+    def etiqueta(self, producto):
+        return self.productos_df.index[self.posiciones[producto]]
+
+    def fila(self, producto):
+        return self.productos_df.iloc[self.posiciones[producto]]
+
+    def stock_de(self, producto):
+        return self.stock[self.posiciones[producto]]
+
+def indice_productos(productos_df=None):
+    """Índice de productos, construido una vez por versión de datos."""
+    if productos_df is None or productos_df is cargar_tablas()[0]:
+        return cache_derivado('indice_productos', lambda p, e, d: IndiceProductos(p))
+    return IndiceProductos(productos_df)
+
+# ================================================
+# MIGRACIÓN Y ARCHIVADO DESDE LÍNEA DE COMANDOS
+# ================================================
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'migrar-sqlite':
+        destino = migrar_csv_a_sqlite(sys.argv[2] if len(sys.argv) > 2 else None)
+        print(f"Datos migrados a {destino}. Inicie la app con BODEGA_ALMACEN=sqlite para usarla.")
+    elif len(sys.argv) > 1 and sys.argv[1] == 'archivar':
+        archivadas = archivar(sys.argv[2] if len(sys.argv) > 2 else None)
+        print(f"{archivadas} movimientos archivados en {historico_activo().directorio}.")
+    else:
+        print("Uso: python almacenamiento.py migrar-sqlite [ruta.db]")
+        print("     python almacenamiento.py archivar [AAAA-MM-DD]")
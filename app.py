@@ -4,63 +4,119 @@ from datetime import datetime
 import time
 import os
 import sys
-import subprocess
+import threading
+import multiprocessing
 from streamlit_option_menu import option_menu
-import tempfile
-from PyPDF2 import PdfReader
-import pdfplumber
-import openpyxl
+from almacenamiento import (
+    COLUMNAS_PRODUCTOS, COLUMNAS_ENTRADAS, COLUMNAS_DESPACHOS,
+    cargar_tablas, indice_productos, get_file_path, anexar_pedidos, COLUMNAS_PEDIDOS, ConflictoVersion,
+    archivar_si_corresponde, historico_activo, inicio_almacen
+)
+import bodegas
+import operaciones
+import instrumentacion
+from instrumentacion import etapa, medido
+from busqueda import filtrar_despachos, resumen_por_cliente
+from resumenes import totales
+from reposicion import reposicion
+from importacion import COLUMNAS_REQUERIDAS, ErrorImportacion, vista_previa, importar_archivo
+from pdf_pedidos import procesar_pdf
+from exportacion import MIME_CSV, MIME_EXCEL, exportar_excel, archivo_exportacion
 
 # ================================================
-# FUNCIONES COMPATIBLES CON PYINSTALLER
+# CARGA DE DATOS
 # ================================================
 
-def get_file_path(filename):
-    if getattr(sys, 'frozen', False):
-        base_path = os.path.join(sys._MEIPASS, 'datos')
+def selector_bodega():
+    """Bodega cuyos datos usa este rerun (el selector solo aparece si hay más de una)."""
+    nombres = bodegas.disponibles()
+    if len(nombres) > 1:
+        opciones = nombres + [bodegas.CONSOLIDADO]
+        por_defecto = opciones.index(bodegas.POR_DEFECTO) if bodegas.POR_DEFECTO in opciones else 0
+        nombre = st.selectbox("Bodega", opciones, index=por_defecto, key="bodega")
     else:
-        base_path = os.path.join(os.path.dirname(__file__), 'datos')
-    
-    # Crear directorio si no existe
-    if not os.path.exists(base_path):
-        os.makedirs(base_path)
-    
-    return os.path.join(base_path, filename)
+        nombre = nombres[0]
+    # Desde aquí get_file_path apunta a los archivos de esa bodega
+    bodegas.usar(nombre)
+    return nombre
 
+@medido()
 def cargar_datos():
     try:
-        # Crear archivos si no existen
-        if not os.path.exists(get_file_path('productos.csv')):
-            pd.DataFrame(columns=['Producto', 'Unidad de Medida', 'Tipo de Producto', 'Stock Inicial', 'Stock Minimo']).to_csv(get_file_path('productos.csv'), index=False)
-        
-        if not os.path.exists(get_file_path('entradas.csv')):
-            pd.DataFrame(columns=['Producto', 'Cantidad', 'Fecha']).to_csv(get_file_path('entradas.csv'), index=False)
-        
-        if not os.path.exists(get_file_path('despachos.csv')):
-            pd.DataFrame(columns=['Fecha', 'Cliente', 'Número de Pedido', 'Producto', 'Cantidad']).to_csv(get_file_path('despachos.csv'), index=False)
-
-        productos_df = pd.read_csv(get_file_path('productos.csv'))
-        entradas_df = pd.read_csv(get_file_path('entradas.csv'))
-        despachos_df = pd.read_csv(get_file_path('despachos.csv'))
-        
-        # Conversión segura de fechas
-        for df in [entradas_df, despachos_df]:
-            if 'Fecha' in df.columns:
-                df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce').dt.date
-        
-        return productos_df, entradas_df, despachos_df
+        # Un traspaso interrumpido se completa (o descarta) antes de leer
+        with etapa('recuperar_traspasos'):
+            operaciones.recuperar_traspasos()
+    except Exception as e:
+        st.warning(f"No se pudo completar un traspaso pendiente: {str(e)}")
+    try:
+        # Al empezar un mes, los meses cerrados pasan al histórico
+        with etapa('archivar_si_corresponde'):
+            archivar_si_corresponde()
+    except Exception as e:
+        st.warning(f"No se pudieron archivar los meses cerrados: {str(e)}")
+    try:
+        return cargar_tablas()
     except Exception as e:
         st.error(f"Error cargando datos: {str(e)}")
         return (
-            pd.DataFrame(columns=['Producto', 'Unidad de Medida', 'Tipo de Producto', 'Stock Inicial', 'Stock Minimo']),
-            pd.DataFrame(columns=['Producto', 'Cantidad', 'Fecha']),
-            pd.DataFrame(columns=['Fecha', 'Cliente', 'Número de Pedido', 'Producto', 'Cantidad'])
+            pd.DataFrame(columns=COLUMNAS_PRODUCTOS),
+            pd.DataFrame(columns=COLUMNAS_ENTRADAS),
+            pd.DataFrame(columns=COLUMNAS_DESPACHOS)
         )
 
 # ================================================
 # FUNCIONES DE IMPORTACIÓN/EXPORTACIÓN
 # ================================================
 
+def formulario_importacion(archivo, formato):
+    try:
+        st.dataframe(vista_previa(archivo, formato))
+    except Exception as e:
+        st.error(f"Error al leer el archivo {formato}: {str(e)}")
+        return
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        tipo = st.selectbox("Importar como", ["Productos", "Entradas", "Despachos"], key=f"tipo_importacion_{formato}")
+    with col2:
+        actualizar_stock = st.checkbox(
+            "Sobrescribir stock inicial de productos existentes",
+            key=f"actualizar_stock_{formato}",
+            disabled=tipo != "Productos",
+            help="Por defecto solo los productos nuevos toman el stock del archivo"
+        )
+    st.caption(f"Columnas requeridas: {', '.join(COLUMNAS_REQUERIDAS[tipo])}")
+    
+    if st.button(f"Importar {tipo}", key=f"importar_{formato}"):
+        barra = st.progress(0.0, text="Importando...")
+        try:
+            resultado = importar_archivo(
+                archivo, formato, tipo,
+                actualizar_stock=actualizar_stock,
+                progreso=lambda fraccion, filas: barra.progress(fraccion, text=f"{filas} filas procesadas")
+            )
+        except ErrorImportacion as e:
+            st.error(str(e))
+            return
+        except Exception as e:
+            st.error(f"Error al importar el archivo {formato}: {str(e)}")
+            return
+        
+        barra.progress(1.0, text=f"{resultado['leidas']} filas procesadas")
+        st.success(f"{resultado['importadas']} filas de {tipo.lower()} importadas correctamente!")
+        rechazadas = resultado['rechazadas']
+        if not rechazadas.empty:
+            st.warning(f"{len(rechazadas)} filas rechazadas")
+            st.dataframe(rechazadas.head(1000))
+            st.download_button(
+                label="Descargar filas rechazadas",
+                data=rechazadas.to_csv(index=False).encode('utf-8'),
+                file_name=f"rechazadas_{tipo.lower()}_{datetime.now().strftime('%Y%m%d')}.csv",
+                mime='text/csv',
+                key=f"rechazadas_{formato}"
+            )
+
+@medido()
 def importar_datos():
     st.subheader("Importar Datos")
     
@@ -71,70 +127,53 @@ def importar_datos():
         csv_file = st.file_uploader("Subir archivo CSV", type=['csv'], key='csv_uploader')
         
         if csv_file is not None:
-            try:
-                df = pd.read_csv(csv_file)
-                st.success("Archivo CSV cargado correctamente")
-                st.dataframe(df.head())
-                
-                if st.button("Guardar como Productos"):
-                    # Validar estructura básica
-                    required_cols = ['Producto', 'Unidad de Medida', 'Stock Inicial']
-                    if all(col in df.columns for col in required_cols):
-                        df.to_csv(get_file_path('productos.csv'), index=False)
-                        st.success("Datos de productos guardados correctamente!")
-                        time.sleep(1)
-                        st.rerun()
-                    else:
-                        st.error(f"El archivo CSV debe contener al menos estas columnas: {', '.join(required_cols)}")
-            
-            except Exception as e:
-                st.error(f"Error al leer el archivo CSV: {str(e)}")
+            formulario_importacion(csv_file, 'CSV')
     
     with tab2:
         st.write("Importar desde archivo Excel")
-        excel_file = st.file_uploader("Subir archivo Excel", type=['xlsx', 'xls'], key='excel_uploader')
+        excel_file = st.file_uploader("Subir archivo Excel", type=['xlsx'], key='excel_uploader')
         
         if excel_file is not None:
-            try:
-                df = pd.read_excel(excel_file)
-                st.success("Archivo Excel cargado correctamente")
-                st.dataframe(df.head())
-                
-                if st.button("Guardar como Productos (Excel)"):
-                    # Validar estructura básica
-                    required_cols = ['Producto', 'Unidad de Medida', 'Stock Inicial']
-                    if all(col in df.columns for col in required_cols):
-                        df.to_csv(get_file_path('productos.csv'), index=False)
-                        st.success("Datos de productos guardados correctamente!")
-                        time.sleep(1)
-                        st.rerun()
-                    else:
-                        st.error(f"El archivo Excel debe contener al menos estas columnas: {', '.join(required_cols)}")
-            
-            except Exception as e:
-                st.error(f"Error al leer el archivo Excel: {str(e)}")
+            formulario_importacion(excel_file, 'Excel')
     
     with tab3:
-        st.write("Importar desde archivo PDF (extraer texto)")
+        st.write("Importar pedidos desde archivo PDF")
         pdf_file = st.file_uploader("Subir archivo PDF", type=['pdf'], key='pdf_uploader')
         
         if pdf_file is not None:
             try:
-                with pdfplumber.open(pdf_file) as pdf:
-                    text = ""
-                    for page in pdf.pages:
-                        text += page.extract_text()
-                
-                st.success("Texto extraído del PDF:")
-                st.text_area("Contenido del PDF", value=text, height=300)
-                
-                if st.button("Procesar PDF"):
-                    # Aquí podrías añadir lógica para parsear el texto y convertirlo a DataFrame
-                    st.warning("Esta función necesita implementación específica para tu formato de PDF")
-            
+                with st.spinner("Procesando PDF..."):
+                    clave, pedidos, texto = procesar_pdf(pdf_file.getvalue(), directorio_cache=get_file_path('cache_pdf'))
             except Exception as e:
                 st.error(f"Error al leer el archivo PDF: {str(e)}")
+                return
+            
+            with st.expander("Texto extraído del PDF", expanded=False):
+                st.text_area("Contenido del PDF", value=texto, height=300, key=f"texto_pdf_{clave}")
+            
+            if pedidos.empty:
+                st.warning("No se encontraron tablas de pedido (columnas Producto y Cantidad) en el PDF")
+            else:
+                incompletos = pedidos[COLUMNAS_PEDIDOS].isna().any(axis=1)
+                rechazadas = pedidos['Motivo del rechazo'] != ''
+                st.success(f"{len(pedidos)} líneas de pedido encontradas")
+                if rechazadas.any():
+                    st.warning(f"{int(rechazadas.sum())} líneas con una cantidad que no se pudo leer no se guardarán")
+                    st.dataframe(pedidos[rechazadas])
+                if (incompletos & ~rechazadas).any():
+                    st.warning(f"{int((incompletos & ~rechazadas).sum())} líneas sin cliente, número, fecha o cantidad no se guardarán")
+                st.dataframe(pedidos[~rechazadas].drop(columns=['Motivo del rechazo']))
+                
+                # Hash SHA-256 de los PDF ya guardados en esta sesión: otro clic no repite las líneas
+                guardados = st.session_state.setdefault('pdfs_guardados', set())
+                if clave in guardados:
+                    st.info("Las líneas de este PDF ya se guardaron en pedidos.csv")
+                if st.button("Guardar en pedidos", key=f"guardar_pdf_{clave}", disabled=clave in guardados):
+                    anexar_pedidos(pedidos[~incompletos])
+                    guardados.add(clave)
+                    st.success(f"{int((~incompletos).sum())} líneas agregadas a pedidos.csv")
 
+@medido()
 def exportar_datos(productos_df, entradas_df, despachos_df):
     st.subheader("Exportar Datos")
     
@@ -144,37 +183,81 @@ def exportar_datos(productos_df, entradas_df, despachos_df):
         formato = st.selectbox("Formato de exportación", ["CSV", "Excel"])
     
     with col2:
-        datos = st.selectbox("Datos a exportar", ["Productos", "Entradas", "Despachos"])
+        opciones = ["Productos", "Entradas", "Despachos"] + (["Todo (un libro, una hoja por tabla)"] if formato == "Excel" else [])
+        datos = st.selectbox("Datos a exportar", opciones)
+    if inicio_almacen() is not None:
+        st.caption("Entradas y despachos incluyen los meses archivados en el histórico.")
     
     if st.button("Generar Archivo"):
-        if datos == "Productos":
-            df = productos_df
-        elif datos == "Entradas":
-            df = entradas_df
-        else:
-            df = despachos_df
-        
-        if formato == "CSV":
-            csv = df.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="Descargar CSV",
-                data=csv,
-                file_name=f"{datos.lower()}_{datetime.now().strftime('%Y%m%d')}.csv",
-                mime='text/csv'
-            )
-        else:
-            excel = df.to_excel(index=False, engine='openpyxl')
-            st.download_button(
-                label="Descargar Excel",
-                data=excel,
-                file_name=f"{datos.lower()}_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
+        clave = "Todo" if datos.startswith("Todo") else datos
+        # Se genera en memoria y se reutiliza mientras los datos no cambien
+        archivo = archivo_exportacion(clave, formato)
+        extension, mime = ("csv", MIME_CSV) if formato == "CSV" else ("xlsx", MIME_EXCEL)
+        st.download_button(
+            label=f"Descargar {formato}",
+            data=archivo,
+            file_name=f"{clave.lower()}_{datetime.now().strftime('%Y%m%d')}.{extension}",
+            mime=mime
+        )
+
+# ================================================
+# TABLAS PAGINADAS
+# ================================================
+
+FILAS_POR_PAGINA = [25, 50, 100, 500]
+
+def _ordenar(df, columna, descendente):
+    if isinstance(df[columna].dtype, pd.CategoricalDtype):
+        # Orden alfabético, no el orden en que aparecieron las categorías
+        return df.sort_values(columna, ascending=not descendente, kind='stable',
+                              key=lambda c: c.cat.reorder_categories(sorted(c.cat.categories)))
+    try:
+        return df.sort_values(columna, ascending=not descendente, kind='stable')
+    except TypeError:
+        # Columnas con tipos mezclados (p. ej. números de pedido int y texto)
+        return df.sort_values(columna, ascending=not descendente, kind='stable', key=lambda c: c.astype(str))
+
+def tabla_paginada(df, clave, estilo=None):
+    """Ordena y pagina en el servidor: al navegador solo se envía la página visible."""
+    if df.empty:
+        st.dataframe(df)
+        return
+
+    col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
+    with col1:
+        orden = st.selectbox("Ordenar por", ["(sin orden)"] + list(df.columns), key=f"{clave}_orden")
+    with col2:
+        descendente = st.checkbox("Descendente", key=f"{clave}_desc")
+    with col3:
+        filas = st.selectbox("Filas por página", FILAS_POR_PAGINA, index=1, key=f"{clave}_filas")
+    paginas = max(1, -(-len(df) // filas))
+    with col4:
+        pagina = st.number_input("Página", 1, paginas, step=1, key=f"{clave}_pagina")
+
+    if orden != "(sin orden)":
+        df = _ordenar(df, orden, descendente)
+
+    inicio = (min(pagina, paginas) - 1) * filas
+    visible = df.iloc[inicio:inicio + filas]
+    # Las fechas se guardan como datetime64; en pantalla solo el día
+    fechas = [c for c in visible.columns if pd.api.types.is_datetime64_any_dtype(visible[c].dtype)]
+    if fechas:
+        visible = visible.assign(**{c: visible[c].dt.date for c in fechas})
+    with etapa('tabla', clave=clave, filas=len(visible), estilo=estilo is not None):
+        st.dataframe(visible.style.apply(estilo, axis=None) if estilo else visible)
+    st.caption(f"Filas {inicio + 1}-{inicio + len(visible)} de {len(df)} (página {pagina} de {paginas})")
+
+def resaltar_bajo_stock(df):
+    # Una sola máscara booleana: cada fila contra su propio Stock Minimo
+    estilos = pd.DataFrame('', index=df.index, columns=df.columns)
+    estilos.loc[(df['Stock Actual'] <= df['Stock Minimo']).to_numpy(), 'Stock Actual'] = 'background-color: #ffcccc'
+    return estilos
 
 # ================================================
 # FUNCIONES DE LA APLICACIÓN (MEJORADAS)
 # ================================================
 
+@medido()
 def mostrar_productos(productos_df):
     st.subheader("Inventario de Productos")
     
@@ -183,22 +266,28 @@ def mostrar_productos(productos_df):
     with col1:
         st.metric("Total Productos", len(productos_df))
     with col2:
-        st.metric("Stock Total", productos_df['Stock Inicial'].sum())
+        st.metric("Stock Total", productos_df['Stock Actual'].sum())
     with col3:
-        bajo_stock = productos_df[productos_df['Stock Inicial'] <= productos_df['Stock Minimo']]
+        bajo_stock = productos_df[productos_df['Stock Actual'] <= productos_df['Stock Minimo']]
         st.metric("Productos bajo stock", len(bajo_stock))
     
     # Mostrar tabla con todos los productos
-    st.dataframe(productos_df.style.applymap(
-        lambda x: 'background-color: #ffcccc' if x <= productos_df['Stock Minimo'].iloc[0] else '', 
-        subset=['Stock Inicial']
-    ))
+    tabla_paginada(productos_df, "inventario", estilo=resaltar_bajo_stock)
     
     # Mostrar productos con stock bajo
     if not bajo_stock.empty:
         st.warning("Productos con Stock Bajo el Mínimo")
-        st.dataframe(bajo_stock)
+        tabla_paginada(bajo_stock, "bajo_stock")
+
+    # Sugerencias según el consumo reciente (punto de reorden y días de cobertura)
+    with etapa('reposicion'):
+        sugerencias = reposicion()
+    por_reponer = sugerencias[sugerencias['Reponer']].sort_values('Días de Cobertura', kind='stable')
+    with st.expander(f"Sugerencias de reposición ({len(por_reponer)} productos)"):
+        st.caption("Consumo diario de los últimos 90 días; el punto de reorden cubre el plazo de entrega con stock de seguridad.")
+        tabla_paginada(por_reponer.drop(columns='Reponer'), "reposicion")
 
+@medido()
 def agregar_producto(productos_df):
     st.subheader("Agregar Nuevo Producto")
     
@@ -223,26 +312,31 @@ def agregar_producto(productos_df):
             if not nombre or not unidad:
                 st.error("Por favor complete los campos obligatorios")
             else:
-                nuevo = pd.DataFrame([{
+                nuevo = {
                     "Producto": nombre,
                     "Unidad de Medida": unidad,
                     "Tipo de Producto": tipo,
                     "Stock Inicial": stock_inicial,
                     "Stock Minimo": stock_minimo
-                }])
-                productos_df = pd.concat([productos_df, nuevo], ignore_index=True)
-                productos_df.to_csv(get_file_path('productos.csv'), index=False)
+                }
+                try:
+                    operaciones.agregar_producto(nuevo)
+                except operaciones.ErrorOperacion as e:
+                    st.error(str(e))
+                    return
                 st.success(f"Producto '{nombre}' agregado correctamente!")
                 time.sleep(1)
                 st.rerun()
 
+@medido()
 def editar_producto(productos_df):
     st.subheader("Editar Producto Existente")
     
     seleccion = st.selectbox("Seleccionar Producto a Editar", productos_df['Producto'])
     
     if seleccion:
-        data = productos_df[productos_df['Producto'] == seleccion].iloc[0]
+        indice = indice_productos(productos_df)
+        data = indice.fila(seleccion)
         
         with st.form("editar_form"):
             col1, col2 = st.columns(2)
@@ -256,21 +350,32 @@ def editar_producto(productos_df):
                 )
             
             with col2:
-                nuevo_stock = st.number_input("Stock Actual", value=int(data['Stock Inicial']), min_value=0)
+                nuevo_stock = st.number_input("Stock Actual", value=int(data['Stock Actual']), min_value=0)
                 nuevo_minimo = st.number_input("Stock Mínimo", value=int(data['Stock Minimo']), min_value=0)
             
             if st.form_submit_button("Guardar Cambios"):
-                idx = productos_df[productos_df['Producto'] == seleccion].index[0]
-                productos_df.at[idx, 'Producto'] = nuevo_nombre
-                productos_df.at[idx, 'Unidad de Medida'] = nueva_unidad
-                productos_df.at[idx, 'Stock Inicial'] = nuevo_stock
-                productos_df.at[idx, 'Stock Minimo'] = nuevo_minimo
-                
-                productos_df.to_csv(get_file_path('productos.csv'), index=False)
+                cambios = {
+                    'Producto': nuevo_nombre,
+                    'Unidad de Medida': nueva_unidad,
+                    'Stock Minimo': nuevo_minimo
+                }
+                # Solo se fija el stock si el usuario lo modificó; así no se pisan
+                # los movimientos que otras sesiones registren mientras tanto
+                if nuevo_stock != int(data['Stock Actual']):
+                    cambios['Stock Actual'] = nuevo_stock
+                try:
+                    operaciones.actualizar_producto(seleccion, cambios, data.to_dict())
+                except ConflictoVersion as e:
+                    st.warning(str(e))
+                    return
+                except operaciones.ErrorOperacion as e:
+                    st.error(str(e))
+                    return
                 st.success(f"Producto '{nuevo_nombre}' actualizado correctamente!")
                 time.sleep(1)
                 st.rerun()
 
+@medido()
 def registrar_entrada(productos_df, entradas_df):
     st.subheader("Registrar Entrada de Productos")
     
@@ -295,16 +400,18 @@ def registrar_entrada(productos_df, entradas_df):
                 "Motivo": motivo
             }])
             
-            entradas_df = pd.concat([entradas_df, nueva_entrada], ignore_index=True)
-            productos_df.loc[productos_df['Producto'] == producto, 'Stock Inicial'] += cantidad
-            
-            entradas_df.to_csv(get_file_path('entradas.csv'), index=False)
-            productos_df.to_csv(get_file_path('productos.csv'), index=False)
+            # Solo se anexa la nueva fila; el stock se obtiene al reproducir el diario
+            try:
+                operaciones.registrar_entrada(nueva_entrada)
+            except operaciones.ErrorOperacion as e:
+                st.error(str(e))
+                return
             
             st.success(f"Entrada de {cantidad} unidades para '{producto}' registrada correctamente!")
             time.sleep(1)
             st.rerun()
 
+@medido()
 def registrar_despacho(productos_df, despachos_df):
     st.subheader("Registrar Despacho")
     
@@ -336,9 +443,10 @@ def registrar_despacho(productos_df, despachos_df):
         )
         
         # Cantidades por producto
+        indice = indice_productos(productos_df)
         cantidades = {}
         for p in productos_seleccionados:
-            stock = productos_df.loc[productos_df['Producto'] == p, 'Stock Inicial'].values[0]
+            stock = indice.stock_de(p)
             cantidades[p] = st.number_input(
                 f"Cantidad para {p} (Stock disponible: {stock})",
                 1, stock, step=1,
@@ -355,10 +463,6 @@ def registrar_despacho(productos_df, despachos_df):
                 st.error("Por favor complete todos los campos obligatorios")
                 return
             
-            if numero_pedido in despachos_df['Número de Pedido'].astype(str).values:
-                st.warning("¡Este número de pedido ya existe!")
-                return
-            
             # Registrar el despacho
             nuevos_despachos = []
             for p in productos_seleccionados:
@@ -371,15 +475,22 @@ def registrar_despacho(productos_df, despachos_df):
                     "Cantidad": cantidad
                 }
                 nuevos_despachos.append(nuevo_despacho)
-                productos_df.loc[productos_df['Producto'] == p, 'Stock Inicial'] -= cantidad
             
-            despachos_df = pd.concat([despachos_df, pd.DataFrame(nuevos_despachos)], ignore_index=True)
-            
-            # Guardar los datos
-            despachos_df.to_csv(get_file_path('despachos.csv'), index=False)
-            productos_df.to_csv(get_file_path('productos.csv'), index=False)
+            # Guardar los datos: se revalida con el stock vigente y solo se anexan
+            # las líneas del despacho
+            try:
+                registrado = operaciones.registrar_despacho(pd.DataFrame(nuevos_despachos))
+            except operaciones.PedidoDuplicado:
+                st.warning("¡Este número de pedido ya existe!")
+                return
+            except operaciones.ErrorOperacion as e:
+                st.error(str(e))
+                return
             
-            st.success("Despacho registrado exitosamente!")
+            if registrado:
+                st.success("Despacho registrado exitosamente!")
+            else:
+                st.info("Este despacho ya estaba registrado; no se duplicó.")
             
             # Limpiar el formulario
             st.session_state.despacho_data = {
@@ -391,6 +502,38 @@ def registrar_despacho(productos_df, despachos_df):
             time.sleep(1)
             st.rerun()
 
+@medido()
+def registrar_traspaso(productos_df, bodega):
+    st.subheader("Traspaso a otra Bodega")
+
+    with st.form("traspaso_form", clear_on_submit=True):
+        col1, col2 = st.columns(2)
+
+        with col1:
+            destino = st.selectbox("Bodega de destino*", [b for b in bodegas.disponibles() if b != bodega])
+            producto = st.selectbox("Producto*", productos_df['Producto'])
+
+        with col2:
+            cantidad = st.number_input("Cantidad*", 1, step=1)
+            fecha = st.date_input("Fecha*", value=datetime.today())
+
+        st.markdown("(*) Campos obligatorios")
+
+        if st.form_submit_button("Registrar Traspaso"):
+            # Se registra como despacho en esta bodega y entrada en la de destino
+            try:
+                clave = operaciones.registrar_traspaso(
+                    bodega, destino, pd.DataFrame([{"Producto": producto, "Cantidad": cantidad}]), fecha
+                )
+            except operaciones.ErrorOperacion as e:
+                st.error(str(e))
+                return
+
+            st.success(f"Traspaso {clave}: {cantidad} unidades de '{producto}' enviadas a {destino}")
+            time.sleep(1)
+            st.rerun()
+
+@medido()
 def mostrar_despachos(despachos_df):
     st.subheader("Historial de Despachos")
     
@@ -405,22 +548,10 @@ def mostrar_despachos(despachos_df):
             fecha_inicio = st.date_input("Fecha inicio", value=datetime.today().replace(day=1))
             fecha_fin = st.date_input("Fecha fin", value=datetime.today())
     
-    # Aplicar filtros
-    filtrado = despachos_df.copy()
-    
-    # Check if buscador exists and has value
-    if 'buscador' in locals() and buscador and str(buscador).strip():
-        mask = (
-            filtrado['Cliente'].str.contains(buscador, case=False, na=False) | 
-            filtrado['Número de Pedido'].astype(str).str.contains(buscador, case=False, na=False)
-        )
-        filtrado = filtrado[mask]
-    
-    if fecha_inicio and fecha_fin:
-        filtrado = filtrado[
-            (pd.to_datetime(filtrado['Fecha']).dt.date >= fecha_inicio) &
-            (pd.to_datetime(filtrado['Fecha']).dt.date <= fecha_fin)
-        ]
+    # Aplicar filtros (rango por búsqueda binaria y texto por índice de trigramas;
+    # los meses archivados se leen del histórico)
+    with etapa('filtrar_despachos'):
+        filtrado, solo_recientes = filtrar_despachos(buscador, fecha_inicio, fecha_fin)
     
     # Mostrar resultados
     if not filtrado.empty:
@@ -428,29 +559,22 @@ def mostrar_despachos(despachos_df):
         st.write(f"Mostrando {len(filtrado)} despachos entre {fecha_inicio} y {fecha_fin}")
         
         # Agrupar por cliente
-        grouped = filtrado.groupby('Cliente').agg({
-            'Cantidad': 'sum',
-            'Número de Pedido': 'nunique'
-        }).rename(columns={
-            'Cantidad': 'Total Unidades',
-            'Número de Pedido': 'Total Pedidos'
-        })
+        with etapa('resumen_por_cliente'):
+            grouped = resumen_por_cliente(filtrado, buscador, fecha_inicio, fecha_fin, solo_recientes)
         
         st.dataframe(grouped.sort_values('Total Unidades', ascending=False))
         
-        # Mostrar tabla detallada
-        st.dataframe(filtrado.sort_values('Fecha', ascending=False))
+        # Mostrar tabla detallada (el índice ya la devuelve de más reciente a más antigua)
+        tabla_paginada(filtrado, "historial_despachos")
         
         # Opción de exportación
         if st.button("Exportar a Excel"):
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
-                filtrado.to_excel(tmp.name, index=False)
-                st.download_button(
-                    label="Descargar Excel",
-                    data=open(tmp.name, 'rb').read(),
-                    file_name=f"despachos_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                    mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                )
+            st.download_button(
+                label="Descargar Excel",
+                data=exportar_excel({"Despachos": filtrado, "Resumen por Cliente": grouped.reset_index()}),
+                file_name=f"despachos_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                mime=MIME_EXCEL
+            )
     else:
         st.warning("No se encontraron despachos con los filtros aplicados")
 
@@ -465,14 +589,19 @@ def pagina_principal():
         page_icon="📦"
     )
     
-    # Cargar datos
-    productos_df, entradas_df, despachos_df = cargar_datos()
-    
     # Sidebar
     with st.sidebar:
         st.image("https://via.placeholder.com/150x50?text=MiBodega", width=150)
         st.title("Menú Principal")
-        
+        # La bodega se elige antes de cargar: solo se leen sus archivos
+        bodega = selector_bodega()
+    
+    # Cargar datos
+    productos_df, entradas_df, despachos_df = cargar_datos()
+    # La vista de todas las bodegas solo consulta
+    solo_lectura = bodega == bodegas.CONSOLIDADO
+    
+    with st.sidebar:
         menu = option_menu(
             None, 
             ["📦 Productos", "📥 Entradas", "📤 Despachos", "🔄 Importar/Exportar"],
@@ -481,14 +610,27 @@ def pagina_principal():
         )
         
         st.divider()
-        st.write(f"**Total Productos:** {len(productos_df)}")
-        st.write(f"**Stock Total:** {productos_df['Stock Inicial'].sum()}")
-        st.write(f"**Última Entrada:** {entradas_df['Fecha'].max() if not entradas_df.empty else 'N/A'}")
+        resumen = totales()
+        st.write(f"**Total Productos:** {resumen['productos']}")
+        st.write(f"**Stock Total:** {resumen['stock_total']}")
+        ultima_entrada = resumen['ultima_entrada'] or historico_activo().ultima_fecha('Entrada')
+        st.write(f"**Última Entrada:** {ultima_entrada or 'N/A'}")
     
     # Página principal
     st.title("📦 Gestión de Bodega")
     
-    if menu == "📦 Productos":
+    if solo_lectura:
+        st.info("Vista consolidada de todas las bodegas (solo consulta). Elija una bodega para registrar movimientos.")
+        if menu == "📦 Productos":
+            mostrar_productos(productos_df)
+        elif menu == "📥 Entradas":
+            tabla_paginada(entradas_df, "entradas_consolidadas")
+        elif menu == "📤 Despachos":
+            mostrar_despachos(despachos_df)
+        elif menu == "🔄 Importar/Exportar":
+            exportar_datos(productos_df, entradas_df, despachos_df)
+    
+    elif menu == "📦 Productos":
         tab1, tab2, tab3 = st.tabs(["Inventario", "Agregar Producto", "Editar Producto"])
         
         with tab1:
@@ -504,13 +646,20 @@ def pagina_principal():
         registrar_entrada(productos_df, entradas_df)
     
     elif menu == "📤 Despachos":
-        tab1, tab2 = st.tabs(["Registrar Despacho", "Historial"])
+        pestanas = ["Registrar Despacho", "Historial"]
+        if len(bodegas.disponibles()) > 1:
+            pestanas.append("Traspaso a otra Bodega")
+        tabs = st.tabs(pestanas)
         
-        with tab1:
+        with tabs[0]:
             registrar_despacho(productos_df, despachos_df)
         
-        with tab2:
+        with tabs[1]:
             mostrar_despachos(despachos_df)
+        
+        if len(tabs) > 2:
+            with tabs[2]:
+                registrar_traspaso(productos_df, bodega)
     
     elif menu == "🔄 Importar/Exportar":
         tab1, tab2 = st.tabs(["Importar Datos", "Exportar Datos"])
@@ -521,17 +670,84 @@ def pagina_principal():
         with tab2:
             exportar_datos(productos_df, entradas_df, despachos_df)
 
+    return menu
+
+# ================================================
+# PANEL DE RENDIMIENTO (BODEGA_INSTRUMENTAR=1)
+# ================================================
+
+def panel_instrumentacion(resultado):
+    with st.sidebar.expander("⏱️ Rendimiento del rerun", expanded=False):
+        st.write(f"**Total:** {resultado['total_ms']:.1f} ms ({resultado.get('pagina') or '-'})")
+        if resultado['etapas']:
+            etapas = pd.DataFrame(resultado['etapas'])
+            # Sangría según el anidamiento de la etapa
+            etapas['etapa'] = etapas['nivel'].map(lambda n: '· ' * n) + etapas['etapa']
+            st.dataframe(etapas.drop(columns='nivel'), hide_index=True)
+        for contador, valor in resultado['contadores'].items():
+            st.write(f"**{contador.replace('_', ' ').capitalize()}:** {valor:,}")
+        if st.button("Perfilar el próximo rerun (cProfile)"):
+            st.session_state['perfilar_rerun'] = True
+            st.rerun()
+        if 'perfil_rerun' in st.session_state:
+            st.caption(f"Perfil completo en {get_file_path('perfil_rerun.prof')}")
+            st.code(st.session_state['perfil_rerun'])
+
+def ejecutar_pagina():
+    if not instrumentacion.ACTIVA:
+        pagina_principal()
+        return
+
+    instrumentacion.iniciar_rerun()
+    perfilar = st.session_state.pop('perfilar_rerun', False)
+    ruta_perfil = get_file_path('perfil_rerun.prof')
+    menu = None
+    completo = False
+    try:
+        if perfilar:
+            menu, st.session_state['perfil_rerun'] = instrumentacion.perfilar(pagina_principal, ruta=ruta_perfil)
+        else:
+            menu = pagina_principal()
+        completo = True
+    finally:
+        # st.rerun() y st.stop() cortan la página con una excepción: el registro
+        # y el perfil de ese rerun se guardan igual
+        resultado = instrumentacion.terminar_rerun(pagina=menu)
+        if perfilar and not completo and os.path.exists(ruta_perfil):
+            st.session_state['perfil_rerun'] = instrumentacion.resumen_perfil(ruta_perfil)
+    panel_instrumentacion(resultado)
+
 # ================================================
 # PUNTO DE ENTRADA
 # ================================================
 
+def lanzar_servidor(script_path):
+    """Sirve la app desde este mismo proceso, sin un segundo intérprete para 'streamlit run'.
+
+    Se usa la línea de comandos de Streamlit en proceso, así se respetan sus
+    opciones (--server.port ...) y variables STREAMLIT_*. Los módulos ya
+    importados aquí se reutilizan en el primer rerun y las tablas se cargan
+    en segundo plano mientras arranca el servidor.
+    """
+    from streamlit.web import cli
+
+    threading.Thread(target=cargar_tablas, daemon=True).start()
+    sys.argv = ["streamlit", "run", script_path, "--global.developmentMode=false", *sys.argv[1:]]
+    sys.exit(cli.main())
+
 if __name__ == "__main__":
-    if getattr(sys, 'frozen', False):
+    # Necesario para el pool de procesos del lector de PDF en el ejecutable
+    multiprocessing.freeze_support()
+    if st.runtime.exists():
+        # Rerun dentro del servidor de Streamlit
+        ejecutar_pagina()
+    elif getattr(sys, 'frozen', False):
         base_path = os.path.dirname(sys.executable)
         script_path = os.path.join(base_path, 'app.py')
         if os.path.exists(script_path):
-            subprocess.Popen(["streamlit", "run", script_path])
+            lanzar_servidor(script_path)
         else:
             print("Error: no se encontró 'app.py'.")
     else:
-        pagina_principal()
\ No newline at end of file
+        # 'python app.py' arranca la app igual que el ejecutable
+        lanzar_servidor(os.path.abspath(__file__))
\ No newline at end of file
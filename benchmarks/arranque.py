@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ================================================
+# ARRANQUE EN FRÍO
+# ================================================
+#
+# Mide, cada vez en un proceso nuevo y sobre una copia de datos/:
+#   - servidor_listo: desde lanzar el comando hasta que el servidor responde
+#     en /_stcore/health ('streamlit run app.py' o el lanzador de app.py).
+#   - primer_render: la primera ejecución completa del script (lo que espera
+#     el navegador al abrir la página), con AppTest en un intérprete nuevo.
+#   - importaciones: el bloque de imports de app.py en un intérprete nuevo.
+
+_PRIMER_RENDER = '''
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=300)
+inicio = time.perf_counter()
+at.run()
+primero = time.perf_counter() - inicio
+inicio = time.perf_counter()
+at.run()
+print(json.dumps({'primer_render': primero, 'segundo_render': time.perf_counter() - inicio,
+                  'errores': [e.message for e in at.exception]}))
+'''
+
+_IMPORTACIONES = '''
+import ast, json, sys, time
+arbol = ast.parse(open(sys.argv[1], encoding='utf-8').read())
+imports = ast.Module(body=[n for n in arbol.body if isinstance(n, (ast.Import, ast.ImportFrom))], type_ignores=[])
+codigo = compile(imports, sys.argv[1], 'exec')
+inicio = time.perf_counter()
+exec(codigo, {'__name__': 'app'})
+print(json.dumps({'importaciones': time.perf_counter() - inicio}))
+'''
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _python(codigo, *args, entorno):
+    salida = subprocess.run([sys.executable, '-c', codigo, *args], env=entorno, cwd=RAIZ,
+                            capture_output=True, text=True, check=True)
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+def servidor_listo(comando, entorno, limite=120):
+    """Segundos hasta que el servidor lanzado con ``comando`` responde en /_stcore/health."""
+    puerto = _puerto_libre()
+    entorno = {**entorno, 'STREAMLIT_SERVER_PORT': str(puerto), 'STREAMLIT_SERVER_HEADLESS': 'true',
+               'STREAMLIT_BROWSER_GATHER_USAGE_STATS': 'false'}
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(comando, env=entorno, cwd=RAIZ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - inicio < limite:
+            if proceso.poll() is not None:
+                raise RuntimeError(f"El servidor terminó con código {proceso.returncode}")
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{puerto}/_stcore/health', timeout=1) as r:
+                    if r.status == 200:
+                        return time.perf_counter() - inicio
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError("El servidor no respondió a tiempo")
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide el arranque en frío de la app.")
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--lanzador', action='store_true',
+                        help="Medir también el lanzador en proceso ('python app.py')")
+    parser.add_argument('--salida', help="Guardar los resultados en este JSON")
+    args = parser.parse_args(argv)
+
+    app = os.path.join(RAIZ, 'app.py')
+    datos = tempfile.mkdtemp(prefix='bodega-arranque-')
+    try:
+        shutil.copytree(os.path.join(RAIZ, 'datos'), datos, dirs_exist_ok=True)
+        entorno = {**os.environ, 'BODEGA_DATOS': datos}
+
+        mediciones = {}
+        for _ in range(args.repeticiones):
+            muestras = {
+                'servidor_listo': servidor_listo([sys.executable, '-m', 'streamlit', 'run', app], entorno),
+                **_python(_IMPORTACIONES, app, entorno=entorno),
+            }
+            if args.lanzador:
+                muestras['lanzador_listo'] = servidor_listo([sys.executable, app], entorno)
+            render = _python(_PRIMER_RENDER, app, entorno=entorno)
+            for error in render.pop('errores'):
+                # Se informa, pero no invalida la medición del arranque
+                print(f"Aviso: la app lanzó una excepción al dibujarse: {error}", file=sys.stderr)
+            muestras.update(render)
+            for paso, segundos in muestras.items():
+                mediciones.setdefault(paso, []).append(segundos)
+    finally:
+        shutil.rmtree(datos, ignore_errors=True)
+
+    resultado = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'repeticiones': args.repeticiones,
+        'pasos': {paso: {'segundos': statistics.median(v), 'minimo': min(v)} for paso, v in mediciones.items()},
+    }
+    for paso, valores in resultado['pasos'].items():
+        print(f"{paso:<16} {valores['segundos']:>8.3f}s  (mín. {valores['minimo']:.3f}s)")
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from almacenamiento import COLUMNAS_PRODUCTOS, COLUMNAS_ENTRADAS, COLUMNAS_DESPACHOS, COLUMNAS_PEDIDOS
+
+# ================================================
+# DATOS SINTÉTICOS DE BODEGA
+# ================================================
+#
+# Genera productos.csv, entradas.csv, despachos.csv y pedidos.csv con los
+# mismos esquemas de datos/. ``filas`` es el número de líneas de despacho;
+# entradas, productos y clientes crecen en proporción. Con la misma semilla
+# y la misma fecha final (--hasta, por defecto FECHA_REFERENCIA) se obtienen
+# siempre los mismos archivos, así dos corridas del benchmark miden
+# exactamente los mismos datos, sin importar el día en que se generen.
+
+UNIDADES = ['Unidades', 'Kg', 'Litros', 'Metros']
+TIPOS = ['Material', 'Herramienta', 'Consumible', 'Repuesto']
+MOTIVOS = ['Compra', 'Devolución', 'Ajuste']
+# Último día del historial generado (y fecha de los pedidos pendientes)
+FECHA_REFERENCIA = '2024-12-31'
+
+def _fechas(rng, n, dias, hasta):
+    """``n`` fechas ordenadas de los ``dias`` días que terminan en ``hasta`` (el historial se anexa en orden)."""
+    desplazamientos = np.sort(rng.integers(0, dias, n))[::-1]
+    return (hasta - pd.to_timedelta(desplazamientos, unit='D')).strftime('%Y-%m-%d')
+
+def generar_tablas(filas, semilla=0, dias=365, hasta=FECHA_REFERENCIA):
+    """(productos, entradas, despachos, pedidos) sintéticos con ``filas`` líneas de despacho."""
+    rng = np.random.default_rng(semilla)
+    hasta = pd.Timestamp(hasta).normalize()
+    n_productos = int(np.clip(filas // 1000, 20, 5000))
+    n_clientes = int(np.clip(filas // 100, 10, 20000))
+    n_entradas = max(filas // 10, 1)
+
+    nombres = np.array([f'Producto {i:05d}' for i in range(n_productos)], dtype=object)
+    clientes = np.array([f'Cliente {i:05d}' for i in range(n_clientes)], dtype=object)
+    # Pocos productos concentran la mayoría de los movimientos
+    popularidad = rng.zipf(1.5, n_productos).astype(float)
+    popularidad /= popularidad.sum()
+
+    # Pedidos de 1 a 5 líneas; las líneas de un pedido comparten fecha y cliente
+    lineas = rng.integers(1, 6, filas)
+    lineas = lineas[:np.searchsorted(np.cumsum(lineas), filas) + 1]
+    lineas[-1] -= lineas.sum() - filas
+    n_pedidos = len(lineas)
+    pedido = np.repeat(np.arange(n_pedidos), lineas)
+    despachos = pd.DataFrame({
+        'Fecha': np.asarray(_fechas(rng, n_pedidos, dias, hasta))[pedido],
+        'Cliente': clientes[rng.integers(0, n_clientes, n_pedidos)][pedido],
+        'Número de Pedido': (100000 + pedido).astype(str),
+        'Producto': nombres[rng.choice(n_productos, filas, p=popularidad)],
+        'Cantidad': rng.integers(1, 50, filas),
+    })[COLUMNAS_DESPACHOS]
+
+    entradas = pd.DataFrame({
+        'Producto': nombres[rng.choice(n_productos, n_entradas, p=popularidad)],
+        'Cantidad': rng.integers(10, 500, n_entradas),
+        'Fecha': _fechas(rng, n_entradas, dias, hasta),
+        'Motivo': np.array(MOTIVOS, dtype=object)[rng.integers(0, len(MOTIVOS), n_entradas)],
+    })[COLUMNAS_ENTRADAS]
+
+    # Saldo de apertura suficiente para que ningún producto quede negativo
+    netos = (despachos.groupby('Producto')['Cantidad'].sum()
+             .sub(entradas.groupby('Producto')['Cantidad'].sum(), fill_value=0)
+             .reindex(nombres, fill_value=0).clip(lower=0))
+    productos = pd.DataFrame({
+        'Producto': nombres,
+        'Unidad de Medida': np.array(UNIDADES, dtype=object)[rng.integers(0, len(UNIDADES), n_productos)],
+        'Tipo de Producto': np.array(TIPOS, dtype=object)[rng.integers(0, len(TIPOS), n_productos)],
+        'Stock Inicial': netos.to_numpy().astype('int64') + rng.integers(100, 1000, n_productos),
+        'Stock Minimo': rng.integers(10, 100, n_productos),
+    })[COLUMNAS_PRODUCTOS]
+
+    # Un lote de pedidos pendientes (formato de pedidos.csv) con números nuevos
+    n_pendientes = min(max(filas // 100, 10), 5000)
+    pendientes = pd.DataFrame({
+        'Cliente': clientes[rng.integers(0, n_clientes, n_pendientes)],
+        'Número de Pedido': (100000 + n_pedidos + np.arange(n_pendientes) // 2).astype(str),
+        'Fecha del Pedido': hasta.strftime('%Y-%m-%d'),
+        'Producto': nombres[rng.choice(n_productos, n_pendientes, p=popularidad)],
+        'Cantidad': rng.integers(1, 10, n_pendientes),
+    })[COLUMNAS_PEDIDOS]
+    # Las dos líneas de un pedido van al mismo cliente
+    pendientes['Cliente'] = pendientes.groupby('Número de Pedido')['Cliente'].transform('first')
+
+    return productos, entradas, despachos, pendientes
+
+def generar(directorio, filas, semilla=0, dias=365, hasta=FECHA_REFERENCIA):
+    """Escribe los CSV sintéticos en ``directorio`` y devuelve el número de filas de cada uno."""
+    os.makedirs(directorio, exist_ok=True)
+    tablas = dict(zip(['productos.csv', 'entradas.csv', 'despachos.csv', 'pedidos.csv'],
+                      generar_tablas(filas, semilla, dias, hasta)))
+    for nombre, df in tablas.items():
+        df.to_csv(os.path.join(directorio, nombre), index=False)
+    return {nombre: len(df) for nombre, df in tablas.items()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos de bodega con los esquemas de datos/.")
+    parser.add_argument('directorio', help="Directorio de salida")
+    parser.add_argument('--filas', type=int, default=100000, help="Líneas de despacho (por defecto 100000)")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--dias', type=int, default=365, help="Días de historial (por defecto 365)")
+    parser.add_argument('--hasta', default=FECHA_REFERENCIA,
+                        help=f"Último día del historial, AAAA-MM-DD (por defecto {FECHA_REFERENCIA})")
+    args = parser.parse_args(argv)
+
+    for nombre, n in generar(args.directorio, args.filas, args.semilla, args.dias, args.hasta).items():
+        print(f"{nombre}: {n} filas")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+# ================================================
+# BENCHMARK DE LA BODEGA
+# ================================================
+#
+# Para cada tamaño se generan datos sintéticos (datos_sinteticos.py) en un
+# directorio temporal y los pasos se miden en un proceso nuevo apuntado a
+# ese directorio con BODEGA_DATOS, así cada tamaño arranca con cachés vacías
+# y el pico de memoria del proceso es solo suyo. Se miden las mismas
+# funciones que llama la app: carga, filtros y resumen del historial de
+# despachos, sugerencias de reposición, registro de entradas y despachos,
+# importación, exportación y archivado. Los datos terminan en una fecha
+# fija (--hasta) y el escenario toma ese día como hoy: el mes filtrado y los
+# meses que se archivan no cambian con el calendario. El resultado es un
+# JSON que puede compararse con una corrida anterior (--comparar).
+
+TAMANOS = [1000, 100000, 1000000]
+
+def _rss_mb():
+    # ru_maxrss: kilobytes en Linux, bytes en macOS
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+class Medidor:
+    def __init__(self, memoria=False):
+        self.memoria = memoria
+        self.pasos = []
+
+    def medir(self, paso, funcion, repeticiones=1):
+        """Ejecuta ``funcion`` ``repeticiones`` veces y anota la mediana, el mínimo y la memoria."""
+        if self.memoria:
+            tracemalloc.start()
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            tiempos.append(time.perf_counter() - inicio)
+        registro = {
+            'paso': paso,
+            'segundos': statistics.median(tiempos),
+            'minimo': min(tiempos),
+            'repeticiones': repeticiones,
+            'pico_rss_mb': round(_rss_mb(), 1),
+        }
+        if self.memoria:
+            registro['pico_python_mb'] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+            tracemalloc.stop()
+        self.pasos.append(registro)
+        return resultado
+
+# ================================================
+# ESCENARIO (proceso hijo)
+# ================================================
+
+def escenario(repeticiones, memoria, fecha):
+    """Mide los pasos sobre los datos de BODEGA_DATOS y devuelve la lista de mediciones."""
+    import pandas as pd
+    import almacenamiento
+    import operaciones
+    from almacenamiento import COLUMNAS_DESPACHOS, cargar_tablas, get_file_path
+    from busqueda import filtrar_despachos, resumen_por_cliente
+    from exportacion import archivo_exportacion, exportar_excel
+    from importacion import importar_archivo
+    from reposicion import reposicion
+
+    if almacenamiento.ALMACEN == 'sqlite':
+        almacenamiento.migrar_csv_a_sqlite()
+
+    m = Medidor(memoria)
+    hoy = pd.Timestamp(fecha).normalize()
+    desde, hasta = hoy.replace(day=1).date(), hoy.date()
+
+    # Carga (cargar_datos sin el archivado mensual, que se mide al final)
+    productos_df, _, despachos_df = m.medir('cargar_datos_frio', cargar_tablas)
+    m.medir('cargar_datos_cache', cargar_tablas, repeticiones)
+
+    # Historial de despachos: filtros y resumen por cliente de mostrar_despachos
+    cliente = despachos_df['Cliente'].iloc[-1]
+    m.medir('filtrar_despachos_frio', lambda: filtrar_despachos('', desde, hasta))
+    filtrado, recientes = m.medir('filtrar_despachos_mes', lambda: filtrar_despachos('', desde, hasta), repeticiones)
+    m.medir('filtrar_despachos_texto', lambda: filtrar_despachos(cliente, desde, hasta), repeticiones)
+    m.medir('resumen_clientes_mes', lambda: resumen_por_cliente(filtrado, '', desde, hasta, recientes), repeticiones)
+    filtrado_texto, _ = filtrar_despachos(cliente, desde, hasta)
+    m.medir('resumen_clientes_texto', lambda: resumen_por_cliente(filtrado_texto, cliente, desde, hasta), repeticiones)
+
+    # Sugerencias de reposición de la página de inventario
+    m.medir('reposicion_frio', lambda: reposicion(hoy))
+
+    # Escrituras de la interfaz (una línea por llamada, seguida de la recarga que hace la app)
+    producto = productos_df['Producto'].iloc[0]
+    contador = iter(range(10 ** 9))
+
+    def entrada():
+        operaciones.registrar_entrada(pd.DataFrame([{
+            'Producto': producto, 'Cantidad': 10, 'Fecha': hasta, 'Motivo': 'Benchmark'
+        }]))
+        return cargar_tablas()
+
+    def despacho():
+        operaciones.registrar_despacho(pd.DataFrame([{
+            'Fecha': hasta, 'Cliente': 'Benchmark', 'Número de Pedido': f'B{next(contador)}',
+            'Producto': producto, 'Cantidad': 1
+        }]))
+        return cargar_tablas()
+
+    m.medir('registrar_entrada', entrada, repeticiones)
+    m.medir('registrar_despacho', despacho, repeticiones)
+    m.medir('reposicion_tras_despacho', lambda: reposicion(hoy))
+
+    # Importación de un CSV de despachos (los pedidos pendientes de pedidos.csv)
+    pendientes = pd.read_csv(get_file_path('pedidos.csv'), dtype={'Número de Pedido': str})
+    csv_importacion = pendientes.rename(columns={'Fecha del Pedido': 'Fecha'})[COLUMNAS_DESPACHOS].to_csv(index=False)
+    m.medir('importar_despachos', lambda: importar_archivo(io.BytesIO(csv_importacion.encode('utf-8')), 'CSV', 'Despachos'))
+    cargar_tablas()
+
+    # Exportación: CSV completo y el Excel del historial filtrado
+    m.medir('exportar_csv_despachos', lambda: archivo_exportacion('Despachos', 'CSV'))
+    grouped = resumen_por_cliente(filtrado, '', desde, hasta, recientes)
+    m.medir('exportar_excel_mes', lambda: exportar_excel({'Despachos': filtrado, 'Resumen por Cliente': grouped.reset_index()}))
+
+    # Archivado de los meses cerrados (primera carga del mes en la app)
+    import historico
+    if historico.disponible():
+        m.medir('archivar_meses_cerrados', lambda: almacenamiento.archivar(hoy.replace(day=1)))
+        m.medir('cargar_datos_tras_archivar', cargar_tablas)
+
+    return m.pasos
+
+# ================================================
+# CORRIDA COMPLETA (proceso padre)
+# ================================================
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def medir_tamano(filas, args):
+    from datos_sinteticos import generar
+
+    directorio = tempfile.mkdtemp(prefix=f'bodega-bench-{filas}-')
+    try:
+        inicio = time.perf_counter()
+        archivos = generar(directorio, filas, args.semilla, hasta=args.hasta)
+        generacion = time.perf_counter() - inicio
+
+        comando = [sys.executable, os.path.abspath(__file__), '--escenario', '--repeticiones', str(args.repeticiones),
+                   '--hasta', args.hasta]
+        if args.memoria:
+            comando.append('--memoria')
+        entorno = {**os.environ, 'BODEGA_DATOS': directorio, 'BODEGA_ALMACEN': args.backend}
+        hijo = subprocess.run(comando, env=entorno, capture_output=True, text=True)
+        if hijo.returncode != 0:
+            raise RuntimeError(f"El escenario de {filas} filas falló:\n{hijo.stderr}")
+        pasos = json.loads(hijo.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    return {'filas': filas, 'archivos': archivos, 'generacion_segundos': generacion, 'pasos': pasos}
+
+def comparar(actual, anterior, tolerancia):
+    """Imprime la variación de cada paso respecto a ``anterior`` y devuelve los pasos que empeoraron."""
+    previos = {(r['filas'], p['paso']): p['segundos'] for r in anterior['resultados'] for p in r['pasos']}
+    regresiones = []
+    for resultado in actual['resultados']:
+        for paso in resultado['pasos']:
+            clave = (resultado['filas'], paso['paso'])
+            if clave not in previos or previos[clave] <= 0:
+                continue
+            razon = paso['segundos'] / previos[clave]
+            marca = ''
+            # Por debajo de 10 ms la variación es ruido
+            if razon > 1 + tolerancia and paso['segundos'] > 0.01:
+                marca = '  <-- regresión'
+                regresiones.append(clave)
+            print(f"{clave[0]:>9} {clave[1]:<28} {previos[clave]:>9.4f}s -> {paso['segundos']:>9.4f}s  x{razon:.2f}{marca}")
+    return regresiones
+
+def main(argv=None):
+    from datos_sinteticos import FECHA_REFERENCIA
+
+    parser = argparse.ArgumentParser(description="Mide la app con datos sintéticos de distintos tamaños.")
+    parser.add_argument('--tamanos', type=int, nargs='+', default=TAMANOS, help="Líneas de despacho por corrida")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--hasta', default=FECHA_REFERENCIA,
+                        help=f"Último día de los datos generados, AAAA-MM-DD (por defecto {FECHA_REFERENCIA})")
+    parser.add_argument('--repeticiones', type=int, default=5, help="Repeticiones de los pasos rápidos (se informa la mediana)")
+    parser.add_argument('--backend', choices=['csv', 'sqlite'], default='csv')
+    parser.add_argument('--memoria', action='store_true', help="Medir también el pico de memoria Python por paso (tracemalloc, más lento)")
+    parser.add_argument('--salida', default=None, help="Archivo JSON de resultados (por defecto benchmarks/resultados/AAAAMMDD-HHMMSS.json)")
+    parser.add_argument('--comparar', help="JSON de una corrida anterior con el que comparar")
+    parser.add_argument('--tolerancia', type=float, default=0.2, help="Aumento relativo que cuenta como regresión (por defecto 0.2)")
+    parser.add_argument('--escenario', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.escenario:
+        print(json.dumps(escenario(args.repeticiones, args.memoria, args.hasta)))
+        return 0
+
+    import pandas as pd
+    informe = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'plataforma': platform.platform(),
+        'backend': args.backend,
+        'semilla': args.semilla,
+        'hasta': args.hasta,
+        'repeticiones': args.repeticiones,
+        'resultados': [],
+    }
+    for filas in args.tamanos:
+        print(f"== {filas} filas ==", flush=True)
+        resultado = medir_tamano(filas, args)
+        for paso in resultado['pasos']:
+            print(f"  {paso['paso']:<28} {paso['segundos']:>9.4f}s  (pico RSS {paso['pico_rss_mb']} MB)", flush=True)
+        informe['resultados'].append(resultado)
+
+    salida = args.salida or os.path.join(RAIZ, 'benchmarks', 'resultados', f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"Resultados guardados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            anterior = json.load(f)
+        regresiones = comparar(informe, anterior, args.tolerancia)
+        if regresiones:
+            print(f"{len(regresiones)} pasos más lentos que la corrida anterior (tolerancia {args.tolerancia:.0%})")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
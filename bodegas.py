@@ -0,0 +1,140 @@
+import argparse
+import contextvars
+import os
+import sys
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+# ================================================
+# BODEGAS (UN DIRECTORIO DE DATOS POR BODEGA)
+# ================================================
+#
+# Cada bodega tiene sus propios productos, entradas, despachos, diario,
+# histórico, cerrojos y checkpoints. La bodega principal usa el directorio
+# de datos de siempre y las demás viven en datos/bodegas/<nombre>/, así una
+# instalación con una sola bodega no cambia. La bodega activa es una
+# variable de contexto: cada rerun de Streamlit la fija con el selector de
+# la barra lateral (cada sesión corre en su propio hilo) y get_file_path
+# resuelve las rutas dentro de ella, de modo que solo se leen los archivos
+# de esa bodega. CONSOLIDADO es una bodega virtual de solo lectura que une
+# todas las demás. Las líneas de comando usan BODEGA_NOMBRE.
+
+PRINCIPAL = 'Principal'
+CONSOLIDADO = 'Todas las bodegas'
+SUBDIRECTORIO = 'bodegas'
+
+# Número de pedido (despacho de origen) y motivo (entrada de destino) de los traspasos
+PREFIJO_TRASPASO = 'TRASPASO-'
+
+POR_DEFECTO = os.environ.get('BODEGA_NOMBRE', PRINCIPAL)
+
+_activa = contextvars.ContextVar('bodega', default=POR_DEFECTO)
+
+def directorio_raiz():
+    if os.environ.get('BODEGA_DATOS'):
+        # Directorio de datos alternativo (pruebas de rendimiento, copias de trabajo)
+        return os.environ['BODEGA_DATOS']
+    if getattr(sys, 'frozen', False):
+        return os.path.join(sys._MEIPASS, 'datos')
+    return os.path.join(os.path.dirname(__file__), 'datos')
+
+def directorio(nombre):
+    """Directorio de datos de la bodega (la principal y la vista consolidada usan el raíz)."""
+    if nombre in (PRINCIPAL, CONSOLIDADO):
+        return directorio_raiz()
+    return os.path.join(directorio_raiz(), SUBDIRECTORIO, nombre)
+
+def ruta_comun(archivo):
+    """Ruta de un archivo compartido por todas las bodegas (cerrojos y marcas de traspasos)."""
+    os.makedirs(directorio_raiz(), exist_ok=True)
+    return os.path.join(directorio_raiz(), archivo)
+
+def disponibles():
+    """Nombres de las bodegas, la principal primero."""
+    raiz = os.path.join(directorio_raiz(), SUBDIRECTORIO)
+    otras = sorted(
+        nombre for nombre in os.listdir(raiz)
+        if not nombre.startswith('.') and os.path.isdir(os.path.join(raiz, nombre))
+    ) if os.path.isdir(raiz) else []
+    return [PRINCIPAL] + [nombre for nombre in otras if nombre != PRINCIPAL]
+
+def activa():
+    return _activa.get()
+
+def usar(nombre):
+    """Fija la bodega activa del hilo actual (al comienzo de cada rerun)."""
+    _activa.set(nombre)
+
+@contextmanager
+def en(nombre):
+    """Ejecuta el bloque con ``nombre`` como bodega activa."""
+    token = _activa.set(nombre)
+    try:
+        yield
+    finally:
+        _activa.reset(token)
+
+def validar_nombre(nombre):
+    nombre = str(nombre).strip()
+    if not nombre or nombre.startswith('.') or os.path.basename(nombre) != nombre or '\\' in nombre:
+        raise ValueError(f"Nombre de bodega inválido: '{nombre}'")
+    if nombre in (PRINCIPAL, CONSOLIDADO):
+        raise ValueError(f"'{nombre}' es un nombre reservado")
+    return nombre
+
+def crear(nombre):
+    """Crea el directorio de una bodega nueva (vacía) y devuelve su nombre."""
+    nombre = validar_nombre(nombre)
+    if nombre in disponibles():
+        raise ValueError(f"Ya existe la bodega '{nombre}'")
+    os.makedirs(directorio(nombre))
+    return nombre
+
+def es_traspaso(valores):
+    """Máscara de las filas cuyo número de pedido o motivo corresponde a un traspaso."""
+    if isinstance(valores.dtype, pd.CategoricalDtype):
+        # Se compara cada categoría una vez, no cada fila
+        marcas = np.asarray(valores.cat.categories.str.startswith(PREFIJO_TRASPASO), dtype=bool)
+        codigos = valores.cat.codes.to_numpy()
+        return pd.Series(np.where(codigos >= 0, marcas[codigos], False), index=valores.index)
+    return valores.astype(str).str.startswith(PREFIJO_TRASPASO)
+
+# ================================================
+# LÍNEA DE COMANDOS
+# ================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bodegas de la instalación.")
+    ordenes = parser.add_subparsers(dest='orden', required=True)
+    ordenes.add_parser('listar', help="Muestra las bodegas y su directorio de datos")
+    crear_parser = ordenes.add_parser('crear', help="Crea una bodega vacía")
+    crear_parser.add_argument('nombre')
+    crear_parser.add_argument('--copiar-catalogo', action='store_true',
+                              help="Copia los productos de la bodega principal con stock 0")
+    args = parser.parse_args(argv)
+
+    if args.orden == 'listar':
+        for nombre in disponibles():
+            print(f"{nombre}: {directorio(nombre)}")
+        return 0
+
+    try:
+        nombre = crear(args.nombre)
+    except ValueError as e:
+        print(e)
+        return 1
+    if args.copiar_catalogo:
+        from almacenamiento import COLUMNAS_PRODUCTOS, cargar_tablas, upsert_productos
+        with en(PRINCIPAL):
+            catalogo = cargar_tablas()[0].reindex(columns=COLUMNAS_PRODUCTOS)
+        with en(nombre):
+            upsert_productos(catalogo.assign(**{'Stock Inicial': 0}), actualizar_stock=True)
+        print(f"{len(catalogo)} productos copiados.")
+    print(f"Bodega '{nombre}' creada en {directorio(nombre)}.")
+    return 0
+
+if __name__ == "__main__":
+    # Se usa el módulo importado: almacenamiento lee la bodega activa de ese, no de __main__
+    import bodegas
+    sys.exit(bodegas.main())
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+from almacenamiento import cargar_tablas, cache_derivado, historico_activo, inicio_almacen
+from historico import COLUMNAS_MOVIMIENTO
+from pedidos_despachados import clave_pedido
+from resumenes import acumulados
+
+# ================================================
+# BÚSQUEDA EN EL HISTORIAL DE DESPACHOS
+# ================================================
+#
+# El historial se ordena una vez por fecha ya convertida a datetime64, de modo
+# que un rango de fechas se resuelve con búsqueda binaria. Para el texto se
+# indexan por trigramas los valores distintos de Cliente y Número de Pedido
+# (muchos menos que las líneas); cada línea guarda el código de su valor y el
+# filtro final es una comparación de enteros sobre el rango de fechas.
+# Los meses ya archivados se consultan en el histórico Parquet solo cuando
+# el rango pedido empieza antes del corte.
+
+def _trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+class IndiceTexto:
+    def __init__(self, valores):
+        # Se factoriza antes de convertir a texto: solo se procesan los valores distintos
+        codigos, unicos = pd.factorize(valores)
+        self.codigos = codigos
+        self.valores = [str(v).lower() for v in unicos]
+        self.trigramas = {}
+        for pos, valor in enumerate(self.valores):
+            for trigrama in _trigramas(valor):
+                self.trigramas.setdefault(trigrama, []).append(pos)
+
+    def coincidencias(self, texto):
+        """Códigos de los valores que contienen ``texto`` (sin distinguir mayúsculas)."""
+        texto = texto.lower()
+        if len(texto) < 3:
+            candidatos = range(len(self.valores))
+        else:
+            listas = [self.trigramas.get(t) for t in _trigramas(texto)]
+            if any(lista is None for lista in listas):
+                return np.array([], dtype=np.int64)
+            listas.sort(key=len)
+            candidatos = set(listas[0]).intersection(*listas[1:])
+        return np.array(sorted(c for c in candidatos if texto in self.valores[c]), dtype=np.int64)
+
+class IndiceDespachos:
+    def __init__(self, despachos_df):
+        fechas = pd.to_datetime(despachos_df['Fecha'], errors='coerce').to_numpy()
+        # numpy ordena NaT al final, fuera de cualquier rango de fechas
+        orden = np.argsort(fechas, kind='stable')
+        self.despachos = despachos_df.iloc[orden].reset_index(drop=True)
+        self.fechas = fechas[orden]
+        self.clientes = IndiceTexto(self.despachos['Cliente'])
+        self.pedidos = IndiceTexto(self.despachos['Número de Pedido'])
+
+    def rango(self, desde, hasta):
+        """Posiciones [inicio, fin) de las líneas con fecha entre desde y hasta, inclusive."""
+        inicio = np.searchsorted(self.fechas, np.datetime64(pd.Timestamp(desde)), side='left')
+        fin = np.searchsorted(self.fechas, np.datetime64(pd.Timestamp(hasta)) + np.timedelta64(1, 'D'), side='left')
+        return inicio, fin
+
+    def filtrar(self, texto=None, desde=None, hasta=None):
+        """Despachos del rango de fechas que coinciden con el texto, más recientes primero."""
+        inicio, fin = 0, len(self.despachos)
+        if desde and hasta:
+            inicio, fin = self.rango(desde, hasta)
+
+        posiciones = np.arange(inicio, fin)
+        if texto and str(texto).strip():
+            texto = str(texto).strip()
+            mascara = (
+                np.isin(self.clientes.codigos[inicio:fin], self.clientes.coincidencias(texto)) |
+                np.isin(self.pedidos.codigos[inicio:fin], self.pedidos.coincidencias(texto))
+            )
+            posiciones = posiciones[mascara]
+
+        return self.despachos.iloc[posiciones[::-1]]
+
+def indice_despachos(despachos_df=None):
+    """Índice de búsqueda del historial, construido una vez por versión de datos."""
+    if despachos_df is None or despachos_df is cargar_tablas()[2]:
+        return cache_derivado('indice_despachos', lambda p, e, d: IndiceDespachos(d))
+    return IndiceDespachos(despachos_df)
+
+def _archivados(texto, desde, hasta):
+    """Despachos archivados del rango que coinciden con el texto (solo columnas de despachos)."""
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    # Las salidas del movimientos.csv antiguo se archivan como despachos pero no
+    # tienen cliente ni pedido: no forman parte del historial de despachos
+    filtro = ds.field('Origen') != 'movimientos'
+    if texto and str(texto).strip():
+        texto = str(texto).strip()
+        filtro &= (pc.match_substring(ds.field('Cliente'), texto, ignore_case=True) |
+                   pc.match_substring(ds.field('Número de Pedido'), texto, ignore_case=True))
+    columnas = [c for c in cargar_tablas()[2].columns if c in COLUMNAS_MOVIMIENTO]
+    archivados = historico_activo().consultar(desde, hasta, tipo='Despacho', columnas=columnas, filtro=filtro)
+    return archivados.sort_values('Fecha', kind='stable', ascending=False)
+
+def filtrar_despachos(texto=None, desde=None, hasta=None):
+    """Como IndiceDespachos.filtrar, incluyendo los meses archivados que abarque el rango.
+
+    Devuelve las líneas y si todas salieron del almacén de trabajo.
+    """
+    recientes = indice_despachos().filtrar(texto, desde, hasta)
+    corte = inicio_almacen()
+    if corte is None or (desde and pd.Timestamp(desde) >= corte):
+        return recientes, True
+    hasta_archivo = min(pd.Timestamp(hasta), corte - pd.Timedelta(days=1)) if hasta else corte - pd.Timedelta(days=1)
+    archivados = _archivados(texto, desde, hasta_archivo)
+    if archivados.empty:
+        return recientes, True
+    return pd.concat([recientes, archivados], ignore_index=True), False
+
+def resumen_por_cliente(filtrado, texto, desde, hasta, solo_recientes=True):
+    """Unidades y pedidos distintos por cliente de las líneas mostradas.
+
+    Sin texto de búsqueda se combinan los acumulados diarios del rango; con
+    búsqueda o meses archivados se agrupan las líneas filtradas.
+    """
+    if (texto and str(texto).strip()) or not solo_recientes:
+        # Pedidos contados por clave normalizada ('001' == '1'), como en los acumulados
+        claves = clave_pedido(filtrado['Número de Pedido'])
+        return filtrado.assign(**{'Número de Pedido': claves}).groupby('Cliente', observed=True).agg({
+            'Cantidad': 'sum',
+            'Número de Pedido': 'nunique'
+        }).rename(columns={
+            'Cantidad': 'Total Unidades',
+            'Número de Pedido': 'Total Pedidos'
+        })
+    return acumulados().resumen_clientes(desde, hasta)
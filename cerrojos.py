@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from instrumentacion import contar
+
+# ================================================
+# CERROJOS ENTRE PROCESOS Y ESCRITURA ATÓMICA
+# ================================================
+#
+# Cada recurso ('productos', 'movimientos') tiene su propio cerrojo de
+# archivo, así que registrar un despacho no bloquea a quien reescribe el
+# catálogo. Quien toma los dos lo hace siempre en el orden movimientos,
+# productos. El cerrojo es reentrante dentro del mismo hilo. Las lecturas no
+# toman cerrojo: los archivos completos se reemplazan con os.replace, de modo
+# que un lector ve siempre la versión anterior o la nueva, nunca una a medias.
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _bloquear(f):
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK se rinde tras ~10 s; seguir esperando
+                continue
+
+    def _liberar(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _bloquear(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _liberar(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class _Cerrojo:
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.RLock()
+        self.nivel = 0
+        self.archivo = None
+
+    def adquirir(self):
+        self.local.acquire()
+        if self.nivel == 0:
+            self.archivo = open(self.path, 'a+')
+            _bloquear(self.archivo)
+        self.nivel += 1
+
+    def liberar(self):
+        self.nivel -= 1
+        if self.nivel == 0:
+            try:
+                _liberar(self.archivo)
+            finally:
+                self.archivo.close()
+                self.archivo = None
+        self.local.release()
+
+_cerrojos = {}
+_cerrojo_registro = threading.Lock()
+
+@contextmanager
+def cerrojo(path):
+    """Cerrojo exclusivo (entre hilos y procesos) asociado a ``path``."""
+    with _cerrojo_registro:
+        if path not in _cerrojos:
+            _cerrojos[path] = _Cerrojo(path)
+        c = _cerrojos[path]
+    c.adquirir()
+    try:
+        yield
+    finally:
+        c.liberar()
+
+def reemplazar(temporal, path, intentos=20):
+    # En Windows os.replace falla mientras otro proceso tiene abierto el destino
+    for intento in range(intentos):
+        try:
+            os.replace(temporal, path)
+            return
+        except PermissionError:
+            if intento == intentos - 1:
+                raise
+            time.sleep(0.05)
+
+def _escribir_atomico(path, escribir):
+    temporal = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(temporal, 'w', newline='', encoding='utf-8') as f:
+            escribir(f)
+            contar('bytes_escritos', f.tell())
+            f.flush()
+            os.fsync(f.fileno())
+        reemplazar(temporal, path)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+def escribir_csv_atomico(path, df):
+    """Escribe df en un temporal del mismo directorio y lo coloca con os.replace."""
+    _escribir_atomico(path, lambda f: df.to_csv(f, index=False))
+
+def escribir_texto_atomico(path, texto):
+    _escribir_atomico(path, lambda f: f.write(texto))
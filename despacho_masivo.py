@@ -0,0 +1,184 @@
+import argparse
+import sys
+from datetime import date
+import pandas as pd
+from almacenamiento import (
+    COLUMNAS_DESPACHOS, bloquear, cargar_tablas, despachos_de_pedido, get_file_path,
+    normalizar_pedido, pedidos_despachados, registrar_movimientos
+)
+from operaciones import mismo_despacho
+from pedidos_despachados import clave_pedido
+
+# ================================================
+# DESPACHO MASIVO DE PEDIDOS
+# ================================================
+#
+# Despacha un lote de líneas de pedido (el formato de pedidos.csv) sin pasar
+# por la interfaz. Las validaciones se hacen sobre todo el lote a la vez y
+# cada pedido se acepta o rechaza completo. El stock se asigna en el orden
+# del archivo: un pedido se despacha solo si todas sus líneas caben en lo
+# que dejaron los pedidos anteriores. Todas las líneas aceptadas se escriben
+# en una única operación. Un pedido que ya figura despachado con las mismas
+# líneas se informa como 'Ya despachado', así reenviar el lote no duplica nada.
+
+COLUMNAS_LOTE = ['Cliente', 'Número de Pedido', 'Producto', 'Cantidad']
+COLUMNAS_REPORTE = ['Número de Pedido', 'Cliente', 'Líneas', 'Unidades', 'Estado', 'Motivo']
+
+def _vacio(serie):
+    return serie.isna() | (serie.astype(str).str.strip() == '')
+
+def _normalizar_lote(lote):
+    faltantes = [c for c in COLUMNAS_LOTE if c not in lote.columns]
+    if faltantes:
+        raise ValueError(f"El lote debe contener las columnas: {', '.join(COLUMNAS_LOTE)}")
+
+    lote = lote.reset_index(drop=True)
+    lote = lote.assign(
+        **{
+            'Cliente': lote['Cliente'].astype('string').str.strip(),
+            'Número de Pedido': normalizar_pedido(lote['Número de Pedido']).where(~_vacio(lote['Número de Pedido'])),
+            'Producto': lote['Producto'].astype('string').str.strip(),
+            'Cantidad': pd.to_numeric(lote['Cantidad'], errors='coerce'),
+        }
+    )
+    # Posición de cada pedido según su primera aparición en el lote; una línea
+    # sin número de pedido cuenta como un pedido aparte
+    claves = clave_pedido(lote['Número de Pedido'])
+    orden = pd.Series(pd.factorize(claves)[0], index=lote.index)
+    sin_numero = orden < 0
+    orden[sin_numero] = orden.max() + 1 + pd.RangeIndex(sin_numero.sum())
+    lote['orden'] = orden
+    return lote
+
+def _motivos_por_linea(lote, productos_conocidos, despachados):
+    """Primer motivo de rechazo de cada línea ('' si la línea es válida)."""
+    motivo = pd.Series('', index=lote.index)
+
+    def rechazar(mascara, texto):
+        mascara = mascara.fillna(False).astype(bool)
+        motivo.loc[mascara & (motivo == '')] = texto
+
+    rechazar(lote['Número de Pedido'].isna(), 'Número de pedido vacío')
+    rechazar(despachados, 'Pedido ya despachado')
+    rechazar(_vacio(lote['Cliente']), 'Cliente vacío')
+    rechazar(_vacio(lote['Producto']), 'Producto vacío')
+    rechazar(lote['Cantidad'].isna(), 'Cantidad no numérica')
+    rechazar(lote['Cantidad'] <= 0, 'Cantidad debe ser mayor que cero')
+    rechazar(~lote['Producto'].isin(productos_conocidos), 'Producto no registrado')
+    clientes = lote.groupby('orden')['Cliente'].transform('nunique')
+    rechazar(clientes > 1, 'El pedido tiene más de un cliente')
+    return motivo
+
+def _asignar_stock(lote, stock):
+    """Rechaza, en orden, los pedidos que ya no caben en el stock disponible.
+
+    Cada vuelta calcula la demanda acumulada de todos los pedidos pendientes
+    de una vez; solo el primer pedido que excede el stock se descarta y se
+    recalcula desde ahí, así que hay tantas vueltas como pedidos sin stock.
+    """
+    demanda = lote.groupby(['orden', 'Producto'], sort=True)['Cantidad'].sum().reset_index()
+    disponible = demanda['Producto'].map(stock).fillna(0)
+    rechazados = {}
+    while True:
+        pendientes = ~demanda['orden'].isin(rechazados.keys())
+        acumulado = demanda[pendientes].groupby('Producto')['Cantidad'].cumsum()
+        excede = acumulado > disponible[pendientes]
+        if not excede.any():
+            return rechazados
+        fila = excede.idxmax()
+        cantidad = demanda.at[fila, 'Cantidad']
+        restante = disponible[fila] - (acumulado[fila] - cantidad)
+        rechazados[demanda.at[fila, 'orden']] = (
+            f"Stock insuficiente de {demanda.at[fila, 'Producto']}: solicitado {cantidad:g}, disponible {restante:g}"
+        )
+
+def _repetidos(lote, motivo_pedido):
+    """Pedidos ya despachados cuyo reenvío coincide línea a línea con lo registrado."""
+    repetidos = set()
+    for orden in motivo_pedido.index[motivo_pedido == 'Pedido ya despachado']:
+        lineas = lote[lote['orden'] == orden]
+        if mismo_despacho(despachos_de_pedido(lineas['Número de Pedido'].iloc[0]), lineas):
+            repetidos.add(orden)
+    return repetidos
+
+def _reporte(lote, motivo_pedido, repetidos):
+    resumen = lote.groupby('orden', sort=True).agg(
+        **{
+            'Número de Pedido': ('Número de Pedido', 'first'),
+            'Cliente': ('Cliente', 'first'),
+            'Líneas': ('Producto', 'size'),
+            'Unidades': ('Cantidad', 'sum'),
+        }
+    )
+    resumen['Motivo'] = motivo_pedido.reindex(resumen.index).fillna('')
+    resumen['Estado'] = resumen['Motivo'].map(lambda m: 'Rechazado' if m else 'Despachado')
+    repetido = resumen.index.isin(list(repetidos))
+    resumen.loc[repetido, 'Estado'] = 'Ya despachado'
+    resumen.loc[repetido, 'Motivo'] = ''
+    return resumen.reset_index(drop=True)[COLUMNAS_REPORTE]
+
+def despachar_lote(lote, fecha=None, simular=False):
+    """Despacha las líneas de ``lote`` (columnas de pedidos.csv).
+
+    Devuelve el reporte por pedido ('Estado' y 'Motivo'). Con ``simular`` se
+    valida todo igual pero no se escribe nada.
+    """
+    fecha = fecha or date.today()
+    lote = _normalizar_lote(lote)
+    if lote.empty:
+        return pd.DataFrame(columns=COLUMNAS_REPORTE)
+
+    with bloquear('movimientos'):
+        productos_df = cargar_tablas()[0]
+        stock = productos_df.drop_duplicates('Producto').set_index('Producto')['Stock Actual']
+        despachados = clave_pedido(lote['Número de Pedido']).isin(pedidos_despachados().claves)
+
+        motivo = _motivos_por_linea(lote, stock.index, despachados)
+        # Un pedido con alguna línea inválida se rechaza completo
+        invalidas = lote[motivo != ''].assign(Motivo=motivo[motivo != ''])
+        motivo_pedido = invalidas.groupby('orden')['Motivo'].first()
+
+        candidatas = lote[~lote['orden'].isin(motivo_pedido.index)]
+        sin_stock = _asignar_stock(candidatas, stock)
+        motivo_pedido = pd.concat([motivo_pedido, pd.Series(sin_stock, dtype=object)])
+
+        aceptadas = candidatas[~candidatas['orden'].isin(sin_stock.keys())]
+        if (aceptadas['Cantidad'] % 1 == 0).all():
+            aceptadas = aceptadas.astype({'Cantidad': 'int64'})
+        if not simular and not aceptadas.empty:
+            registrar_movimientos(despachos=aceptadas.assign(Fecha=fecha).reindex(columns=COLUMNAS_DESPACHOS))
+
+    return _reporte(lote, motivo_pedido, _repetidos(lote, motivo_pedido))
+
+# ================================================
+# LÍNEA DE COMANDOS
+# ================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Despacha en bloque los pedidos de un CSV (formato de pedidos.csv).")
+    parser.add_argument('archivo', nargs='?', default=get_file_path('pedidos.csv'), help="CSV de pedidos (por defecto datos/pedidos.csv)")
+    parser.add_argument('--fecha', type=date.fromisoformat, default=None, help="Fecha de despacho AAAA-MM-DD (por defecto hoy)")
+    parser.add_argument('--reporte', help="Guardar el reporte en este CSV")
+    parser.add_argument('--simular', action='store_true', help="Validar sin registrar los despachos")
+    args = parser.parse_args(argv)
+
+    lote = pd.read_csv(args.archivo, dtype={'Número de Pedido': str})
+    reporte = despachar_lote(lote, fecha=args.fecha, simular=args.simular)
+
+    despachados = reporte[reporte['Estado'] == 'Despachado']
+    rechazados = reporte[reporte['Estado'] == 'Rechazado']
+    accion = "Se despacharían" if args.simular else "Despachados"
+    print(f"{accion}: {len(despachados)} pedidos ({despachados['Unidades'].sum():g} unidades)")
+    repetidos = (reporte['Estado'] == 'Ya despachado').sum()
+    if repetidos:
+        print(f"Ya despachados anteriormente (sin cambios): {repetidos} pedidos")
+    print(f"Rechazados: {len(rechazados)} pedidos")
+    if not rechazados.empty:
+        print(rechazados[['Número de Pedido', 'Cliente', 'Motivo']].to_string(index=False))
+    if args.reporte:
+        reporte.to_csv(args.reporte, index=False)
+        print(f"Reporte guardado en {args.reporte}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
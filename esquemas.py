@@ -0,0 +1,171 @@
+import os
+import numpy as np
+import pandas as pd
+
+# ================================================
+# TIPOS DE LAS TABLAS EN MEMORIA
+# ================================================
+#
+# Cada tabla se carga con tipos explícitos en lugar de la inferencia de
+# read_csv:
+#   - categoria: texto que se repite en muchas filas (producto, cliente,
+#     unidad, pedido). Se guarda un código entero por fila y cada valor
+#     distinto una sola vez; las categorías son siempre texto, así '0777'
+#     conserva el cero y no se mezclan números y cadenas.
+#   - cantidad: int64 si todos los valores son enteros, si no float64. No se
+#     usa un entero más angosto: algunos groupby().sum() de pandas conservan
+#     el tipo de la columna y desbordarían sin avisar.
+#   - fecha: datetime64, así filtros y ordenamientos son operaciones numpy
+#     y no comparaciones de objetos date de Python.
+#   - texto: texto libre (motivo), que se deja como objeto.
+# En productos la columna 'Producto' no es categórica: tiene un valor
+# distinto por fila y es la clave de los .map() del stock.
+#
+# BODEGA_MOTOR_CSV=pyarrow lee los CSV con pyarrow.csv (multihilo, las
+# categorías salen directamente como diccionarios de Arrow). Si el archivo
+# tiene algo que Arrow no acepta (una fecha inválida, por ejemplo) se vuelve
+# a leer con el motor C de pandas, que es el predeterminado.
+
+ESQUEMAS = {
+    'productos': {
+        'Unidad de Medida': 'categoria',
+        'Tipo de Producto': 'categoria',
+        'Stock Inicial': 'cantidad',
+        'Stock Minimo': 'cantidad',
+    },
+    'entradas': {
+        'Producto': 'categoria',
+        'Cantidad': 'cantidad',
+        'Fecha': 'fecha',
+        'Motivo': 'texto',
+    },
+    'despachos': {
+        'Fecha': 'fecha',
+        'Cliente': 'categoria',
+        'Número de Pedido': 'categoria',
+        'Producto': 'categoria',
+        'Cantidad': 'cantidad',
+    },
+    'diario': {
+        'Tipo': 'categoria',
+        'Fecha': 'fecha',
+        'Producto': 'categoria',
+        'Cantidad': 'cantidad',
+        'Cliente': 'categoria',
+        'Número de Pedido': 'categoria',
+        'Motivo': 'texto',
+    },
+}
+
+MOTOR_CSV = os.environ.get('BODEGA_MOTOR_CSV', 'c').lower()
+
+def _cantidad(serie):
+    valores = pd.to_numeric(serie, errors='coerce')
+    if pd.api.types.is_integer_dtype(valores.dtype):
+        return valores.astype('int64')
+    if valores.notna().all() and bool((valores % 1 == 0).all()):
+        return valores.astype('int64')
+    return valores.astype('float64')
+
+def _fecha(serie):
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        return serie
+    return pd.to_datetime(serie, errors='coerce')
+
+def _solo_texto(valores):
+    return pd.api.types.infer_dtype(valores, skipna=True) in ('string', 'empty')
+
+def _categoria(serie):
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        if _solo_texto(serie.cat.categories):
+            return serie
+        serie = serie.astype(object)
+    # factorize en lugar de astype('category'): no ordena las categorías
+    # (con cientos de miles de pedidos distintos, ordenarlas es lo más caro)
+    codigos, unicos = pd.factorize(serie)
+    if not _solo_texto(unicos):
+        # Columna leída sin dtype (números o tipos mezclados): 1 y '1' son la misma categoría
+        recodigos, unicos = pd.factorize(pd.Index(unicos).astype(str))
+        codigos = np.where(codigos >= 0, recodigos[codigos], -1)
+    return pd.Series(pd.Categorical.from_codes(codigos, unicos), index=serie.index, name=serie.name)
+
+def _texto(serie):
+    return serie
+
+_CONVERSIONES = {'categoria': _categoria, 'cantidad': _cantidad, 'fecha': _fecha, 'texto': _texto}
+
+def tipar(df, tabla):
+    """Devuelve ``df`` con los tipos del esquema de ``tabla`` (las columnas ajenas quedan igual)."""
+    cambios = {
+        columna: _CONVERSIONES[tipo](df[columna])
+        for columna, tipo in ESQUEMAS[tabla].items() if columna in df.columns
+    }
+    return df.assign(**cambios) if cambios else df
+
+def concatenar(base, extra):
+    """Une dos tablas tipadas sin que las columnas categóricas pasen a objeto.
+
+    pd.concat solo conserva una categórica si ambas partes tienen las mismas
+    categorías: se agregan a ``base`` las de ``extra`` que faltan (sus códigos
+    no cambian) y ``extra``, que suele ser la parte chica, se recodifica con
+    el mismo dtype de ``base``. Compartir el objeto dtype evita que pandas
+    compare las categorías por hash (cientos de miles de pedidos) en cada unión.
+    """
+    if extra.empty:
+        return base
+    if base.empty:
+        return extra.reindex(columns=list(dict.fromkeys(list(base.columns) + list(extra.columns))))
+    base, extra = base.copy(deep=False), extra.copy(deep=False)
+    for columna in base.columns.intersection(extra.columns):
+        a, b = base[columna], extra[columna]
+        if not (isinstance(a.dtype, pd.CategoricalDtype) and isinstance(b.dtype, pd.CategoricalDtype)):
+            continue
+        if a.dtype is b.dtype:
+            continue
+        posiciones = a.cat.categories.get_indexer(b.cat.categories)
+        faltan = posiciones < 0
+        if faltan.any():
+            a = a.cat.add_categories(b.cat.categories[faltan])
+            posiciones[faltan] = len(a.cat.categories) - faltan.sum() + np.arange(faltan.sum())
+            base[columna] = a
+        codigos = b.cat.codes.to_numpy()
+        codigos = np.where(codigos >= 0, posiciones[codigos], -1)
+        extra[columna] = pd.Categorical.from_codes(codigos, dtype=a.dtype)
+    return pd.concat([base, extra], ignore_index=True)
+
+def editable(df):
+    """Copia de ``df`` en la que se puede asignar cualquier valor (las categóricas pasan a objeto)."""
+    df = df.copy()
+    for columna in df.columns:
+        if isinstance(df[columna].dtype, pd.CategoricalDtype):
+            df[columna] = df[columna].astype(object)
+    return df
+
+# ================================================
+# LECTURA DE CSV
+# ================================================
+
+def _leer_pyarrow(path, esquema):
+    import pyarrow as pa
+    import pyarrow.csv as pv
+
+    tipos = {'categoria': pa.dictionary(pa.int32(), pa.string()), 'fecha': pa.timestamp('ns'), 'texto': pa.string()}
+    opciones = pv.ConvertOptions(
+        column_types={columna: tipos[tipo] for columna, tipo in esquema.items() if tipo in tipos},
+        strings_can_be_null=True,
+    )
+    return pv.read_csv(path, convert_options=opciones).to_pandas()
+
+def leer_csv(path, tabla):
+    """Lee un CSV de datos con los tipos de ESQUEMAS[tabla]."""
+    esquema = ESQUEMAS[tabla]
+    if MOTOR_CSV == 'pyarrow':
+        try:
+            return tipar(_leer_pyarrow(path, esquema), tabla)
+        except (ImportError, ValueError):
+            # pyarrow.lib.ArrowInvalid es un ValueError
+            pass
+    # El motor C no tiene tipo fecha y su dtype 'category'
+    # ordena las categorías: se lee texto y se convierte después
+    dtype = {columna: str for columna, tipo in esquema.items() if tipo in ('categoria', 'texto')}
+    return tipar(pd.read_csv(path, dtype=dtype), tabla)
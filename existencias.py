@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import threading
+import pandas as pd
+from cerrojos import reemplazar
+
+# ================================================
+# VISTA MATERIALIZADA DEL STOCK ACTUAL
+# ================================================
+#
+# El stock actual no se guarda: es el saldo de apertura ('Stock Inicial')
+# más las entradas menos los despachos. La vista mantiene el movimiento neto
+# por producto y las filas de cada tabla que ya incluye; al cambiar los datos
+# solo se aplican las filas nuevas. Cada INTERVALO_CHECKPOINT filas, y cada
+# vez que se recalcula desde cero, se guarda un checkpoint en disco para que
+# un arranque en frío reproduzca solo la cola. El checkpoint lleva el corte
+# del archivado: si se archivó después, las filas que cubría ya están en el
+# saldo de apertura y no sirve aunque coincida la huella de la última fila.
+
+INTERVALO_CHECKPOINT = 5000
+
+def _cantidades(df):
+    return pd.to_numeric(df['Cantidad'], errors='coerce').fillna(0)
+
+def _por_producto(df):
+    # Producto es categórico: solo los productos presentes, con índice de texto
+    # para alinear netos de tablas con categorías distintas
+    suma = _cantidades(df).groupby(df['Producto'], observed=True).sum()
+    return suma.set_axis(suma.index.astype(object))
+
+def movimientos_netos(entradas_df, despachos_df):
+    """Entradas menos despachos por producto, en una sola pasada vectorizada."""
+    return _por_producto(entradas_df).sub(_por_producto(despachos_df), fill_value=0)
+
+def aplicar_stock(productos_df, netos):
+    """Devuelve productos_df con la columna calculada 'Stock Actual'."""
+    apertura = pd.to_numeric(productos_df['Stock Inicial'], errors='coerce').fillna(0)
+    stock = apertura + productos_df['Producto'].map(netos).fillna(0)
+    if pd.api.types.is_integer_dtype(productos_df['Stock Inicial'].dtype) and (stock % 1 == 0).all():
+        stock = stock.astype('int64')
+    return productos_df.assign(**{'Stock Actual': stock})
+
+def huella_filas(df, filas):
+    """Identifica la última fila incluida para detectar historiales reescritos."""
+    if filas == 0:
+        return ''
+    fila = df.iloc[filas - 1]
+    texto = f"{fila['Producto']}|{float(pd.to_numeric(fila['Cantidad'], errors='coerce') or 0)}|{fila['Fecha']}"
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+class VistaStock:
+    def __init__(self, ruta_checkpoint):
+        self.ruta_checkpoint = ruta_checkpoint
+        self.netos = pd.Series(dtype='float64')
+        self.filas = {'entradas': 0, 'despachos': 0}
+        self.huellas = {'entradas': '', 'despachos': ''}
+        self.corte = None
+        self.filas_checkpoint = None
+        self.iniciada = False
+        self._cerrojo = threading.Lock()
+
+    def _cubre(self, filas, huellas, entradas_df, despachos_df):
+        for nombre, df in [('entradas', entradas_df), ('despachos', despachos_df)]:
+            if filas[nombre] > len(df) or huellas[nombre] != huella_filas(df, filas[nombre]):
+                return False
+        return True
+
+    def _cargar_checkpoint(self, entradas_df, despachos_df, corte):
+        try:
+            with open(self.ruta_checkpoint, encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            if checkpoint.get('corte') != corte:
+                return False
+            if not self._cubre(checkpoint['filas'], checkpoint['huellas'], entradas_df, despachos_df):
+                return False
+        except (OSError, ValueError, KeyError):
+            return False
+        self.netos = pd.Series(checkpoint['netos'], dtype='float64')
+        self.filas, self.huellas = checkpoint['filas'], checkpoint['huellas']
+        self.corte = corte
+        self.filas_checkpoint = sum(self.filas.values())
+        return True
+
+    def _guardar_checkpoint(self):
+        checkpoint = {
+            'corte': self.corte,
+            'filas': self.filas,
+            'huellas': self.huellas,
+            'netos': {str(p): float(v) for p, v in self.netos.items()},
+        }
+        # Temporal propio de cada proceso: varias instancias pueden guardar a la vez
+        temporal = f'{self.ruta_checkpoint}.{os.getpid()}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        reemplazar(temporal, self.ruta_checkpoint)
+        self.filas_checkpoint = sum(self.filas.values())
+
+    def _intentar_guardar(self):
+        try:
+            self._guardar_checkpoint()
+        except OSError:
+            # El checkpoint solo acelera el arranque; sin él se recalcula
+            pass
+
+    def recalcular(self, entradas_df, despachos_df, corte=None):
+        self.netos = movimientos_netos(entradas_df, despachos_df)
+        self.filas = {'entradas': len(entradas_df), 'despachos': len(despachos_df)}
+        self.huellas = {'entradas': huella_filas(entradas_df, len(entradas_df)),
+                        'despachos': huella_filas(despachos_df, len(despachos_df))}
+        self.corte = corte
+        # El historial pudo acortarse (archivado): el checkpoint anterior ya no vale
+        self._intentar_guardar()
+
+    def descartar(self):
+        """Borra el checkpoint y obliga a recalcular en la próxima actualización."""
+        with self._cerrojo:
+            if os.path.exists(self.ruta_checkpoint):
+                os.remove(self.ruta_checkpoint)
+            self.iniciada = False
+            self.filas_checkpoint = None
+
+    def actualizar(self, entradas_df, despachos_df, corte=None):
+        """Pone la vista al día con las tablas y devuelve el neto por producto.
+
+        ``corte`` es el corte del archivado vigente ('AAAA-MM-DD' o None).
+        """
+        with self._cerrojo:
+            vigente = (self.iniciada and self.corte == corte
+                       and self._cubre(self.filas, self.huellas, entradas_df, despachos_df))
+            if not vigente and not self._cargar_checkpoint(entradas_df, despachos_df, corte):
+                self.recalcular(entradas_df, despachos_df, corte)
+            else:
+                # Aplicar solo los movimientos posteriores a lo ya incluido
+                cola = movimientos_netos(entradas_df.iloc[self.filas['entradas']:],
+                                         despachos_df.iloc[self.filas['despachos']:])
+                if not cola.empty:
+                    self.netos = self.netos.add(cola, fill_value=0)
+                self.filas = {'entradas': len(entradas_df), 'despachos': len(despachos_df)}
+                self.huellas = {'entradas': huella_filas(entradas_df, len(entradas_df)),
+                                'despachos': huella_filas(despachos_df, len(despachos_df))}
+            self.iniciada = True
+
+            if self.filas_checkpoint is None or sum(self.filas.values()) - self.filas_checkpoint >= INTERVALO_CHECKPOINT:
+                self._intentar_guardar()
+            return self.netos
+
+_vistas = {}
+
+def vista_stock(ruta_checkpoint):
+    if ruta_checkpoint not in _vistas:
+        _vistas[ruta_checkpoint] = VistaStock(ruta_checkpoint)
+    return _vistas[ruta_checkpoint]
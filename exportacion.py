@@ -0,0 +1,86 @@
+import io
+import pandas as pd
+from almacenamiento import cache_derivado, historico_activo
+import esquemas
+import historico
+
+# ================================================
+# EXPORTACIÓN EN MEMORIA
+# ================================================
+#
+# Los archivos se generan directamente en un búfer en memoria (sin archivos
+# temporales). Excel usa el modo write-only de openpyxl, que escribe las
+# filas en streaming sin mantener la hoja completa en memoria. Los archivos
+# generados se guardan por versión de datos y formato, de modo que repetir
+# la descarga no los vuelve a generar. Entradas y despachos incluyen los
+# meses archivados en el histórico: se leen y escriben de a un mes, antes
+# de las filas del almacén de trabajo, así que el archivo sigue teniendo
+# todo el historial sin cargarlo entero en memoria.
+
+MIME_CSV = 'text/csv'
+MIME_EXCEL = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+def _partes(tabla):
+    """Una tabla es un DataFrame o una secuencia de DataFrames con las mismas columnas."""
+    return [tabla] if isinstance(tabla, pd.DataFrame) else tabla
+
+def exportar_csv(tabla):
+    buffer = io.StringIO()
+    for i, df in enumerate(_partes(tabla)):
+        df.to_csv(buffer, index=False, header=i == 0)
+    return buffer.getvalue().encode('utf-8')
+
+def exportar_excel(hojas):
+    """Genera un libro .xlsx con una hoja por cada (nombre, tabla) de ``hojas``."""
+    import openpyxl
+
+    libro = openpyxl.Workbook(write_only=True)
+    for nombre, tabla in hojas.items():
+        hoja = libro.create_sheet(title=nombre[:31])
+        for i, df in enumerate(_partes(tabla)):
+            if i == 0:
+                hoja.append([str(c) for c in df.columns])
+            # Fechas datetime64 como días (sin hora) en la celda
+            fechas = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c].dtype)]
+            if fechas:
+                df = df.assign(**{c: df[c].dt.date for c in fechas})
+            # object + where: enteros numpy a int de Python y NaN/NaT a celdas vacías
+            valores = df.astype(object).where(df.notna(), None)
+            for fila in valores.itertuples(index=False, name=None):
+                hoja.append(fila)
+
+    buffer = io.BytesIO()
+    libro.save(buffer)
+    return buffer.getvalue()
+
+def _con_archivados(tabla, tipo, df):
+    """Los meses archivados de ``tipo`` ('Entrada' o 'Despacho'), de a uno, y luego ``df``."""
+    archivo = historico_activo()
+    if historico.disponible():
+        import pyarrow.dataset as ds
+
+        columnas = [c for c in df.columns if c in historico.COLUMNAS_MOVIMIENTO]
+        for mes in archivo.meses():
+            inicio = pd.Timestamp(f'{mes}-01')
+            # Sin las filas del movimientos.csv antiguo, que no eran parte de estas tablas
+            filas = archivo.consultar(inicio, inicio + pd.offsets.MonthEnd(0), tipo=tipo, columnas=columnas,
+                                      filtro=ds.field('Origen') != 'movimientos')
+            if not filas.empty:
+                yield esquemas.tipar(filas.reindex(columns=df.columns), tabla)
+    yield df
+
+def archivo_exportacion(datos, formato):
+    """Bytes del archivo pedido ('Productos', 'Entradas', 'Despachos' o 'Todo'), por versión de datos."""
+    def generar(productos_df, entradas_df, despachos_df):
+        tablas = {
+            'Productos': productos_df,
+            'Entradas': _con_archivados('entradas', 'Entrada', entradas_df),
+            'Despachos': _con_archivados('despachos', 'Despacho', despachos_df),
+        }
+        if datos == 'Todo':
+            return exportar_excel(tablas)
+        if formato == 'CSV':
+            return exportar_csv(tablas[datos])
+        return exportar_excel({datos: tablas[datos]})
+
+    return cache_derivado(f'exportacion_{datos}_{formato}', generar)
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import pandas as pd
+from bodegas import es_traspaso
+from cerrojos import reemplazar
+
+# ================================================
+# HISTÓRICO EN PARQUET POR MES
+# ================================================
+#
+# Los meses cerrados salen del almacén de trabajo y se guardan aquí en un
+# único esquema de movimientos, comprimidos en Parquet y particionados por
+# mes (historico/mes=AAAA-MM/*.parquet). Las consultas leen solo las
+# particiones del rango pedido y solo las columnas necesarias. Cada lote
+# archivado es un archivo propio cuyo nombre sale de su contenido, así
+# repetir un archivado interrumpido no duplica filas. El antiguo
+# movimientos.csv (esquema en inglés) se incorpora como otro origen más.
+
+COLUMNAS_MOVIMIENTO = [
+    'Fecha', 'Tipo', 'Producto', 'Cantidad', 'Cliente', 'Número de Pedido', 'Motivo', 'Responsable', 'Origen'
+]
+
+COMPRESION = 'zstd'
+
+# Esquema de datos/movimientos.csv
+_COLUMNAS_MOVIMIENTOS_CSV = {
+    'Product Name': 'Producto',
+    'Movement Type': 'Tipo',
+    'Quantity': 'Cantidad',
+    'Date': 'Fecha',
+    'Responsible Person': 'Responsable',
+}
+_TIPOS_MOVIMIENTOS_CSV = {'Entrada': 'Entrada', 'Salida': 'Despacho'}
+
+def disponible():
+    """El histórico necesita pyarrow; sin él la app sigue trabajando solo con el almacén."""
+    try:
+        import pyarrow.dataset  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _esquema():
+    import pyarrow as pa
+    return pa.schema([
+        ('Fecha', pa.date32()),
+        ('Tipo', pa.string()),
+        ('Producto', pa.string()),
+        ('Cantidad', pa.float64()),
+        ('Cliente', pa.string()),
+        ('Número de Pedido', pa.string()),
+        ('Motivo', pa.string()),
+        ('Responsable', pa.string()),
+        ('Origen', pa.string()),
+    ])
+
+def _texto(serie):
+    return serie.astype('string').str.strip().astype(object).where(serie.notna(), None)
+
+def normalizar(entradas_df=None, despachos_df=None, movimientos_df=None):
+    """Une entradas, despachos y movimientos.csv en el esquema COLUMNAS_MOVIMIENTO."""
+    partes = []
+    if entradas_df is not None and not entradas_df.empty:
+        partes.append(entradas_df.assign(Tipo='Entrada', Origen='entradas'))
+    if despachos_df is not None and not despachos_df.empty:
+        partes.append(despachos_df.assign(Tipo='Despacho', Origen='despachos'))
+    if movimientos_df is not None and not movimientos_df.empty:
+        movimientos_df = movimientos_df.rename(columns=_COLUMNAS_MOVIMIENTOS_CSV)
+        partes.append(movimientos_df.assign(
+            Tipo=movimientos_df['Tipo'].map(_TIPOS_MOVIMIENTOS_CSV).fillna(movimientos_df['Tipo']),
+            Origen='movimientos'
+        ))
+    if not partes:
+        return pd.DataFrame(columns=COLUMNAS_MOVIMIENTO)
+
+    # Sin las columnas vacías de cada parte (Cliente en entradas, Motivo en
+    # despachos): pandas deja de ignorarlas al deducir el tipo al concatenar
+    movimientos = pd.concat(
+        [p.reindex(columns=COLUMNAS_MOVIMIENTO).dropna(axis=1, how='all') for p in partes], ignore_index=True
+    ).reindex(columns=COLUMNAS_MOVIMIENTO)
+    movimientos['Fecha'] = pd.to_datetime(movimientos['Fecha'], errors='coerce')
+    movimientos['Cantidad'] = pd.to_numeric(movimientos['Cantidad'], errors='coerce')
+    for columna in ['Tipo', 'Producto', 'Cliente', 'Número de Pedido', 'Motivo', 'Responsable', 'Origen']:
+        movimientos[columna] = _texto(movimientos[columna])
+    # Un número de pedido leído como float (p. ej. '777.0') se guarda como texto entero
+    movimientos['Número de Pedido'] = movimientos['Número de Pedido'].str.replace(r'^(\d+)\.0$', r'\1', regex=True)
+    return movimientos.dropna(subset=['Fecha'])
+
+class Historico:
+    def __init__(self, directorio):
+        self.directorio = directorio
+
+    def _ruta_mes(self, mes):
+        return os.path.join(self.directorio, f'mes={mes}')
+
+    def meses(self):
+        if not os.path.isdir(self.directorio):
+            return []
+        return sorted(
+            nombre[4:] for nombre in os.listdir(self.directorio)
+            if nombre.startswith('mes=') and os.listdir(os.path.join(self.directorio, nombre))
+        )
+
+    # ----- estado -----
+
+    def _ruta_estado(self):
+        # Con '_' delante pyarrow no lo toma como parte del dataset
+        return os.path.join(self.directorio, '_estado.json')
+
+    def corte(self):
+        """Primer día que sigue en el almacén de trabajo (lo anterior está archivado)."""
+        try:
+            with open(self._ruta_estado(), encoding='utf-8') as f:
+                return pd.Timestamp(json.load(f)['corte'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def marcar_corte(self, corte):
+        os.makedirs(self.directorio, exist_ok=True)
+        temporal = f'{self._ruta_estado()}.{os.getpid()}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump({'corte': pd.Timestamp(corte).strftime('%Y-%m-%d')}, f)
+        reemplazar(temporal, self._ruta_estado())
+
+    # ----- escritura -----
+
+    def preparar(self, movimientos, nombre=None):
+        """Reparte los movimientos por mes: {ruta del archivo: filas}.
+
+        Sin ``nombre`` cada archivo se llama como el hash de su contenido;
+        con ``nombre`` se usa ese (y reescribir reemplaza el mes completo).
+        """
+        lotes = {}
+        for mes, filas in movimientos.groupby(movimientos['Fecha'].dt.strftime('%Y-%m')):
+            filas = filas.sort_values('Fecha', kind='stable').reset_index(drop=True)
+            if nombre is None:
+                contenido = filas.to_csv(index=False).encode('utf-8')
+                archivo = f'lote-{hashlib.sha1(contenido).hexdigest()[:16]}.parquet'
+            else:
+                archivo = f'{nombre}.parquet'
+            lotes[os.path.join(self._ruta_mes(mes), archivo)] = filas
+        return lotes
+
+    def escribir(self, lotes):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        for ruta, filas in lotes.items():
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            tabla = pa.Table.from_pandas(
+                filas.assign(Fecha=filas['Fecha'].dt.date).reindex(columns=COLUMNAS_MOVIMIENTO),
+                schema=_esquema(), preserve_index=False
+            )
+            temporal = os.path.join(os.path.dirname(ruta), f'.{os.path.basename(ruta)}.{os.getpid()}.tmp')
+            pq.write_table(tabla, temporal, compression=COMPRESION)
+            reemplazar(temporal, ruta)
+
+    def eliminar(self, rutas):
+        for ruta in rutas:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+
+    # ----- consultas -----
+
+    def consultar(self, desde=None, hasta=None, tipo=None, columnas=None, filtro=None):
+        """Movimientos archivados entre desde y hasta (inclusive).
+
+        Solo se abren las particiones de los meses del rango y solo se leen
+        ``columnas``. ``filtro`` admite una expresión adicional de pyarrow.
+        """
+        columnas = list(columnas or COLUMNAS_MOVIMIENTO)
+        if not self.meses() or not disponible():
+            return pd.DataFrame(columns=columnas)
+
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        dataset = ds.dataset(
+            self.directorio, format='parquet', schema=_esquema().append(pa.field('mes', pa.string())),
+            partitioning=ds.partitioning(pa.schema([('mes', pa.string())]), flavor='hive')
+        )
+        condiciones = []
+        if desde is not None:
+            desde = pd.Timestamp(desde)
+            condiciones += [ds.field('mes') >= desde.strftime('%Y-%m'), ds.field('Fecha') >= desde.date()]
+        if hasta is not None:
+            hasta = pd.Timestamp(hasta)
+            condiciones += [ds.field('mes') <= hasta.strftime('%Y-%m'), ds.field('Fecha') <= hasta.date()]
+        if tipo is not None:
+            condiciones.append(ds.field('Tipo') == tipo)
+        if filtro is not None:
+            condiciones.append(filtro)
+
+        expresion = None
+        for condicion in condiciones:
+            expresion = condicion if expresion is None else expresion & condicion
+        # Fechas como datetime64, igual que las tablas del almacén de trabajo
+        archivados = dataset.to_table(columns=columnas, filter=expresion).to_pandas(date_as_object=False)
+        if 'Fecha' in archivados.columns:
+            archivados['Fecha'] = archivados['Fecha'].astype('datetime64[ns]')
+        return archivados
+
+    def ultima_fecha(self, tipo):
+        """Fecha del último movimiento archivado de ese tipo (recorre los meses desde el más reciente)."""
+        if not disponible():
+            return None
+        import pyarrow.dataset as ds
+
+        for mes in reversed(self.meses()):
+            inicio = pd.Timestamp(f'{mes}-01')
+            # Sin las filas del movimientos.csv antiguo, como la búsqueda y la exportación
+            fechas = self.consultar(inicio, inicio + pd.offsets.MonthEnd(0), tipo=tipo, columnas=['Fecha'],
+                                    filtro=ds.field('Origen') != 'movimientos')['Fecha']
+            if not fechas.empty:
+                return fechas.max().date()
+        return None
+
+    def claves_pedidos(self):
+        """Números de pedido despachados que están archivados."""
+        return self.consultar(tipo='Despacho', columnas=['Número de Pedido'])['Número de Pedido'].dropna()
+
+class HistoricoConsolidado:
+    """Consulta a la vez los históricos de varias bodegas (vista consolidada, solo lectura).
+
+    Cada bodega archiva con su propio corte y su histórico solo tiene lo
+    anterior a ese corte, así que tomar el corte más reciente y unir las
+    consultas no repite filas del almacén de trabajo ni deja huecos.
+    """
+
+    def __init__(self, historicos):
+        # {nombre de la bodega: Historico}
+        self.historicos = historicos
+
+    def meses(self):
+        return sorted(set().union(*(h.meses() for h in self.historicos.values())))
+
+    def corte(self):
+        cortes = [c for c in (h.corte() for h in self.historicos.values()) if c is not None]
+        return max(cortes) if cortes else None
+
+    def consultar(self, desde=None, hasta=None, tipo=None, columnas=None, filtro=None):
+        """Como Historico.consultar, con la columna 'Bodega' y sin los traspasos entre bodegas."""
+        columnas = list(columnas or COLUMNAS_MOVIMIENTO)
+        # Para reconocer los traspasos hacen falta el número de pedido y el motivo
+        leidas = columnas + [c for c in ['Número de Pedido', 'Motivo'] if c not in columnas]
+        partes = []
+        for nombre, historico in self.historicos.items():
+            filas = historico.consultar(desde, hasta, tipo=tipo, columnas=leidas, filtro=filtro)
+            if filas.empty:
+                continue
+            traspasos = es_traspaso(filas['Número de Pedido']) | es_traspaso(filas['Motivo'])
+            partes.append(filas.loc[~traspasos.to_numpy(), columnas].assign(Bodega=nombre))
+        if not partes:
+            return pd.DataFrame(columns=columnas + ['Bodega'])
+        return pd.concat(partes, ignore_index=True)
+
+    def ultima_fecha(self, tipo):
+        fechas = [f for f in (h.ultima_fecha(tipo) for h in self.historicos.values()) if f is not None]
+        return max(fechas) if fechas else None
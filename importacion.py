@@ -0,0 +1,251 @@
+import os
+import pandas as pd
+from almacenamiento import (
+    COLUMNAS_PRODUCTOS, COLUMNAS_ENTRADAS, COLUMNAS_DESPACHOS,
+    bloquear, cargar_tablas, indice_productos, pedidos_despachados, upsert_productos
+)
+from operaciones import registrar_despacho, registrar_entrada
+from pedidos_despachados import clave_pedido
+
+# ================================================
+# IMPORTACIÓN POR BLOQUES
+# ================================================
+#
+# El archivo se lee por bloques (chunksize en CSV, openpyxl en modo solo
+# lectura en Excel). Cada bloque se valida y se escribe antes de leer el
+# siguiente, así la memoria no depende del tamaño del archivo. Los productos
+# se insertan o actualizan por nombre; entradas y despachos se anexan con
+# las operaciones validadas de operaciones.py, bajo el cerrojo de
+# movimientos. Cada bloque de despachos se valida con datos frescos: se
+# rechazan los pedidos ya despachados (volver a subir el mismo archivo no
+# duplica nada) y los que no caben en el stock, en el orden del archivo.
+# Un pedido se importa completo o se rechaza, y nunca queda repartido entre
+# dos bloques.
+
+TAMANO_BLOQUE = 5000
+
+COLUMNAS_REQUERIDAS = {
+    'Productos': ['Producto', 'Unidad de Medida', 'Stock Inicial'],
+    'Entradas': ['Producto', 'Cantidad', 'Fecha'],
+    'Despachos': ['Fecha', 'Cliente', 'Número de Pedido', 'Producto', 'Cantidad'],
+}
+
+COLUMNAS_TIPO = {
+    'Productos': COLUMNAS_PRODUCTOS,
+    'Entradas': COLUMNAS_ENTRADAS,
+    'Despachos': COLUMNAS_DESPACHOS,
+}
+
+class ErrorImportacion(Exception):
+    pass
+
+def _tamano(archivo):
+    posicion = archivo.tell()
+    archivo.seek(0, os.SEEK_END)
+    tamano = archivo.tell()
+    archivo.seek(posicion)
+    return tamano
+
+def bloques_csv(archivo, tamano_bloque=TAMANO_BLOQUE):
+    """Genera (bloque, fracción leída) a partir de un CSV."""
+    total = _tamano(archivo) or 1
+    lector = pd.read_csv(archivo, chunksize=tamano_bloque, dtype={'Número de Pedido': str})
+    for bloque in lector:
+        yield bloque, min(archivo.tell() / total, 1.0)
+
+def bloques_excel(archivo, tamano_bloque=TAMANO_BLOQUE):
+    """Genera (bloque, fracción leída) recorriendo la primera hoja en modo solo lectura."""
+    import openpyxl
+
+    libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        hoja = libro.worksheets[0]
+        total = max((hoja.max_row or 1) - 1, 1)
+        filas = hoja.iter_rows(values_only=True)
+        cabecera = next(filas, None)
+        if cabecera is None:
+            return
+        columnas = [str(c).strip() if c is not None else f'Columna {i + 1}' for i, c in enumerate(cabecera)]
+
+        leidas = 0
+        pendientes = []
+        for fila in filas:
+            if all(v is None for v in fila):
+                continue
+            pendientes.append(fila[:len(columnas)])
+            if len(pendientes) >= tamano_bloque:
+                leidas += len(pendientes)
+                yield pd.DataFrame(pendientes, columns=columnas), min(leidas / total, 1.0)
+                pendientes = []
+        if pendientes:
+            yield pd.DataFrame(pendientes, columns=columnas), 1.0
+    finally:
+        libro.close()
+
+def vista_previa(archivo, formato, filas=5):
+    """Primeras filas del archivo sin cargarlo completo."""
+    lector = bloques_csv(archivo, filas) if formato == 'CSV' else bloques_excel(archivo, filas)
+    try:
+        bloque, _ = next(lector)
+    except StopIteration:
+        bloque = pd.DataFrame()
+    finally:
+        lector.close()
+        archivo.seek(0)
+    return bloque
+
+def _vacio(serie):
+    return serie.isna() | (serie.astype(str).str.strip() == '')
+
+def _numerar(lector):
+    """Numera las filas de cada bloque como en una hoja de cálculo (la 1 es la cabecera)."""
+    leidas = 0
+    for bloque, fraccion in lector:
+        bloque.index = pd.RangeIndex(leidas + 2, leidas + 2 + len(bloque))
+        leidas += len(bloque)
+        yield bloque, fraccion
+
+def _pedidos_completos(lector):
+    """Reparte los bloques de despachos sin partir pedidos: el último pedido pasa al bloque siguiente."""
+    pendiente = None
+    for bloque, fraccion in lector:
+        if pendiente is not None:
+            bloque = pd.concat([pendiente, bloque])
+        if 'Número de Pedido' not in bloque.columns:
+            pendiente = None
+            yield bloque, fraccion
+            continue
+        claves = clave_pedido(bloque['Número de Pedido'])
+        ultimo = claves == claves.iloc[-1] if claves.notna().iloc[-1] else pd.Series(False, index=bloque.index)
+        pendiente = bloque[ultimo.to_numpy()]
+        # Si el bloque entero es un solo pedido se sigue acumulando
+        if len(pendiente) < len(bloque):
+            yield bloque[~ultimo.to_numpy()], fraccion
+    if pendiente is not None and not pendiente.empty:
+        yield pendiente, 1.0
+
+def _sin_stock(bloque, claves, stock):
+    """Motivo de las filas de los pedidos que no caben en ``stock``, asignado en el orden del archivo."""
+    disponible = stock.to_dict()
+    motivos = pd.Series('', index=bloque.index)
+    for _, lineas in bloque.groupby(claves, sort=False):
+        demanda = lineas.groupby('Producto', sort=False)['Cantidad'].sum()
+        faltante = next(((p, c) for p, c in demanda.items() if c > disponible.get(p, 0)), None)
+        if faltante is not None:
+            producto, cantidad = faltante
+            motivos[lineas.index] = (
+                f"Stock insuficiente de {producto}: solicitado {cantidad:g}, disponible {disponible.get(producto, 0):g}"
+            )
+            continue
+        for producto, cantidad in demanda.items():
+            disponible[producto] -= cantidad
+    return motivos
+
+def validar_bloque(tipo, bloque, productos_conocidos, despachados=None, stock=None):
+    """Separa un bloque en filas válidas (normalizadas) y rechazadas con su motivo.
+
+    En despachos, ``despachados`` (claves de pedido ya registradas) y ``stock``
+    (stock actual por producto) rechazan los pedidos repetidos o sin stock.
+    """
+    faltantes = [c for c in COLUMNAS_REQUERIDAS[tipo] if c not in bloque.columns]
+    if faltantes:
+        raise ErrorImportacion(f"El archivo debe contener al menos estas columnas: {', '.join(COLUMNAS_REQUERIDAS[tipo])}")
+
+    bloque = bloque.copy()
+    motivo = pd.Series('', index=bloque.index)
+
+    def rechazar(mascara, texto):
+        mascara = mascara.fillna(False).astype(bool)
+        motivo.loc[mascara & (motivo == '')] = texto
+
+    bloque['Producto'] = bloque['Producto'].astype('string').str.strip()
+    rechazar(_vacio(bloque['Producto']), 'Producto vacío')
+
+    columnas_numericas = ['Stock Inicial', 'Stock Minimo'] if tipo == 'Productos' else ['Cantidad']
+    for col in columnas_numericas:
+        if col not in bloque.columns:
+            continue
+        valores = pd.to_numeric(bloque[col], errors='coerce')
+        invalidos = valores.isna()
+        if col == 'Stock Minimo':
+            # Columna opcional: vacía no se rechaza ni pisa el valor existente
+            invalidos &= ~_vacio(bloque[col])
+        rechazar(invalidos, f"'{col}' no es numérico")
+        rechazar(valores < 0, f"'{col}' es negativo")
+        if col == 'Cantidad':
+            rechazar(valores == 0, "'Cantidad' debe ser mayor que cero")
+        bloque[col] = valores
+
+    if tipo != 'Productos':
+        fechas = pd.to_datetime(bloque['Fecha'], errors='coerce')
+        rechazar(fechas.isna(), 'Fecha inválida')
+        bloque['Fecha'] = fechas.dt.date
+        rechazar(~bloque['Producto'].isin(productos_conocidos), 'Producto no registrado')
+
+    if tipo == 'Despachos':
+        rechazar(_vacio(bloque['Cliente']), 'Cliente vacío')
+        sin_numero = _vacio(bloque['Número de Pedido'])
+        rechazar(sin_numero, 'Número de pedido vacío')
+        bloque['Número de Pedido'] = bloque['Número de Pedido'].astype(str).str.strip()
+        claves = clave_pedido(bloque['Número de Pedido'].where(~sin_numero))
+        if despachados is not None:
+            rechazar(claves.isin(despachados), 'Pedido ya despachado')
+        # Un pedido con alguna línea inválida se rechaza completo
+        con_rechazos = claves[(motivo != '') & claves.notna()].unique()
+        rechazar(claves.isin(con_rechazos), 'Otra línea del pedido fue rechazada')
+        if stock is not None:
+            validas = motivo == ''
+            sin_stock = _sin_stock(bloque[validas], claves[validas], stock)
+            sin_stock = sin_stock[sin_stock != '']
+            motivo.loc[sin_stock.index] = sin_stock
+
+    validos = bloque[motivo == ''].reindex(columns=[c for c in COLUMNAS_TIPO[tipo] if c in bloque.columns])
+    rechazados = bloque[motivo != ''].assign(**{'Motivo del rechazo': motivo[motivo != '']})
+    return validos, rechazados
+
+def importar_archivo(archivo, formato, tipo, actualizar_stock=False, progreso=None, tamano_bloque=TAMANO_BLOQUE):
+    """Importa un archivo CSV/Excel por bloques.
+
+    Devuelve un diccionario con las filas importadas y un DataFrame con las
+    filas rechazadas (incluye 'Fila' y 'Motivo del rechazo').
+    """
+    lector = bloques_csv(archivo, tamano_bloque) if formato == 'CSV' else bloques_excel(archivo, tamano_bloque)
+    lector = _numerar(lector)
+    if tipo == 'Despachos':
+        lector = _pedidos_completos(lector)
+    productos_conocidos = set(indice_productos().posiciones)
+
+    importadas = 0
+    leidas = 0
+    rechazos = []
+    for bloque, fraccion in lector:
+        leidas += len(bloque)
+
+        if tipo == 'Productos':
+            validos, rechazados = validar_bloque(tipo, bloque, productos_conocidos)
+            if not validos.empty:
+                upsert_productos(validos, actualizar_stock=actualizar_stock)
+                productos_conocidos.update(validos['Producto'])
+        else:
+            # Validar y escribir con el cerrojo tomado: otra sesión pudo despachar entretanto
+            with bloquear('movimientos'):
+                if tipo == 'Entradas':
+                    validos, rechazados = validar_bloque(tipo, bloque, productos_conocidos)
+                    if not validos.empty:
+                        registrar_entrada(validos)
+                else:
+                    stock = cargar_tablas()[0].drop_duplicates('Producto').set_index('Producto')['Stock Actual']
+                    validos, rechazados = validar_bloque(
+                        tipo, bloque, productos_conocidos, despachados=pedidos_despachados().claves, stock=stock
+                    )
+                    if not validos.empty:
+                        registrar_despacho(validos)
+        importadas += len(validos)
+        if not rechazados.empty:
+            rechazos.append(rechazados.rename_axis('Fila').reset_index())
+
+        if progreso:
+            progreso(fraccion, leidas)
+
+    rechazadas = pd.concat(rechazos, ignore_index=True) if rechazos else pd.DataFrame(columns=['Fila', 'Motivo del rechazo'])
+    return {'leidas': leidas, 'importadas': importadas, 'rechazadas': rechazadas}
@@ -0,0 +1,139 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from functools import wraps
+
+# ================================================
+# INSTRUMENTACIÓN DE RUTAS CRÍTICAS
+# ================================================
+#
+# Con BODEGA_INSTRUMENTAR=1 cada rerun de la app anota cuánto tarda cada
+# etapa (lectura de CSV, cálculo de stock, estilos, agrupaciones,
+# escrituras...) y cuenta filas leídas y bytes escritos. Al terminar el
+# rerun el registro se anexa como una línea JSON al log y se muestra en un
+# panel de la barra lateral. Streamlit ejecuta cada sesión en su propio
+# hilo, así que el registro en curso es local al hilo. Desactivada, cada
+# etapa es un nullcontext compartido y cada contador una comparación.
+
+ACTIVA = os.environ.get('BODEGA_INSTRUMENTAR', '').lower() not in ('', '0', 'false', 'no')
+
+# Archivo de log JSON-lines (por defecto datos/instrumentacion.jsonl)
+ARCHIVO_LOG = os.environ.get('BODEGA_INSTRUMENTAR_LOG')
+
+_NULO = nullcontext()
+_local = threading.local()
+
+def _registro():
+    return getattr(_local, 'registro', None)
+
+def iniciar_rerun():
+    """Empieza un registro nuevo para el rerun del hilo actual."""
+    if not ACTIVA:
+        return
+    _local.registro = {
+        'fecha': datetime.now().isoformat(timespec='milliseconds'),
+        'inicio': time.perf_counter(),
+        'etapas': [],
+        'contadores': {},
+        'profundidad': 0,
+    }
+
+def terminar_rerun(**datos):
+    """Cierra el registro del rerun, lo anexa al log y lo devuelve (None si no hay registro)."""
+    registro = _registro()
+    if registro is None:
+        return None
+    _local.registro = None
+    resultado = {
+        'fecha': registro['fecha'],
+        'total_ms': round((time.perf_counter() - registro['inicio']) * 1000, 2),
+        'etapas': registro['etapas'],
+        'contadores': registro['contadores'],
+        **datos,
+    }
+    try:
+        _anexar_log(resultado)
+    except OSError:
+        # El log es solo diagnóstico: no debe tumbar la app
+        pass
+    return resultado
+
+def _anexar_log(resultado):
+    ruta = ARCHIVO_LOG
+    if ruta is None:
+        from almacenamiento import get_file_path
+        ruta = get_file_path('instrumentacion.jsonl')
+    with open(ruta, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(resultado, ensure_ascii=False, default=str) + '\n')
+
+@contextmanager
+def _medir(registro, nombre, datos):
+    # Se anota al empezar, así las etapas quedan en orden de inicio (la
+    # contenedora antes que las anidadas)
+    anotacion = {'etapa': nombre, 'ms': None, 'nivel': registro['profundidad'], **datos}
+    registro['etapas'].append(anotacion)
+    registro['profundidad'] += 1
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registro['profundidad'] -= 1
+        anotacion['ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+
+def etapa(nombre, **datos):
+    """Context manager que mide una etapa del rerun en curso (no hace nada si no hay registro)."""
+    registro = _registro()
+    if registro is None:
+        return _NULO
+    return _medir(registro, nombre, datos)
+
+def medido(nombre=None):
+    """Decorador que mide cada llamada a la función como una etapa."""
+    def decorador(funcion):
+        etiqueta = nombre or funcion.__name__
+
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with etapa(etiqueta):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+def contar(contador, cantidad):
+    """Suma ``cantidad`` a un contador del rerun en curso ('filas_leidas', 'bytes_escritos', ...)."""
+    registro = _registro()
+    if registro is not None:
+        registro['contadores'][contador] = registro['contadores'].get(contador, 0) + int(cantidad)
+
+# ================================================
+# PERFIL DE UN RERUN
+# ================================================
+
+def perfilar(funcion, ruta=None, lineas=25):
+    """Ejecuta ``funcion`` bajo cProfile; devuelve su resultado y el resumen por tiempo acumulado.
+
+    Con ``ruta`` se guardan además las estadísticas completas (abrir con
+    ``python -m pstats`` o snakeviz).
+    """
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        resultado = funcion()
+    finally:
+        perfil.disable()
+        # También si ``funcion`` termina con una excepción (st.rerun, st.stop)
+        if ruta:
+            perfil.dump_stats(ruta)
+    return resultado, resumen_perfil(perfil, lineas)
+
+def resumen_perfil(perfil, lineas=25):
+    """Las ``lineas`` funciones con más tiempo acumulado de un perfil (objeto o archivo guardado)."""
+    salida = io.StringIO()
+    pstats.Stats(perfil, stream=salida).sort_stats('cumulative').print_stats(lineas)
+    return salida.getvalue()
@@ -0,0 +1,269 @@
+import json
+import os
+import time
+from contextlib import ExitStack
+import pandas as pd
+import bodegas
+from almacenamiento import (
+    COLUMNAS_PRODUCTOS, ConflictoVersion, bloquear, bloquear_catalogo, cargar_tablas, indice_productos,
+    despachos_de_pedido, movimiento_neto, pedido_existe, registrar_movimientos, guardar_productos, upsert_productos
+)
+from cerrojos import cerrojo, escribir_texto_atomico
+from esquemas import editable
+
+# ================================================
+# OPERACIONES VALIDADAS CON CERROJO
+# ================================================
+#
+# La pantalla valida con los datos que cargó al dibujarse, pero otra sesión
+# pudo escribir entretanto. Estas funciones repiten la validación con datos
+# frescos mientras tienen el cerrojo del recurso, así dos despachos
+# simultáneos no pueden dejar el stock en negativo ni repetir un pedido.
+# Entradas y despachos comparten el cerrojo de movimientos. Editar el
+# catálogo relee las tablas, así que toma además el de productos, siempre
+# después del de movimientos (bloquear_catalogo): es una espera de
+# milisegundos para los despachos y evita un abrazo mortal con archivar().
+
+class ErrorOperacion(Exception):
+    pass
+
+class PedidoDuplicado(ErrorOperacion):
+    pass
+
+class ProductoDuplicado(ErrorOperacion):
+    pass
+
+class ProductoInexistente(ErrorOperacion):
+    pass
+
+class ProductoConMovimientos(ErrorOperacion):
+    pass
+
+class StockInsuficiente(ErrorOperacion):
+    def __init__(self, faltantes):
+        # faltantes: {producto: (solicitado, disponible)}
+        self.faltantes = faltantes
+        detalle = ', '.join(f"{p} (solicitado {s}, disponible {d})" for p, (s, d) in faltantes.items())
+        super().__init__(f"Stock insuficiente: {detalle}")
+
+def _iguales(a, b):
+    if pd.isna(a) and pd.isna(b):
+        return True
+    return a == b
+
+def _lineas(df):
+    cantidades = pd.to_numeric(df['Cantidad'], errors='coerce').astype(float)
+    return sorted(zip(df['Cliente'].astype(str).str.strip(), df['Producto'].astype(str), cantidades))
+
+def mismo_despacho(existente, nuevo):
+    """Indica si ``nuevo`` repite exactamente las líneas ya registradas de un pedido (sin mirar la fecha)."""
+    return _lineas(existente) == _lineas(nuevo)
+
+def _verificar_productos(productos, bodega=None):
+    indice = indice_productos()
+    desconocidos = [p for p in productos if p not in indice]
+    if desconocidos:
+        donde = f" en la bodega {bodega}" if bodega else ""
+        raise ProductoInexistente(f"Productos no registrados{donde}: {', '.join(map(str, desconocidos))}")
+    return indice
+
+def _verificar_stock(solicitado, bodega=None):
+    """Comprueba que haya stock para ``solicitado`` ({producto: cantidad})."""
+    indice = _verificar_productos(solicitado.index, bodega)
+    faltantes = {
+        p: (cantidad, indice.stock_de(p))
+        for p, cantidad in solicitado.items()
+        if cantidad > indice.stock_de(p)
+    }
+    if faltantes:
+        raise StockInsuficiente(faltantes)
+
+def registrar_entrada(entradas_df):
+    with bloquear('movimientos'):
+        _verificar_productos(entradas_df['Producto'].unique())
+        registrar_movimientos(entradas=entradas_df)
+
+def registrar_despacho(despachos_df):
+    """Registra las líneas de uno o más pedidos si no existen y hay stock para todas.
+
+    Reenviar un pedido idéntico al ya registrado (por ejemplo, al reintentar
+    tras un error de red o un doble clic) no escribe nada y devuelve False.
+    """
+    despachos_df = despachos_df.assign(**{'Número de Pedido': despachos_df['Número de Pedido'].astype(str).str.strip()})
+    with bloquear('movimientos'):
+        repetidos = []
+        for numero, lineas in despachos_df.groupby('Número de Pedido', sort=False):
+            if pedido_existe(numero):
+                if not mismo_despacho(despachos_de_pedido(numero), lineas):
+                    raise PedidoDuplicado(f"El pedido {numero} ya fue despachado")
+                repetidos.append(numero)
+        despachos_df = despachos_df[~despachos_df['Número de Pedido'].isin(repetidos)]
+        if despachos_df.empty:
+            return False
+
+        _verificar_stock(despachos_df.groupby('Producto', sort=False)['Cantidad'].sum())
+
+        registrar_movimientos(despachos=despachos_df)
+        return True
+
+def _tiene_movimientos(producto):
+    _, entradas_df, despachos_df = cargar_tablas()
+    return bool((entradas_df['Producto'] == producto).any() or (despachos_df['Producto'] == producto).any())
+
+def agregar_producto(producto):
+    """Agrega un producto (diccionario con las columnas de productos) si el nombre está libre.
+
+    'Stock Inicial' es el stock con que empieza el producto.
+    """
+    with bloquear_catalogo():
+        if producto['Producto'] in indice_productos():
+            raise ProductoDuplicado(f"Ya existe un producto llamado '{producto['Producto']}'")
+        upsert_productos(pd.DataFrame([producto]), actualizar_stock=True)
+
+def actualizar_producto(nombre, cambios, original):
+    """Aplica ``cambios`` al producto ``nombre`` sobre la versión más reciente.
+
+    ``original`` es la fila que vio el usuario. Si otra sesión modificó alguno
+    de los campos que se están cambiando se lanza ConflictoVersion; los demás
+    cambios ajenos se conservan. 'Stock Actual' se traduce en el saldo de
+    apertura que produce ese stock. No se renombra un producto con entradas o
+    despachos en el almacén de trabajo: quedarían con el nombre anterior.
+    """
+    with bloquear_catalogo():
+        productos_df = cargar_tablas()[0]
+        indice = indice_productos()
+        if nombre not in indice:
+            raise ConflictoVersion(f"El producto '{nombre}' fue renombrado o eliminado por otro usuario.")
+
+        actual = indice.fila(nombre)
+        modificados = [c for c in cambios if c in original and not _iguales(actual[c], original[c])]
+        if modificados:
+            raise ConflictoVersion(
+                f"Otro usuario cambió {', '.join(modificados)} de '{nombre}'. Revise los valores e intente de nuevo."
+            )
+
+        nuevo_nombre = cambios.get('Producto', nombre)
+        if nuevo_nombre != nombre and nuevo_nombre in indice:
+            raise ProductoDuplicado(f"Ya existe un producto llamado '{nuevo_nombre}'")
+        if nuevo_nombre != nombre and _tiene_movimientos(nombre):
+            raise ProductoConMovimientos(
+                f"'{nombre}' tiene entradas o despachos registrados con ese nombre y no se puede renombrar."
+            )
+
+        # Las tablas cargadas son compartidas entre reruns: editar una copia
+        # (sin categorías, que no admiten valores nuevos)
+        idx = indice.etiqueta(nombre)
+        productos_df = editable(productos_df)
+        for columna in COLUMNAS_PRODUCTOS:
+            if columna in cambios and columna != 'Stock Inicial':
+                productos_df.at[idx, columna] = cambios[columna]
+
+        # El stock actual se deriva de los movimientos: se ajusta el saldo de
+        # apertura (con el nombre nuevo, si cambió) para llegar al valor indicado
+        if 'Stock Actual' in cambios or nuevo_nombre != nombre:
+            stock = cambios.get('Stock Actual', actual['Stock Actual'])
+            productos_df.at[idx, 'Stock Inicial'] = stock - movimiento_neto(nuevo_nombre)
+
+        guardar_productos(productos_df)
+
+# ================================================
+# TRASPASOS ENTRE BODEGAS
+# ================================================
+#
+# Un traspaso son dos movimientos emparejados por la misma clave
+# (TRASPASO-<n>): un despacho en la bodega de origen a nombre de la de
+# destino y una entrada en la de destino con la clave en el motivo. Se
+# escriben con los cerrojos de movimientos de las dos bodegas, tomados en
+# orden alfabético para que dos traspasos cruzados no se esperen entre sí.
+# Antes de escribir se deja traspaso_pendiente.json en el directorio común.
+# El despacho del origen confirma el traspaso: si el proceso se interrumpe,
+# la siguiente carga completa la entrada que falte o, si el despacho no
+# alcanzó a escribirse, descarta la marca.
+
+def _ruta_marca_traspaso():
+    return bodegas.ruta_comun('traspaso_pendiente.json')
+
+def _cerrojo_traspasos():
+    return cerrojo(bodegas.ruta_comun('.traspasos.lock'))
+
+def _bloquear_bodegas(pila, nombres):
+    for nombre in sorted(set(nombres)):
+        with bodegas.en(nombre):
+            pila.enter_context(bloquear('movimientos'))
+
+def _motivo_traspaso(marca):
+    return f"{marca['clave']} desde {marca['origen']}"
+
+def _despachos_traspaso(marca):
+    return pd.DataFrame([{
+        'Fecha': marca['fecha'], 'Cliente': f"Bodega {marca['destino']}", 'Número de Pedido': marca['clave'],
+        'Producto': producto, 'Cantidad': cantidad
+    } for producto, cantidad in marca['lineas']])
+
+def _entradas_traspaso(marca):
+    return pd.DataFrame([{
+        'Producto': producto, 'Cantidad': cantidad, 'Fecha': marca['fecha'], 'Motivo': _motivo_traspaso(marca)
+    } for producto, cantidad in marca['lineas']])
+
+def _recuperar_traspaso():
+    """Termina o descarta un traspaso interrumpido (se llama con el cerrojo de traspasos)."""
+    path = _ruta_marca_traspaso()
+    if not os.path.exists(path):
+        return
+    with open(path, encoding='utf-8') as f:
+        marca = json.load(f)
+    with ExitStack() as pila:
+        _bloquear_bodegas(pila, [marca['origen'], marca['destino']])
+        with bodegas.en(marca['origen']):
+            confirmado = pedido_existe(marca['clave'])
+        if confirmado:
+            with bodegas.en(marca['destino']):
+                if not (cargar_tablas()[1]['Motivo'] == _motivo_traspaso(marca)).any():
+                    registrar_movimientos(entradas=_entradas_traspaso(marca))
+    os.remove(path)
+
+def recuperar_traspasos():
+    """Completa o descarta el traspaso que haya quedado a medias (al cargar la app)."""
+    if os.path.exists(_ruta_marca_traspaso()):
+        with _cerrojo_traspasos():
+            _recuperar_traspaso()
+
+def _numero(valor):
+    valor = float(valor)
+    return int(valor) if valor.is_integer() else valor
+
+def registrar_traspaso(origen, destino, lineas_df, fecha):
+    """Traspasa las líneas (Producto, Cantidad) de la bodega ``origen`` a ``destino``.
+
+    Los productos deben existir en ambas bodegas y el origen debe tener
+    stock para todas las líneas. Devuelve la clave del traspaso.
+    """
+    if origen == destino:
+        raise ErrorOperacion("La bodega de origen y la de destino son la misma")
+    for nombre in [origen, destino]:
+        if nombre not in bodegas.disponibles():
+            raise ErrorOperacion(f"No existe la bodega '{nombre}'")
+    solicitado = lineas_df.groupby('Producto', sort=False)['Cantidad'].sum()
+    marca = {
+        'clave': f'{bodegas.PREFIJO_TRASPASO}{time.time_ns()}',
+        'origen': origen,
+        'destino': destino,
+        'fecha': pd.Timestamp(fecha).strftime('%Y-%m-%d'),
+        'lineas': [[producto, _numero(cantidad)] for producto, cantidad in solicitado.items()],
+    }
+
+    with _cerrojo_traspasos(), ExitStack() as pila:
+        _recuperar_traspaso()
+        _bloquear_bodegas(pila, [origen, destino])
+        with bodegas.en(destino):
+            _verificar_productos(solicitado.index, destino)
+        with bodegas.en(origen):
+            _verificar_stock(solicitado, origen)
+
+        escribir_texto_atomico(_ruta_marca_traspaso(), json.dumps(marca, ensure_ascii=False))
+        with bodegas.en(origen):
+            registrar_movimientos(despachos=_despachos_traspaso(marca))
+        with bodegas.en(destino):
+            registrar_movimientos(entradas=_entradas_traspaso(marca))
+        os.remove(_ruta_marca_traspaso())
+    return marca['clave']
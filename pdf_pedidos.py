@@ -0,0 +1,254 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from almacenamiento import COLUMNAS_PEDIDOS
+
+# ================================================
+# LECTURA DE PEDIDOS DESDE PDF
+# ================================================
+#
+# Las páginas se extraen en paralelo (un proceso por grupo de páginas) con
+# la detección de tablas de pdfplumber. El análisis posterior es secuencial
+# porque los datos de cabecera (cliente, número y fecha del pedido) suelen
+# aparecer solo en la primera página y se arrastran a las siguientes. El
+# resultado se guarda por hash del archivo: volver a subir el mismo PDF no
+# lo procesa de nuevo.
+
+# Por debajo de este número de páginas no compensa arrancar procesos
+PAGINAS_MINIMAS_PARALELO = 20
+PAGINAS_POR_TAREA = 10
+
+_SINONIMOS = {
+    'Cliente': ['cliente', 'razon social', 'comprador'],
+    'Número de Pedido': ['numero de pedido', 'n de pedido', 'no pedido', 'nro pedido', 'pedido', 'orden', 'oc'],
+    'Fecha del Pedido': ['fecha del pedido', 'fecha pedido', 'fecha'],
+    'Producto': ['producto', 'descripcion', 'articulo', 'item', 'material'],
+    'Cantidad': ['cantidad', 'cant', 'unidades', 'qty'],
+}
+
+_PATRONES_CABECERA = {
+    'Cliente': re.compile(r'(?:cliente|raz[oó]n social)\s*[:\-]\s*(.+)', re.IGNORECASE),
+    'Número de Pedido': re.compile(
+        r'(?<!del )(?:n[uú]mero de pedido|pedido|orden de compra)'
+        r'(?:\s*(?:n[°ºo]\.?|nro\.?)\s*[:#]?|\s*[:#])\s*([A-Za-z0-9][A-Za-z0-9\-/]*)',
+        re.IGNORECASE
+    ),
+    'Fecha del Pedido': re.compile(r'fecha(?: del pedido)?\s*[:\-]\s*(\d{4}-\d{2}-\d{2}|\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})', re.IGNORECASE),
+}
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', str(texto or '')).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9 ]+', ' ', texto.lower()).strip()
+
+def _columna_pedido(encabezado):
+    encabezado = _normalizar(encabezado)
+    for columna, sinonimos in _SINONIMOS.items():
+        if any(encabezado == s or encabezado.startswith(s + ' ') for s in sinonimos):
+            return columna
+    return None
+
+# ================================================
+# EXTRACCIÓN (SE EJECUTA EN LOS PROCESOS HIJOS)
+# ================================================
+
+def _extraer_paginas(ruta, inicio, fin):
+    """Texto y tablas de las páginas [inicio, fin) del PDF."""
+    import pdfplumber
+
+    paginas = []
+    with pdfplumber.open(ruta) as pdf:
+        for pagina in pdf.pages[inicio:fin]:
+            paginas.append({
+                'texto': pagina.extract_text() or '',
+                'tablas': pagina.extract_tables() or [],
+            })
+            # Libera la caché de objetos de la página para no acumular memoria
+            pagina.flush_cache()
+    return paginas
+
+def extraer_pdf(ruta, procesos=None):
+    import pdfplumber
+
+    with pdfplumber.open(ruta) as pdf:
+        total = len(pdf.pages)
+
+    if total < PAGINAS_MINIMAS_PARALELO:
+        return _extraer_paginas(ruta, 0, total)
+
+    rangos = [(i, min(i + PAGINAS_POR_TAREA, total)) for i in range(0, total, PAGINAS_POR_TAREA)]
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        futuros = [pool.submit(_extraer_paginas, ruta, inicio, fin) for inicio, fin in rangos]
+        paginas = []
+        for futuro in futuros:
+            paginas.extend(futuro.result())
+    return paginas
+
+# ================================================
+# CANTIDADES CON SEPARADORES DE MILES Y DECIMALES
+# ================================================
+#
+# En es-ES el punto separa miles y la coma decimales ('1.000,5'); en es-MX
+# es al revés ('1,000.5'). Casi siempre la forma del número lo decide: si
+# aparecen los dos separadores el último es el decimal, un separador
+# repetido solo puede ser de miles y uno seguido de una cantidad de cifras
+# distinta de tres solo puede ser decimal. Queda la duda con un único
+# separador seguido de tres cifras ('1,250' son 1250 unidades en es-MX y
+# 1,25 kg en es-ES): se resuelve con la convención que muestren las demás
+# cantidades del documento y, si ninguna la muestra, la línea se rechaza
+# en lugar de adivinar.
+
+def _limpiar_cantidad(texto):
+    return re.sub(r'[^\d,.\-]', '', str(texto))
+
+def _leer_cantidad(texto):
+    """(valor, separador decimal que revela la forma del número, es ambigua).
+
+    Las cantidades ambiguas y las inválidas vuelven con valor None.
+    """
+    texto = _limpiar_cantidad(texto)
+    separadores = [c for c in texto if c in ',.']
+    if not separadores:
+        return (float(texto), None, False) if re.match(r'^-?\d+$', texto) else (None, None, False)
+    if len(set(separadores)) == 2:
+        decimal = separadores[-1]
+        miles = '.' if decimal == ',' else ','
+        if not re.match(rf'^-?\d{{1,3}}(?:{re.escape(miles)}\d{{3}})*{re.escape(decimal)}\d+$', texto):
+            return None, None, False
+        return float(texto.replace(miles, '').replace(decimal, '.')), decimal, False
+    separador = separadores[0]
+    if len(separadores) > 1:
+        # Solo puede ser de miles
+        if not re.match(rf'^-?\d{{1,3}}(?:{re.escape(separador)}\d{{3}})+$', texto):
+            return None, None, False
+        return float(texto.replace(separador, '')), '.' if separador == ',' else ',', False
+    entero, _, fraccion = texto.partition(separador)
+    cifras = entero.lstrip('-')
+    if not cifras.isdigit() or not fraccion.isdigit():
+        return None, None, False
+    if len(fraccion) != 3 or cifras == '0' or len(cifras) > 3:
+        return float(f'{entero}.{fraccion}'), separador, False
+    return None, separador, True
+
+def convertir_cantidades(textos):
+    """Convierte las cantidades de un documento: (valores, motivo de rechazo de cada una o '')."""
+    lecturas = [_leer_cantidad(t) for t in textos]
+    reveladas = {decimal for valor, decimal, ambigua in lecturas if decimal is not None and not ambigua}
+    # Si el documento mezcla ambas convenciones, ninguna cantidad ambigua se resuelve
+    decimal = reveladas.pop() if len(reveladas) == 1 else None
+
+    valores, motivos = [], []
+    for texto, (valor, separador, ambigua) in zip(textos, lecturas):
+        motivo = ''
+        if ambigua and decimal is None:
+            motivo = f"Cantidad ambigua: '{texto}' (no se sabe si el separador es de miles o decimal)"
+        elif ambigua:
+            entero, _, fraccion = _limpiar_cantidad(texto).partition(separador)
+            valor = float(f'{entero}.{fraccion}') if separador == decimal else float(entero + fraccion)
+        elif valor is None:
+            motivo = f"Cantidad no numérica: '{texto}'"
+        valores.append(float('nan') if motivo else valor)
+        motivos.append(motivo)
+    return pd.Series(valores, dtype='float64'), pd.Series(motivos, dtype=object)
+
+# ================================================
+# ANÁLISIS DE LAS PÁGINAS
+# ================================================
+
+def _filas_de_tabla(tabla):
+    """Convierte una tabla con cabecera reconocible en filas con columnas de pedido."""
+    if not tabla or len(tabla) < 2:
+        return []
+    columnas = [_columna_pedido(celda) for celda in tabla[0]]
+    if 'Producto' not in columnas or 'Cantidad' not in columnas:
+        return []
+
+    filas = []
+    for celdas in tabla[1:]:
+        fila = {}
+        for columna, valor in zip(columnas, celdas):
+            if columna and valor not in (None, ''):
+                fila[columna] = str(valor).replace('\n', ' ').strip()
+        if fila.get('Producto') and fila.get('Cantidad'):
+            filas.append(fila)
+    return filas
+
+def analizar_paginas(paginas):
+    """Convierte las páginas extraídas en filas con el esquema de pedidos.csv."""
+    contexto = {}
+    filas = []
+    for pagina in paginas:
+        for linea in pagina['texto'].splitlines():
+            for columna, patron in _PATRONES_CABECERA.items():
+                coincidencia = patron.search(linea)
+                if coincidencia:
+                    contexto[columna] = coincidencia.group(1).strip()
+
+        for tabla in pagina['tablas']:
+            for fila in _filas_de_tabla(tabla):
+                filas.append({**contexto, **fila})
+
+    pedidos = pd.DataFrame(filas).reindex(columns=COLUMNAS_PEDIDOS + ['Motivo del rechazo'])
+    if pedidos.empty:
+        return pedidos
+    cantidades, motivos = convertir_cantidades(pedidos['Cantidad'].tolist())
+    pedidos['Cantidad'] = cantidades.to_numpy()
+    pedidos['Motivo del rechazo'] = motivos.to_numpy()
+    pedidos['Fecha del Pedido'] = pd.to_datetime(
+        pedidos['Fecha del Pedido'], errors='coerce', dayfirst=True, format='mixed'
+    ).dt.strftime('%Y-%m-%d')
+    return pedidos
+
+# ================================================
+# CACHÉ POR HASH DEL ARCHIVO
+# ================================================
+
+MAXIMO_EN_MEMORIA = 16
+
+# Sube cuando cambia el análisis, así no se reutilizan resultados guardados con el anterior
+VERSION_ANALISIS = 2
+
+_cerrojo = threading.Lock()
+_cache = {}
+
+def hash_pdf(datos):
+    return hashlib.sha256(datos).hexdigest()
+
+def procesar_pdf(datos, directorio_cache=None, procesos=None):
+    """Devuelve (hash, DataFrame de pedidos, texto) de un PDF dado en bytes."""
+    clave = hash_pdf(datos)
+    with _cerrojo:
+        if clave in _cache:
+            return (clave,) + _cache[clave]
+
+    ruta_cache = os.path.join(directorio_cache, f'{clave}.v{VERSION_ANALISIS}.csv') if directorio_cache else None
+    if ruta_cache and os.path.exists(ruta_cache) and os.path.exists(ruta_cache + '.txt'):
+        pedidos = pd.read_csv(ruta_cache, dtype={'Número de Pedido': str, 'Motivo del rechazo': str})
+        pedidos['Motivo del rechazo'] = pedidos['Motivo del rechazo'].fillna('')
+        with open(ruta_cache + '.txt', encoding='utf-8') as f:
+            texto = f.read()
+    else:
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
+            tmp.write(datos)
+        try:
+            paginas = extraer_pdf(tmp.name, procesos=procesos)
+        finally:
+            os.unlink(tmp.name)
+
+        pedidos = analizar_paginas(paginas)
+        texto = '\n'.join(p['texto'] for p in paginas)
+        if ruta_cache:
+            os.makedirs(directorio_cache, exist_ok=True)
+            pedidos.to_csv(ruta_cache, index=False)
+            with open(ruta_cache + '.txt', 'w', encoding='utf-8') as f:
+                f.write(texto)
+
+    with _cerrojo:
+        if len(_cache) >= MAXIMO_EN_MEMORIA:
+            _cache.pop(next(iter(_cache)))
+        _cache[clave] = (pedidos, texto)
+    return clave, pedidos, texto
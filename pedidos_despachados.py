@@ -0,0 +1,173 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from cerrojos import cerrojo, escribir_texto_atomico
+
+# ================================================
+# ÍNDICE DE PEDIDOS DESPACHADOS
+# ================================================
+#
+# Conjunto en memoria con la clave normalizada de cada número de pedido ya
+# despachado, para comprobar duplicados sin recorrer el historial. Se
+# guarda en un archivo auxiliar de solo anexado: una cabecera con la
+# versión del formato, una clave por línea ('k<clave>', así un pedido que
+# empieza con '#' no se confunde con una marca) y, tras cada bloque, una
+# marca '#filas clave' con las filas de despachos que ya cubre y la clave de
+# la última. Al arrancar se lee el archivo y solo se indexan las filas
+# posteriores; si el historial se acortó o cambió, o el archivo es de otra
+# versión, se reconstruye. Cuando las marcas superan a las claves el archivo
+# se reescribe con una sola marca, así no crece con cada cambio de datos.
+
+CABECERA = '@pedidos 2\n'
+
+def _clave(numero):
+    texto = str(numero).strip()
+    if texto.endswith('.0') and texto[:-2].isdigit():
+        texto = texto[:-2]
+    if texto.isdigit():
+        texto = texto.lstrip('0') or '0'
+    return texto
+
+def clave_pedido(numeros):
+    """Clave normalizada de cada número de pedido: sin espacios ni ceros a la izquierda ('001' == '1').
+
+    Se normaliza una vez cada valor distinto (un pedido suele ocupar varias
+    líneas); los vacíos quedan como NaN.
+    """
+    codigos, distintos = pd.factorize(numeros)
+    claves = np.array([_clave(v) for v in distintos] + [np.nan], dtype=object)
+    return pd.Series(claves[codigos], index=numeros.index)
+
+class IndicePedidos:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.claves = set()
+        self.filas = 0
+        self.ultima = None
+        # Marcas de filas que tiene el archivo (una por sincronización anexada)
+        self.marcas = 0
+        self.iniciado = False
+        self._cerrojo = threading.Lock()
+
+    def __contains__(self, numero):
+        return _clave(numero) in self.claves
+
+    def _leer(self):
+        """(claves, filas, última, marcas) del archivo guardado."""
+        claves, filas, ultima, marcas = set(), 0, None, 0
+        if not os.path.exists(self.ruta):
+            return claves, filas, ultima, marcas
+        with open(self.ruta, encoding='utf-8') as f:
+            if f.readline() != CABECERA:
+                # Otro formato: una marca que no coincide con ningún historial obliga a reconstruir
+                return set(), 1, None, 0
+            for linea in f:
+                linea = linea.rstrip('\n')
+                if linea.startswith('#'):
+                    texto_filas, _, ultima = linea[1:].partition(' ')
+                    filas = int(texto_filas)
+                    marcas += 1
+                elif linea.startswith('k'):
+                    claves.add(linea[1:])
+        return claves, filas, ultima, marcas
+
+    def _cargar(self):
+        self.claves, self.filas, self.ultima, self.marcas = self._leer()
+
+    def _compactar(self, filas, ultima):
+        """Reescribe el archivo con todas las claves y una sola marca."""
+        with cerrojo(self.ruta + '.lock'):
+            # Otro proceso pudo anexar claves que este todavía no tiene
+            self.claves |= self._leer()[0]
+            self._escribir(self.claves, filas, ultima, anexar=False)
+        self.marcas = 1
+
+    def _escribir(self, claves, filas, ultima, anexar=True):
+        bloque = ''.join(f'k{c}\n' for c in claves)
+        if filas is not None:
+            bloque += f'#{filas} {ultima}\n'
+        with cerrojo(self.ruta + '.lock'):
+            if not anexar or not os.path.exists(self.ruta) or os.path.getsize(self.ruta) == 0:
+                bloque = CABECERA + bloque
+            if anexar:
+                with open(self.ruta, 'a', encoding='utf-8') as f:
+                    f.write(bloque)
+                    f.flush()
+                    os.fsync(f.fileno())
+            else:
+                escribir_texto_atomico(self.ruta, bloque)
+
+    def sincronizar(self, despachos_df, base=None):
+        """Incorpora las filas de despachos que el índice todavía no cubre.
+
+        ``base`` devuelve los números de pedido que ya no están en despachos_df
+        (archivados); solo se consulta si hay que reconstruir el índice.
+        """
+        with self._cerrojo:
+            if not self.iniciado:
+                self._cargar()
+                self.iniciado = True
+
+            total = len(despachos_df)
+            numeros = despachos_df['Número de Pedido']
+            vigente = self.filas <= total and (
+                self.filas == 0 or _clave(numeros.iloc[self.filas - 1]) == self.ultima
+            )
+            inicio = self.filas if vigente else 0
+            if vigente and inicio == total:
+                return
+
+            nuevas = clave_pedido(numeros.iloc[inicio:]).dropna()
+            ultima = _clave(numeros.iloc[-1]) if total else ''
+            if vigente:
+                # Las que ya anotó anexar() solo necesitan la marca de filas
+                faltantes = set(nuevas) - self.claves
+                self.claves.update(faltantes)
+            else:
+                self.claves = set(nuevas)
+                if base is not None:
+                    self.claves.update(clave_pedido(pd.Series(base())).dropna())
+            self.filas, self.ultima = total, ultima
+            try:
+                if not vigente:
+                    self._escribir(self.claves, total, ultima, anexar=False)
+                    self.marcas = 1
+                elif self.marcas >= len(self.claves):
+                    self._compactar(total, ultima)
+                else:
+                    self._escribir(faltantes, total, ultima)
+                    self.marcas += 1
+            except OSError:
+                # El archivo solo acelera el arranque: sin él se reconstruye
+                pass
+
+    def descartar(self):
+        """Olvida el índice guardado; la próxima sincronización lo reconstruye completo."""
+        with self._cerrojo:
+            with cerrojo(self.ruta + '.lock'):
+                if os.path.exists(self.ruta):
+                    os.remove(self.ruta)
+            # Una marca que no coincide con ningún historial obliga a reconstruir
+            self.claves, self.filas, self.ultima, self.marcas = set(), 1, None, 0
+            self.iniciado = True
+
+    def anexar(self, numeros):
+        """Registra números recién despachados (la marca de filas se pone al sincronizar)."""
+        nuevas = set(clave_pedido(pd.Series(numeros)).dropna()) - self.claves
+        if not nuevas:
+            return
+        with self._cerrojo:
+            self.claves.update(nuevas)
+            try:
+                self._escribir(nuevas, None, None)
+            except OSError:
+                # El archivo solo acelera el arranque: la próxima sincronización lo completa
+                pass
+
+_indices = {}
+
+def indice_pedidos(ruta):
+    if ruta not in _indices:
+        _indices[ruta] = IndicePedidos(ruta)
+    return _indices[ruta]
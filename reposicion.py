@@ -0,0 +1,151 @@
+import threading
+import numpy as np
+import pandas as pd
+import bodegas
+from almacenamiento import cache_derivado, historico_activo, inicio_almacen
+from existencias import huella_filas
+from resumenes import acumulados
+
+# ================================================
+# SUGERENCIAS DE REPOSICIÓN
+# ================================================
+#
+# Para cada producto se calcula, de una pasada sobre los despachos diarios
+# de la ventana, el consumo medio por día y su desviación (contando los días
+# sin despachos). Con eso:
+#   punto de reorden  = consumo × plazo + stock de seguridad
+#   stock de seguridad = Z × desviación × √plazo
+#   cantidad sugerida = consumo × (plazo + revisión) + seguridad − stock
+# El punto de reorden nunca queda por debajo del Stock Minimo cargado a mano.
+# Las estadísticas de consumo se guardan entre versiones de datos: solo se
+# recalculan los productos con despachos nuevos, y todo si cambia el día o
+# el historial se reescribió. Los días archivados de la ventana se leen una
+# vez del histórico Parquet.
+
+VENTANA_DIAS = 90
+PLAZO_ENTREGA_DIAS = 7
+DIAS_REVISION = 14
+# Nivel de servicio del 95 %
+Z_SERVICIO = 1.65
+
+COLUMNAS_REPOSICION = [
+    'Producto', 'Stock Actual', 'Consumo Diario', 'Días de Cobertura',
+    'Punto de Reorden', 'Cantidad Sugerida', 'Reponer'
+]
+
+def _estadisticas(diario):
+    """Consumo medio diario y desviación por producto a partir de unidades por (Producto, Fecha)."""
+    if diario.empty:
+        return pd.DataFrame({'media': pd.Series(dtype=float), 'desviacion': pd.Series(dtype=float)})
+    por_producto = diario.groupby(level='Producto', observed=True)
+    media = por_producto.sum() / VENTANA_DIAS
+    # Varianza poblacional con los días sin despachos como ceros
+    cuadrados = (diario ** 2).groupby(level='Producto', observed=True).sum() / VENTANA_DIAS
+    desviacion = np.sqrt((cuadrados - media ** 2).clip(lower=0))
+    return pd.DataFrame({'media': media, 'desviacion': desviacion})
+
+class Reposicion:
+    def __init__(self):
+        self.dia = None
+        self.filas = 0
+        self.huella = ''
+        self.archivado = pd.Series(dtype=float)
+        self.consumo = _estadisticas(pd.Series(dtype=float))
+        self._cerrojo = threading.Lock()
+
+    def _ventana(self):
+        inicio = self.dia - pd.Timedelta(days=VENTANA_DIAS - 1)
+        return inicio, self.dia + pd.Timedelta(days=1)
+
+    def _diario(self, productos=None):
+        """Unidades despachadas por (Producto, Fecha) dentro de la ventana."""
+        inicio, fin = self._ventana()
+        por_dia = acumulados().despachos
+        por_dia = por_dia.iloc[slice(*por_dia['Fecha'].searchsorted([inicio, fin]))]
+        if productos is not None:
+            por_dia = por_dia[por_dia['Producto'].isin(productos)]
+        diario = por_dia.groupby(['Producto', 'Fecha'], observed=True)['Unidades'].sum()
+        archivado = self.archivado
+        if productos is not None and not archivado.empty:
+            archivado = archivado[archivado.index.get_level_values('Producto').isin(productos)]
+        if archivado.empty:
+            return diario
+        return pd.concat([archivado, diario]).groupby(level=['Producto', 'Fecha'], observed=True).sum()
+
+    def _leer_archivado(self):
+        """Despachos diarios de la parte de la ventana que ya está en el histórico."""
+        inicio, _ = self._ventana()
+        corte = inicio_almacen()
+        if corte is None or inicio >= corte:
+            return pd.Series(dtype=float)
+        archivados = historico_activo().consultar(
+            inicio, corte - pd.Timedelta(days=1), tipo='Despacho', columnas=['Fecha', 'Producto', 'Cantidad']
+        )
+        if archivados.empty:
+            return pd.Series(dtype=float)
+        archivados = archivados.assign(Fecha=pd.to_datetime(archivados['Fecha']))
+        return archivados.groupby(['Producto', 'Fecha'])['Cantidad'].sum().rename('Unidades')
+
+    def actualizar(self, despachos_df, hoy=None):
+        """Estadísticas de consumo de la ventana que termina en ``hoy`` (por defecto, la fecha actual)."""
+        with self._cerrojo:
+            hoy = pd.Timestamp(hoy if hoy is not None else pd.Timestamp.today()).normalize()
+            filas = self.filas
+            vigente = (
+                self.dia == hoy and filas <= len(despachos_df) and self.huella == huella_filas(despachos_df, filas)
+            )
+            if not vigente:
+                self.dia = hoy
+                self.archivado = self._leer_archivado()
+                self.consumo = _estadisticas(self._diario())
+            elif filas < len(despachos_df):
+                # Solo los productos con despachos nuevos
+                tocados = despachos_df['Producto'].iloc[filas:].dropna().unique().astype(object)
+                nuevos = _estadisticas(self._diario(tocados))
+                consumo = self.consumo.drop(index=tocados, errors='ignore')
+                self.consumo = pd.concat([consumo, nuevos]) if not consumo.empty else nuevos
+            self.filas = len(despachos_df)
+            self.huella = huella_filas(despachos_df, self.filas)
+            return self.consumo
+
+    def sugerencias(self, productos_df, consumo):
+        """Tabla de reposición de todos los productos (operaciones vectorizadas sobre el catálogo)."""
+        consumo = consumo.reindex(productos_df['Producto']).fillna(0)
+        media = consumo['media'].to_numpy()
+        stock = pd.to_numeric(productos_df['Stock Actual'], errors='coerce').fillna(0).to_numpy(dtype=float)
+        minimo = pd.to_numeric(productos_df['Stock Minimo'], errors='coerce').fillna(0).to_numpy(dtype=float)
+
+        seguridad = Z_SERVICIO * consumo['desviacion'].to_numpy() * np.sqrt(PLAZO_ENTREGA_DIAS)
+        reorden = np.maximum(np.ceil(media * PLAZO_ENTREGA_DIAS + seguridad), minimo)
+        objetivo = np.maximum(media * (PLAZO_ENTREGA_DIAS + DIAS_REVISION) + seguridad, reorden)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cobertura = np.where(media > 0, np.maximum(stock, 0) / media, np.inf)
+
+        reponer = stock <= reorden
+        return pd.DataFrame({
+            'Producto': productos_df['Producto'].to_numpy(),
+            'Stock Actual': productos_df['Stock Actual'].to_numpy(),
+            'Consumo Diario': np.round(media, 2),
+            'Días de Cobertura': np.round(cobertura, 1),
+            'Punto de Reorden': reorden.astype('int64'),
+            'Cantidad Sugerida': np.where(reponer, np.ceil(np.maximum(objetivo - stock, 0)), 0).astype('int64'),
+            'Reponer': reponer,
+        }, index=productos_df.index)[COLUMNAS_REPOSICION]
+
+# Una por bodega, como los acumulados
+_reposiciones = {}
+
+def reposicion(hoy=None):
+    """Sugerencias de reposición por producto, calculadas una vez por versión de datos.
+
+    ``hoy`` fija el último día de la ventana de consumo (por defecto, la fecha actual).
+    """
+    bodega = bodegas.activa()
+    if bodega not in _reposiciones:
+        _reposiciones[bodega] = Reposicion()
+    estado = _reposiciones[bodega]
+
+    def calcular(productos_df, entradas_df, despachos_df):
+        return estado.sugerencias(productos_df, estado.actualizar(despachos_df, hoy))
+    clave = 'reposicion' if hoy is None else f"reposicion_{pd.Timestamp(hoy):%Y-%m-%d}"
+    return cache_derivado(clave, calcular)
@@ -0,0 +1,142 @@
+import threading
+import pandas as pd
+import bodegas
+from almacenamiento import cache_derivado
+from existencias import huella_filas
+from pedidos_despachados import clave_pedido
+
+# ================================================
+# RESÚMENES PREAGREGADOS
+# ================================================
+#
+# Los despachos se acumulan por día × cliente × producto (unidades y líneas)
+# junto con los pares distintos (día, cliente, pedido), que permiten contar
+# pedidos distintos de cualquier rango sin volver a las líneas. Como en la
+# vista de stock, al cambiar los datos solo se acumulan las filas nuevas; si
+# el historial se reescribió se recalcula desde cero. Un resumen por rango
+# combina las filas preagregadas del rango, no el historial completo.
+
+_COLUMNAS_DIA = ['Fecha', 'Cliente', 'Producto']
+
+class Acumulados:
+    def __init__(self):
+        self.filas = {'entradas': 0, 'despachos': 0}
+        self.huellas = {'entradas': '', 'despachos': ''}
+        # Ambas tablas se mantienen ordenadas por fecha
+        self.despachos = pd.DataFrame({
+            'Fecha': pd.Series(dtype='datetime64[ns]'), 'Cliente': pd.Series(dtype=object),
+            'Producto': pd.Series(dtype=object), 'Unidades': pd.Series(dtype='float64'),
+            'Líneas': pd.Series(dtype='int64'),
+        })
+        self.pedidos = pd.DataFrame({
+            'Fecha': pd.Series(dtype='datetime64[ns]'), 'Cliente': pd.Series(dtype=object),
+            'Pedido': pd.Series(dtype=object),
+        })
+        self.ultima_entrada = None
+        self._cerrojo = threading.Lock()
+
+    def _cola(self, nombre, df):
+        """Filas aún no acumuladas y si los acumulados previos siguen valiendo."""
+        filas = self.filas[nombre]
+        if filas <= len(df) and self.huellas[nombre] == huella_filas(df, filas):
+            return df.iloc[filas:], True
+        return df, False
+
+    @staticmethod
+    def _fusionar(acumulado, nuevo, combinar):
+        """Combina ``nuevo`` con el acumulado rehaciendo solo los días desde la fecha más antigua de ``nuevo``."""
+        if nuevo.empty:
+            return acumulado
+        corte = acumulado['Fecha'].searchsorted(nuevo['Fecha'].min())
+        reciente = combinar(pd.concat([acumulado.iloc[corte:], nuevo], ignore_index=True)) if corte < len(acumulado) else nuevo
+        if corte == 0:
+            return reciente
+        return pd.concat([acumulado.iloc[:corte], reciente], ignore_index=True)
+
+    def _acumular_despachos(self, cola, vigente):
+        cola = cola.assign(
+            Fecha=pd.to_datetime(cola['Fecha'], errors='coerce'),
+            Cantidad=pd.to_numeric(cola['Cantidad'], errors='coerce').fillna(0)
+        )
+        por_dia = cola.groupby(_COLUMNAS_DIA, observed=True).agg(Unidades=('Cantidad', 'sum'), Líneas=('Cantidad', 'size')).reset_index()
+        # Los acumulados guardan cliente y producto como texto: unirles filas
+        # nuevas con categorías distintas obligaría a rehacer el dtype cada vez
+        por_dia = por_dia.astype({'Cliente': object, 'Producto': object})
+        pedidos = pd.DataFrame({
+            'Fecha': cola['Fecha'],
+            'Cliente': cola['Cliente'].astype(object),
+            'Pedido': clave_pedido(cola['Número de Pedido'])
+        }).dropna().drop_duplicates().sort_values('Fecha', kind='stable', ignore_index=True)
+
+        if vigente:
+            por_dia = self._fusionar(
+                self.despachos, por_dia,
+                lambda df: df.groupby(_COLUMNAS_DIA, as_index=False)[['Unidades', 'Líneas']].sum()
+            )
+            pedidos = self._fusionar(
+                self.pedidos, pedidos,
+                lambda df: df.drop_duplicates().sort_values('Fecha', kind='stable', ignore_index=True)
+            )
+        self.despachos = por_dia
+        self.pedidos = pedidos
+
+    def _acumular_entradas(self, cola, vigente):
+        fechas = pd.to_datetime(cola['Fecha'], errors='coerce').dropna()
+        ultima = fechas.max().date() if not fechas.empty else None
+        if vigente and self.ultima_entrada is not None:
+            ultima = max(self.ultima_entrada, ultima) if ultima is not None else self.ultima_entrada
+        self.ultima_entrada = ultima
+
+    def actualizar(self, entradas_df, despachos_df):
+        with self._cerrojo:
+            cola, vigente = self._cola('despachos', despachos_df)
+            if not (vigente and cola.empty):
+                self._acumular_despachos(cola, vigente)
+            cola, vigente = self._cola('entradas', entradas_df)
+            if not (vigente and cola.empty):
+                self._acumular_entradas(cola, vigente)
+
+            self.filas = {'entradas': len(entradas_df), 'despachos': len(despachos_df)}
+            self.huellas = {'entradas': huella_filas(entradas_df, len(entradas_df)),
+                            'despachos': huella_filas(despachos_df, len(despachos_df))}
+        return self
+
+    def resumen_clientes(self, desde=None, hasta=None, clientes=None):
+        """Unidades y pedidos distintos por cliente entre desde y hasta (inclusive)."""
+        por_dia, pedidos = self.despachos, self.pedidos
+        if desde and hasta:
+            inicio, fin = pd.Timestamp(desde), pd.Timestamp(hasta) + pd.Timedelta(days=1)
+            por_dia = por_dia.iloc[slice(*por_dia['Fecha'].searchsorted([inicio, fin]))]
+            pedidos = pedidos.iloc[slice(*pedidos['Fecha'].searchsorted([inicio, fin]))]
+        if clientes is not None:
+            por_dia = por_dia[por_dia['Cliente'].isin(clientes)]
+            pedidos = pedidos[pedidos['Cliente'].isin(clientes)]
+
+        unidades = por_dia.groupby('Cliente')['Unidades'].sum()
+        if (unidades % 1 == 0).all():
+            unidades = unidades.astype('int64')
+        distintos = pedidos.drop_duplicates(['Cliente', 'Pedido']).groupby('Cliente').size()
+        return pd.DataFrame({
+            'Total Unidades': unidades,
+            'Total Pedidos': distintos.reindex(unidades.index, fill_value=0)
+        }).rename_axis('Cliente')
+
+# Uno por bodega: cada uno sigue las filas de sus propias tablas
+_acumulados = {}
+
+def acumulados():
+    """Acumulados al día con los datos (las filas nuevas se suman una vez por versión)."""
+    bodega = bodegas.activa()
+    if bodega not in _acumulados:
+        _acumulados[bodega] = Acumulados()
+    return cache_derivado('acumulados', lambda p, e, d: _acumulados[bodega].actualizar(e, d))
+
+def totales():
+    """Cifras de la barra lateral, calculadas una vez por versión de datos."""
+    def calcular(productos_df, entradas_df, despachos_df):
+        return {
+            'productos': len(productos_df),
+            'stock_total': productos_df['Stock Actual'].sum(),
+            'ultima_entrada': acumulados().ultima_entrada,
+        }
+    return cache_derivado('totales', calcular)